@@ -1,535 +1,1106 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory
-import requests
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory, stream_with_context
+import contextvars
+import copy
+import hashlib
+import io
 import json
+import logging
 import os
-import tempfile
-from werkzeug.utils import secure_filename
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
-# For PDF processing
-import pypdf
+from cache import CompressedDiskCache, DiskCache, MemoryCache, TieredCache, content_key
+from dedup import QuestionIndex, iter_question_texts
+from extractors import (
+    EXTRACTOR_VERSION,
+    PAGE_SEPARATOR,
+    extract_text_from_docx,
+    extract_text_from_pdf,
+    is_extraction_error
+)
+from job_queue import JobQueue, QueueFullError
+from json_stream import QuestionStreamParser, parse_sections
+from llm_backend import LLMBackend, build_endpoint_pool, load_backend_config, measure_usage
+from metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    DOCUMENT_STAGE_SECONDS,
+    GENERATION_STAGE_SECONDS,
+    HTTP_REQUEST_SECONDS,
+    HTTP_REQUESTS_IN_FLIGHT,
+    LLM_CALL_SECONDS,
+    LLM_CALLS_IN_FLIGHT,
+    LLM_ENDPOINT_HEALTHY,
+    LLM_ENDPOINT_OUTSTANDING,
+    LLM_FIRST_TOKEN_SECONDS,
+    REGISTRY as METRICS_REGISTRY
+)
+from prompt_templates import (
+    QUESTION_TEMPLATES,
+    bloom_level_label,
+    build_question_prompt,
+    measure_renders,
+    record_render,
+    render_combined_section,
+    render_question_prompt,
+    summary_preamble
+)
+from question_bank import QuestionBank, SetNotFoundError
+from question_schema import ERROR_MESSAGES, check_question, is_placeholder, validate_questions
+from structured_logging import configure_logging
 
-# For DOCX processing
-import docx
+# Leveled logs to stderr: LOG_LEVEL (DEBUG, INFO, WARNING...) and LOG_FORMAT (text or json)
+configure_logging(os.environ.get("LOG_LEVEL", "INFO"), os.environ.get("LOG_FORMAT", "text"))
+logger = logging.getLogger("exgen")
 
 app = Flask(__name__)
 
-# Configure upload folder
-UPLOAD_FOLDER = tempfile.gettempdir()
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Uploads are parsed straight from the request stream, which Werkzeug keeps in
+# memory or spools to a private temporary file for larger bodies
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # Limit uploads to 16MB
 
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'docx'}
 
-API_URL = "https://ollama-y2elcua3ga-uc.a.run.app/api/generate"
-HEADERS = {"Content-Type": "application/json"}
+# How long Ollama keeps the model loaded after a call ("30m", "-1" for always); unset uses the server default
+LLM_KEEP_ALIVE = os.environ.get("LLM_KEEP_ALIVE") or None
+if LLM_KEEP_ALIVE is not None and LLM_KEEP_ALIVE.lstrip("-").isdigit():
+    LLM_KEEP_ALIVE = int(LLM_KEEP_ALIVE)
+
+# Endpoints, balancing and per-task models come from LLM_CONFIG (YAML/JSON) or the LLM_* variables
+backend_config = load_backend_config()
+
+# Shared pooled backend for every LLM call; each endpoint's pool should cover both worker pools below
+llm_backend = LLMBackend(
+    build_endpoint_pool(
+        backend_config,
+        failure_threshold=int(os.environ.get("LLM_BREAKER_THRESHOLD", 5)),
+        reset_timeout=float(os.environ.get("LLM_BREAKER_RESET", 30))
+    ),
+    backend_config["models"],
+    {"Content-Type": "application/json"},
+    pool_size=int(os.environ.get("LLM_POOL_SIZE", 10)),
+    connect_timeout=float(os.environ.get("LLM_CONNECT_TIMEOUT", 5)),
+    read_timeout=float(os.environ.get("LLM_READ_TIMEOUT", 120)),
+    max_retries=int(os.environ.get("LLM_MAX_RETRIES", 3)),
+    keep_alive=LLM_KEEP_ALIVE
+)
+
+# Opt-in reuse of Ollama's context tokens: each summary is evaluated once and
+# question prompts continue from it, sending only their own instructions
+PROMPT_CONTEXT_REUSE = os.environ.get("PROMPT_CONTEXT_REUSE", "").lower() in ("1", "true", "yes")
+prompt_contexts = MemoryCache(max_entries=int(os.environ.get("PROMPT_CONTEXT_MAX_ENTRIES", 64)))
+prompt_context_locks = {}
+prompt_context_locks_guard = threading.Lock()
+
+# Concurrency cap and per-spec timeout (seconds) for exam generation
+MAX_GENERATION_WORKERS = int(os.environ.get("MAX_GENERATION_WORKERS", 4))
+GENERATION_TIMEOUT = float(os.environ.get("GENERATION_TIMEOUT", 180))
+
+# Shared across requests so a timed-out spec never blocks the request that gave up on it
+generation_executor = ThreadPoolExecutor(max_workers=MAX_GENERATION_WORKERS, thread_name_prefix="exam-gen")
+
+# Monotonic deadline of the spec running in this context; LLM calls stop once it passes
+_generation_deadline = contextvars.ContextVar("generation_deadline", default=None)
+
+class GenerationTimeout(Exception):
+    """Raised inside a spec's worker once the spec has run past its timeout"""
+
+@contextmanager
+def generation_deadline(timeout):
+    """Stop LLM calls made in this context once timeout seconds have passed, so a timed-out spec frees its worker"""
+    token = _generation_deadline.set(time.monotonic() + timeout)
+    try:
+        yield
+    finally:
+        _generation_deadline.reset(token)
+
+def check_generation_deadline():
+    """Raise GenerationTimeout when the running spec has passed its deadline"""
+    deadline = _generation_deadline.get()
+    if deadline is not None and time.monotonic() > deadline:
+        raise GenerationTimeout("Generation ran past its timeout")
+
+# Extra LLM calls allowed per spec to replace missing or invalid questions
+REPAIR_MAX_ATTEMPTS = int(os.environ.get("REPAIR_MAX_ATTEMPTS", 2))
+
+# Estimated text similarity (0-1) at which a question counts as a near duplicate; 0 keeps exact matching only
+DEDUP_SIMILARITY = float(os.environ.get("DEDUP_SIMILARITY", 0.7))
+
+# Pack an exam's specs into one prompt by default instead of one call per spec
+COMBINED_GENERATION = os.environ.get("COMBINED_GENERATION", "").lower() in ("1", "true", "yes")
+
+# Serve exam specs from the question bank first and generate only the shortfall by default
+BANK_FIRST_GENERATION = os.environ.get("BANK_FIRST_GENERATION", "").lower() in ("1", "true", "yes")
+
+# Map-reduce summarization: chunk size in estimated tokens, parallel chunk
+# summaries, and how many partial summaries each merge step combines
+SUMMARY_CHUNK_TOKENS = int(os.environ.get("SUMMARY_CHUNK_TOKENS", 2000))
+SUMMARY_MAX_WORKERS = int(os.environ.get("SUMMARY_MAX_WORKERS", 4))
+# Merging fewer than two partials at a time never shrinks the list, so the reduce loop would not end
+SUMMARY_MERGE_FANIN = max(2, int(os.environ.get("SUMMARY_MERGE_FANIN", 4)))
+summary_executor = ThreadPoolExecutor(max_workers=SUMMARY_MAX_WORKERS, thread_name_prefix="summarize")
+
+# Page-parallel PDF extraction: worker processes (0 or 1 extracts serially)
+# and the page count below which a file is not worth splitting
+PDF_EXTRACT_WORKERS = int(os.environ.get("PDF_EXTRACT_WORKERS", 0))
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", 50))
+
+# Local directory for persistent caches
+CACHE_DIR = os.environ.get("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+
+# Summaries keyed by a hash of the extracted text and model, so re-uploads skip the LLM
+summary_cache = DiskCache(
+    os.path.join(CACHE_DIR, "summaries.sqlite3"),
+    max_entries=int(os.environ.get("SUMMARY_CACHE_MAX_ENTRIES", 1000)),
+    ttl=float(os.environ.get("SUMMARY_CACHE_TTL", 7 * 24 * 3600))
+)
+
+# Extracted PDF and DOCX text keyed by a hash of the uploaded bytes, stored
+# compressed (gzip, or zstd with the zstandard package) and evicted by total size
+EXTRACTION_CACHE_ENABLED = os.environ.get("EXTRACTION_CACHE_ENABLED", "1").lower() in ("1", "true", "yes")
+extraction_cache = None
+if EXTRACTION_CACHE_ENABLED:
+    extraction_cache = CompressedDiskCache(
+        os.path.join(CACHE_DIR, "extractions.sqlite3"),
+        max_bytes=int(os.environ.get("EXTRACTION_CACHE_MAX_BYTES", 256 * 1024 * 1024)),
+        codec=os.environ.get("EXTRACTION_CACHE_CODEC", "gzip")
+    )
+
+# Opt-in cache of generated question sets, keyed on the normalized prompt inputs
+GENERATION_CACHE_ENABLED = os.environ.get("GENERATION_CACHE_ENABLED", "").lower() in ("1", "true", "yes")
+GENERATION_CACHE_DISK = os.environ.get("GENERATION_CACHE_DISK", "").lower() in ("1", "true", "yes")
+
+generation_cache = None
+if GENERATION_CACHE_ENABLED:
+    # The disk tier is optional on top of the in-memory LRU
+    generation_disk_cache = None
+    if GENERATION_CACHE_DISK:
+        generation_disk_cache = DiskCache(
+            os.path.join(CACHE_DIR, "generations.sqlite3"),
+            max_entries=int(os.environ.get("GENERATION_CACHE_DISK_MAX_ENTRIES", 5000)),
+            ttl=float(os.environ.get("GENERATION_CACHE_TTL", 24 * 3600))
+        )
+    generation_cache = TieredCache(
+        MemoryCache(max_entries=int(os.environ.get("GENERATION_CACHE_MAX_ENTRIES", 256))),
+        generation_disk_cache
+    )
+
+# Saved questions, kept outside CACHE_DIR because they are user data rather than a cache
+DATA_DIR = os.environ.get("DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+question_bank = QuestionBank(os.environ.get("QUESTION_BANK_PATH", os.path.join(DATA_DIR, "question_bank.sqlite3")))
 
 def allowed_file(filename):
     """Check if the file has an allowed extension"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def extract_text_from_pdf(file_path):
-    """Extract text from PDF file"""
-    text = ""
-    try:
-        pdf_reader = pypdf.PdfReader(file_path)
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-            print(page.extract_text())
-    except Exception as e:
-        text = f"Error extracting text from PDF: {str(e)}"
-    return text
+def observed_stream(payload, task, question_type="", bloom_level=""):
+    """Yield the backend's chunks for payload, recording time to first chunk, total time and calls in flight"""
+    labels = {"task": task, "question_type": question_type, "bloom_level": bloom_level_label(bloom_level)}
+    check_generation_deadline()
+    started = time.perf_counter()
+    first = True
+    with LLM_CALLS_IN_FLIGHT.track(task=task):
+        for chunk in llm_backend.stream(payload):
+            if first:
+                LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started, **labels)
+                first = False
+            # Checked between chunks, which closes the backend stream of a spec that timed out
+            check_generation_deadline()
+            yield chunk
+    LLM_CALL_SECONDS.observe(time.perf_counter() - started, **labels)
 
-def extract_text_from_docx(file_path):
-    """Extract text from DOCX file"""
-    text = ""
-    try:
-        doc = docx.Document(file_path)
-        for para in doc.paragraphs:
-            text += para.text + "\n"
-            print(para.text)
-    except Exception as e:
-        text = f"Error extracting text from DOCX: {str(e)}"
-    return text
+def observed_complete(payload, task):
+    """Run a generate payload through observed_stream and return the full generated text"""
+    return "".join(chunk.get("response", "") for chunk in observed_stream(payload, task))
+
+def request_summary(prompt):
+    """Send a summarization prompt to the LLM API and return the streamed text"""
+    return observed_complete({"model": llm_backend.model_for("summarize"), "prompt": prompt}, "summarize").strip()
+
+def estimate_tokens(text):
+    """Roughly estimate the token count of text (about 4 characters per token)"""
+    return len(text) // 4 + 1
+
+def iter_page_chunks(pages, max_tokens):
+    """Yield chunks of at most max_tokens from a list of page texts"""
+    max_chars = max_tokens * 4
+    current = []
+    current_len = 0
+
+    for page in pages:
+        # Break into the largest natural units that fit: paragraphs, then lines
+        for paragraph in page.split("\n\n"):
+            if len(paragraph) <= max_chars:
+                pieces = [paragraph]
+            else:
+                pieces = []
+                for line in paragraph.split("\n"):
+                    # Hard-wrap anything still too long on word boundaries
+                    while len(line) > max_chars:
+                        cut = line.rfind(" ", 0, max_chars)
+                        if cut <= 0:
+                            cut = max_chars
+                        pieces.append(line[:cut])
+                        line = line[cut:].lstrip()
+                    pieces.append(line)
+
+            # Greedily pack consecutive pieces into chunks under the budget
+            for piece in pieces:
+                if not piece.strip():
+                    continue
+                if current and current_len + len(piece) + 1 > max_chars:
+                    yield "\n".join(current)
+                    current = []
+                    current_len = 0
+                current.append(piece)
+                current_len += len(piece) + 1
+
+    if current:
+        yield "\n".join(current)
+
+def in_request_context(fn):
+    """Wrap fn to run each call in a copy of the caller's context, so per-request accounting follows it into pool threads"""
+    context = contextvars.copy_context()
+    # A context can only be entered by one thread at a time, so every call gets its own copy
+    return lambda *args: context.copy().run(fn, *args)
+
+def split_text_into_chunks(text, max_tokens):
+    """Split text on page and paragraph boundaries into chunks of at most max_tokens"""
+    return list(iter_page_chunks(text.split(PAGE_SEPARATOR), max_tokens))
+
+def summarize_chunk(chunk):
+    """Summarize one section of a larger document"""
+    return request_summary(f"""
+Summarize the following section of a larger document clearly and concisely, keeping its key facts, terms and concepts:
+
+{chunk}
+""")
+
+def merge_summaries(summaries):
+    """Merge partial summaries of consecutive sections into one"""
+    joined = "\n\n".join(summaries)
+    return request_summary(f"""
+Combine the following partial summaries of consecutive sections of one document into a single summary, keeping the key facts, terms and concepts and removing repetition:
+
+{joined}
+""")
 
 def summarize_text_with_model(text):
-    """Summarize text using the LLM API"""
-    prompt = f"""
+    """Summarize text using the LLM API, map-reducing over chunks for large documents"""
+    if estimate_tokens(text) > SUMMARY_CHUNK_TOKENS:
+        # Map: summarize each chunk in parallel
+        chunks = split_text_into_chunks(text, SUMMARY_CHUNK_TOKENS)
+        partials = list(summary_executor.map(in_request_context(summarize_chunk), chunks))
+
+        # Reduce: merge the partial summaries a few at a time until they fit in one final prompt
+        while len(partials) > SUMMARY_MERGE_FANIN:
+            groups = [partials[i:i + SUMMARY_MERGE_FANIN] for i in range(0, len(partials), SUMMARY_MERGE_FANIN)]
+            partials = list(summary_executor.map(in_request_context(merge_summaries), groups))
+        text = "\n\n".join(partials)
+
+    return request_summary(f"""
 Summarize the following content clearly and concisely in 3-5 sentences:
 
 {text}
+""")
+
+
+# Fields returned alongside the error message when a question type's response cannot be used
+ERROR_PLACEHOLDERS = {
+    "multiple_choice": {"options": ["A. Error", "B. Error", "C. Error", "D. Error"], "answer": "A", "explanation": "API error", "bloom_justification": "N/A"},
+    "true_or_false": {"answer": "True", "explanation": "API error", "bloom_justification": "N/A"},
+    "identification": {"answer": "Error", "explanation": "API error", "bloom_justification": "N/A"},
+    "open_ended": {"answer": "Error", "key_points": ["API error"], "bloom_justification": "N/A", "grading_criteria": "N/A"}
+}
+
+def error_placeholder(q_type, parse_failed):
+    """Return the placeholder set for a spec that produced no usable questions"""
+    # Objects that started but never parsed mean the model returned broken JSON
+    message = ERROR_MESSAGES[0] if parse_failed else ERROR_MESSAGES[1]
+    return [{"question": message, **ERROR_PLACEHOLDERS[q_type]}]
+
+def summary_context(preamble):
+    """Return the backend's context tokens for preamble, evaluating it at most once per cache lifetime"""
+    cache_key = content_key(preamble, llm_backend.model_for("questions"))
+    context = prompt_contexts.get(cache_key)
+    if context is not None:
+        return context
+
+    # Specs fanned out for the same summary wait for a single encoding call
+    with prompt_context_locks_guard:
+        lock = prompt_context_locks.setdefault(cache_key, threading.Lock())
+    with lock:
+        context = prompt_contexts.get(cache_key)
+        if context is None:
+            try:
+                context = llm_backend.encode_context(llm_backend.model_for("questions"), preamble)
+                prompt_contexts.set(cache_key, context)
+            except Exception:
+                # Fall back to full prompts; a later call will try again
+                logger.warning("summary context encoding failed", exc_info=True)
+                context = []
+    with prompt_context_locks_guard:
+        prompt_context_locks.pop(cache_key, None)
+    return context
+
+def split_summary_prompt(prompt, summary):
+    """Return (shared preamble, rest of the prompt), or (None, prompt) when context reuse does not apply"""
+    preamble = summary_preamble(summary) if PROMPT_CONTEXT_REUSE and summary is not None else None
+    if preamble is None or not prompt.startswith(preamble):
+        return None, prompt
+    return preamble, prompt[len(preamble):]
+
+def generate_payload(prompt, summary=None):
+    """Build the generate payload, continuing from the summary's cached context when reuse is on"""
+    preamble, rest = split_summary_prompt(prompt, summary)
+    context = summary_context(preamble) if preamble is not None else None
+    model = llm_backend.model_for("questions")
+    if context:
+        return {"model": model, "prompt": rest, "context": context}
+    return {"model": model, "prompt": prompt}
+
+def request_questions(prompt, on_question=None, summary=None, q_type="", bloom_level=""):
+    """Stream a question prompt through the incremental parser, reporting each question as it completes"""
+    parser = QuestionStreamParser()
+    questions = []
+    # Parsing and validation time is summed across chunks and recorded once per call
+    parse_seconds = 0.0
+    for chunk in observed_stream(generate_payload(prompt, summary), "questions", q_type, bloom_level):
+        started = time.perf_counter()
+        for question in parser.feed(chunk.get("response", "")):
+            questions.append(question)
+            if on_question is not None:
+                on_question(question)
+        parse_seconds += time.perf_counter() - started
+    GENERATION_STAGE_SECONDS.observe(
+        parse_seconds, stage="parse_validate", question_type=q_type, bloom_level=bloom_level_label(bloom_level)
+    )
+    return questions, parser
+
+def build_repair_prompt(q_type, summary, wanted, difficulty, bloom_level, valid, problems):
+    """Build a prompt asking only for the questions still missing from a set"""
+    prompt = render_question_prompt(q_type, summary, wanted, difficulty, bloom_level)
+    existing = "\n".join(f"- {q['question']}" for q in valid) or "- (none yet)"
+    rejected = f"Earlier output was rejected because: {'; '.join(sorted(set(problems)))}.\n" if problems else ""
+    return prompt + f"""
+These questions have already been written, so do not repeat them:
+{existing}
+{rejected}Create exactly {wanted} new question(s) in the JSON format above.
 """
-    payload = {
-        "model": "llama3.2:3b",
-        "prompt": prompt
-    }
 
-    # Make the API request
-    response = requests.post(API_URL, headers=HEADERS, json=payload, stream=True)
-    response.raise_for_status()
-
-    # Collect the full response from the API
-    full_response = ""
-    for line in response.iter_lines(decode_unicode=True):
-        if line:
-            chunk = json.loads(line)
-            full_response += chunk.get("response", "")
-
-    return full_response.strip()
-
-
-def get_bloom_taxonomy_guidance(bloom_level):
-    """Return specific guidance for creating questions at different Bloom's taxonomy levels"""
-    bloom_guidance = {
-        "Remember": {
-            "description": "Focus on recalling facts, terms, basic concepts, or answers without necessarily understanding them.",
-            "verbs": ["define", "list", "memorize", "recall", "repeat", "identify", "name", "state", "label", "recognize"],
-            "example_stems": [
-                "What is the definition of...?",
-                "Who discovered...?",
-                "When did ___ happen?",
-                "List the main components of...",
-                "Identify the key features of..."
-            ]
-        },
-        "Understand": {
-            "description": "Focus on demonstrating understanding of facts and ideas by organizing, comparing, translating, interpreting, giving descriptions, and stating main ideas.",
-            "verbs": ["explain", "describe", "interpret", "summarize", "translate", "classify", "compare", "contrast", "paraphrase"],
-            "example_stems": [
-                "Explain the concept of...",
-                "Summarize the main points of...",
-                "How would you compare...?",
-                "What is the main idea of...?",
-                "Describe in your own words what..."
-            ]
-        },
-        "Apply": {
-            "description": "Focus on using acquired knowledge to solve problems in new situations by applying acquired knowledge, facts, techniques and rules.",
-            "verbs": ["apply", "use", "implement", "solve", "demonstrate", "compute", "calculate", "illustrate", "show"],
-            "example_stems": [
-                "How would you use ___ to solve...?",
-                "Calculate the result when...",
-                "Apply the concept of ___ to...",
-                "What would happen if...?",
-                "What examples can you find to...?"
-            ]
-        },
-        "Analyze": {
-            "description": "Focus on examining and breaking information into parts by identifying motives or causes; making inferences and finding evidence to support generalizations.",
-            "verbs": ["analyze", "differentiate", "distinguish", "examine", "categorize", "compare", "contrast", "investigate", "break down"],
-            "example_stems": [
-                "What are the parts or features of...?",
-                "How would you categorize...?",
-                "What evidence supports...?",
-                "What is the relationship between...?",
-                "Analyze why... occurred."
-            ]
-        },
-        "Evaluate": {
-            "description": "Focus on presenting and defending opinions by making judgments about information, validity of ideas, or quality of work based on a set of criteria.",
-            "verbs": ["evaluate", "judge", "critique", "justify", "defend", "recommend", "prioritize", "rate", "assess", "validate"],
-            "example_stems": [
-                "What is your opinion of...?",
-                "How would you evaluate the effectiveness of...?",
-                "Judge the value of... according to...",
-                "What criteria would you use to assess...?",
-                "How would you prioritize... based on...?"
-            ]
-        },
-        "Create": {
-            "description": "Focus on compiling information together in a different way by combining elements in a new pattern or proposing alternative solutions.",
-            "verbs": ["create", "design", "develop", "formulate", "construct", "imagine", "propose", "devise", "invent", "compose"],
-            "example_stems": [
-                "How would you design a new...?",
-                "What alternative would you propose for...?",
-                "Develop a plan to...",
-                "Create a new model that...",
-                "How would you compose a ___ that...?"
-            ]
-        }
-    }
-    
-    return bloom_guidance.get(bloom_level, bloom_guidance["Understand"])
-
-def get_difficulty_guidance(difficulty):
-    """Return specific guidance for creating questions at different difficulty levels"""
-    difficulty_guidance = {
-        "Easy": {
-            "description": "Focus on basic recall and simple comprehension. Use straightforward language and obvious connections.",
-            "characteristics": [
-                "Direct questions with clear answers",
-                "Focus on main concepts only",
-                "Minimal complexity",
-                "Obvious connections between concepts",
-                "Uses familiar examples"
-            ]
-        },
-        "Medium": {
-            "description": "Focus on deeper understanding and application. Requires some analysis but with clear parameters.",
-            "characteristics": [
-                "Requires understanding beyond simple recall",
-                "May involve multiple concepts",
-                "Moderate complexity",
-                "Some inference required",
-                "May need application to new situations"
-            ]
-        },
-        "Hard": {
-            "description": "Focus on complex analysis, synthesis, or evaluation. Requires deeper thinking and connections.",
-            "characteristics": [
-                "Requires synthesis of multiple concepts",
-                "High complexity",
-                "Significant critical thinking required",
-                "May involve ambiguity or nuance",
-                "Requires connections between disparate ideas"
-            ]
+def new_question_index(existing=None):
+    """Create the duplicate index for one exam, seeded with questions the caller already has"""
+    return QuestionIndex(iter_question_texts(existing), threshold=DEDUP_SIMILARITY)
+
+def request_existing_questions(data):
+    """Return the questions a generate request must not repeat: its 'existing' list and, with 'avoid_saved',
+    the saved-set questions for its source document"""
+    existing = list(iter_question_texts(data.get('existing')))
+    # Looked up by source document, so the cost follows one document's saved sets rather than the whole bank
+    if data.get('avoid_saved'):
+        existing.extend(question_bank.saved_question_texts(request_source_hash(data)))
+    return existing
+
+class QuestionCollector:
+    """Collect one spec's validated, de-duplicated questions across repair attempts"""
+
+    def __init__(self, q_type, quantity, seen=None, on_question=None):
+        self.q_type = q_type
+        self.quantity = int(quantity)
+        self.seen = seen
+        self.on_question = on_question
+        self.valid = []
+        self.duplicates = []
+        self.problems = []
+        self.parse_failed = False
+        self.attempts = 0
+        self._returned = 0
+
+    @property
+    def wanted(self):
+        """Return how many questions are still missing"""
+        return self.quantity - len(self.valid)
+
+    def prompt(self, summary, difficulty, bloom_level):
+        """Build the prompt for the next attempt, starting an attempt"""
+        wanted = self.wanted
+        if self.attempts == 0:
+            prompt = render_question_prompt(self.q_type, summary, wanted, difficulty, bloom_level)
+        else:
+            # Duplicates are listed too, so the model stops reproducing them
+            prompt = build_repair_prompt(
+                self.q_type, summary, wanted, difficulty, bloom_level,
+                self.valid + [{"question": text} for text in self.duplicates], self.problems
+            )
+        self.attempts += 1
+        self.problems = []
+        self._returned = 0
+        return prompt
+
+    def accept(self, question):
+        """Keep a streamed question if it validates, is new and is still needed, passing it on when kept"""
+        self._returned += 1
+        normalized, question_problems = check_question(self.q_type, question)
+        if question_problems:
+            self.problems.extend(question_problems)
+            return
+        if self.wanted <= 0:
+            return
+        if self.seen is not None and not self.seen.add_if_new(normalized["question"]):
+            self.duplicates.append(normalized["question"])
+            self.problems.append("some questions repeated existing ones")
+            return
+        self.valid.append(normalized)
+        if self.on_question is not None:
+            self.on_question(normalized)
+
+    def finish_attempt(self, parser):
+        """Record why an attempt fell short, for the next repair prompt"""
+        self.parse_failed = self.parse_failed or (parser.started and not self._returned)
+        if parser.malformed:
+            self.problems.append("some items were not valid JSON")
+        if self.wanted > 0 and not self.problems:
+            self.problems.append(f"only {self._returned} questions were returned")
+
+    def result(self):
+        """Return the collected questions, or the error placeholder when there are none"""
+        return self.valid or error_placeholder(self.q_type, self.parse_failed)
+
+def generate_validated_questions(q_type, summary, quantity, difficulty, bloom_level, on_question=None, seen=None):
+    """Generate questions and re-request only the missing, invalid or duplicate ones, within the repair budget"""
+    collector = QuestionCollector(q_type, quantity, seen, on_question)
+    for _ in range(REPAIR_MAX_ATTEMPTS + 1):
+        if collector.wanted <= 0:
+            break
+        prompt = collector.prompt(summary, difficulty, bloom_level)
+        _, parser = request_questions(prompt, collector.accept, summary, q_type, bloom_level)
+        collector.finish_attempt(parser)
+    return collector.result()
+
+def is_error_result(questions):
+    """Check whether a generator returned one of its error placeholders"""
+    return any(is_placeholder(q) for q in questions)
+
+def generation_cache_key(summary, q_type, bloom_level, difficulty, quantity):
+    """Build the generation cache key from the normalized prompt inputs"""
+    return content_key(
+        " ".join(summary.split()),
+        q_type,
+        bloom_level.strip(),
+        difficulty.strip(),
+        int(quantity),
+        llm_backend.model_for("questions")
+    )
+
+def lookup_cached_questions(summary, q_type, bloom_level, difficulty, quantity, use_cache=True):
+    """Return (cache key, cached questions or None) for a spec when the generation cache is enabled"""
+    if generation_cache is None:
+        return None, None
+    cache_key = generation_cache_key(summary, q_type, bloom_level, difficulty, quantity)
+    cached = generation_cache.get(cache_key) if use_cache else None
+    return cache_key, copy.deepcopy(cached) if cached is not None else None
+
+def store_cached_questions(cache_key, questions, quantity):
+    """Cache freshly generated questions; placeholders and short sets are never stored"""
+    if (cache_key is not None and isinstance(questions, list) and len(questions) >= int(quantity)
+            and not is_error_result(questions)):
+        generation_cache.set(cache_key, copy.deepcopy(questions))
+
+def generate_question_set(summary, question, use_cache=True, on_question=None, seen=None):
+    """Generate the questions for a single question specification"""
+    q_type = question['type'].lower()
+    bloom_level = question.get('bloom_level', 'Understand')
+    difficulty = question.get('difficulty', 'Medium')
+    quantity = question.get('quantity', 1)
+
+    # Serve identical specs from the generation cache when it is enabled
+    cache_key, cached = lookup_cached_questions(summary, q_type, bloom_level, difficulty, quantity, use_cache)
+    if cached is not None and (seen is None or seen.add_all_if_new(q.get("question", "") for q in cached)):
+        return {
+            "type": q_type,
+            "bloom_level": bloom_level,
+            "questions": cached
         }
+
+    # Every type runs through the same template-driven engine
+    if q_type in QUESTION_TEMPLATES:
+        questions = generate_validated_questions(q_type, summary, quantity, difficulty, bloom_level, on_question, seen)
+    else:
+        # Fallback for unknown question types
+        questions = [{"error": f"Unknown question type: {q_type}"}]
+
+    # Fresh results refresh the cache too
+    store_cached_questions(cache_key, questions, quantity)
+
+    return {
+        "type": q_type,
+        "bloom_level": bloom_level,
+        "questions": questions
     }
-    
-    return difficulty_guidance.get(difficulty, difficulty_guidance["Medium"])
 
-def generate_multiple_choice_questions(summary, quantity, difficulty, bloom_level):
-    """Generate multiple choice questions with options and answers"""
-    # Get specific guidance for this question type based on Bloom's level and difficulty
-    bloom_guidance = get_bloom_taxonomy_guidance(bloom_level)
-    difficulty_guidance = get_difficulty_guidance(difficulty)
-    
-    prompt = f"""
-As an expert educator, create {quantity} high-quality multiple-choice questions at the {bloom_level} level of Bloom's taxonomy with {difficulty} difficulty based on this summary:
-
-{summary}
-
-BLOOM'S TAXONOMY LEVEL: {bloom_level}
-{bloom_guidance["description"]}
-Appropriate verbs to use: {', '.join(bloom_guidance["verbs"][:5])}
-
-DIFFICULTY LEVEL: {difficulty}
-{difficulty_guidance["description"]}
-
-STRICT REQUIREMENTS FOR MULTIPLE CHOICE QUESTIONS:
-1. Each question MUST truly reflect the {bloom_level} cognitive level
-2. For higher cognitive levels, focus on application, comparison, evaluation rather than simple recall
-3. Create exactly 4 options per question labeled A, B, C, D
-4. ONLY ONE option should be correct
-5. All distractors (wrong options) must be plausible
-6. Avoid obvious wrong answers or silly distractors
-7. For '{difficulty}' difficulty, make options appropriately challenging
-8. The options should be distinct from one another (not overlapping)
-9. Provide a clear explanation for why the correct answer is right and others are wrong
-10. Include a clear justification explaining how the question meets the {bloom_level} level of Bloom's taxonomy
-
-Return JSON in this exact format:
-[
-  {{
-    "question": "The question text",
-    "options": ["A. First option", "B. Second option", "C. Third option", "D. Fourth option"],
-    "answer": "The letter of the correct option (A, B, C, or D)",
-    "explanation": "Explanation of why this answer is correct and others are wrong",
-    "bloom_justification": "Explanation of how this question aligns with the {bloom_level} level of Bloom's taxonomy"
-  }}
-]
-Only return valid JSON with NO additional explanations or text.
-"""
+def question_spec_fields(question):
+    """Return (type, Bloom's level, difficulty, quantity) for a question specification"""
+    return (
+        question['type'].lower(),
+        question.get('bloom_level', 'Understand'),
+        question.get('difficulty', 'Medium'),
+        int(question.get('quantity', 1))
+    )
 
-    response = requests.post(API_URL, headers=HEADERS, json={"model": "llama3.2:3b", "prompt": prompt}, stream=True)
-    response.raise_for_status()
-    
-    full_response = ""
-    for line in response.iter_lines(decode_unicode=True):
-        if line:
-            chunk = json.loads(line)
-            full_response += chunk.get("response", "")
-    
-    try:
-        questions = json.loads(full_response)
-        return questions
-    except json.JSONDecodeError:
-        # If there's an issue with parsing, try to extract just the JSON portion
-        import re
-        json_match = re.search(r'\[\s*{.*}\s*\]', full_response, re.DOTALL)
-        if json_match:
-            try:
-                questions = json.loads(json_match.group(0))
-                return questions
-            except:
-                return [{"question": "Error parsing response", "options": ["A. Error", "B. Error", "C. Error", "D. Error"], "answer": "A", "explanation": "API error", "bloom_justification": "N/A"}]
-        return [{"question": "Error generating questions", "options": ["A. Error", "B. Error", "C. Error", "D. Error"], "answer": "A", "explanation": "API error", "bloom_justification": "N/A"}]
-def generate_true_false_questions(summary, quantity, difficulty, bloom_level):
-    """Generate true/false questions with answers"""
-    # Get specific guidance for this question type based on Bloom's level and difficulty
-    bloom_guidance = get_bloom_taxonomy_guidance(bloom_level)
-    difficulty_guidance = get_difficulty_guidance(difficulty)
-    
-    prompt = f"""
-As an expert educator, create {quantity} high-quality true/false questions at the {bloom_level} level of Bloom's taxonomy with {difficulty} difficulty based on this summary:
-
-{summary}
-
-BLOOM'S TAXONOMY LEVEL: {bloom_level}
-{bloom_guidance["description"]}
-Appropriate verbs to use: {', '.join(bloom_guidance["verbs"][:5])}
-
-DIFFICULTY LEVEL: {difficulty}
-{difficulty_guidance["description"]}
-
-STRICT REQUIREMENTS FOR TRUE/FALSE QUESTIONS:
-1. Each question MUST truly reflect the {bloom_level} cognitive level
-2. Statements must be fully true or fully false, with no ambiguity
-3. Avoid absolutes like "always" or "never" unless truly appropriate
-4. For false statements, ensure they're plausibly false (not obviously wrong)
-5. For higher cognitive levels, focus on relationships, implications, or applications rather than simple facts
-6. Include nuanced statements that require proper understanding, not just memorization
-7. For '{difficulty}' difficulty, follow the difficulty guidance provided
-
-Return JSON in this exact format:
-[
-  {{
-    "question": "Statement that is either true or false",
-    "answer": "True or False",
-    "explanation": "Brief explanation of why this is true or false",
-    "bloom_justification": "Brief explanation of how this question meets the {bloom_level} level"
-  }}
-]
-Only return valid JSON with NO additional explanations or text.
-"""
+def select_combined_specs(summary, question_list, use_cache=True, seen=None):
+    """Return (sets served from the cache by index, [(index, question, cache key)] to pack into one prompt)"""
+    cached_sets = {}
+    packed = []
+    for index, question in enumerate(question_list):
+        q_type, bloom_level, difficulty, quantity = question_spec_fields(question)
+        # Unknown types are left to the per-type path, which reports them
+        if q_type not in QUESTION_TEMPLATES:
+            continue
+        cache_key, cached = lookup_cached_questions(summary, q_type, bloom_level, difficulty, quantity, use_cache)
+        if cached is not None and (seen is None or seen.add_all_if_new(q.get("question", "") for q in cached)):
+            cached_sets[index] = {"type": q_type, "bloom_level": bloom_level, "questions": cached}
+        else:
+            packed.append((index, question, cache_key))
+    return cached_sets, packed
 
-    response = requests.post(API_URL, headers=HEADERS, json={"model": "llama3.2:3b", "prompt": prompt}, stream=True)
-    response.raise_for_status()
-    
-    full_response = ""
-    for line in response.iter_lines(decode_unicode=True):
-        if line:
-            chunk = json.loads(line)
-            full_response += chunk.get("response", "")
-    
-    try:
-        questions = json.loads(full_response)
-        return questions
-    except json.JSONDecodeError:
-        # If there's an issue with parsing, try to extract just the JSON portion
-        import re
-        json_match = re.search(r'\[\s*{.*}\s*\]', full_response, re.DOTALL)
-        if json_match:
-            try:
-                questions = json.loads(json_match.group(0))
-                return questions
-            except:
-                return [{"question": "Error parsing response", "answer": "True", "explanation": "API error", "bloom_justification": "N/A"}]
-        return [{"question": "Error generating questions", "answer": "True", "explanation": "API error", "bloom_justification": "N/A"}]
-
-def generate_identification_questions(summary, quantity, difficulty, bloom_level):
-    """Generate identification/fill-in-the-blank questions with answers"""
-    # Get specific guidance for this question type based on Bloom's level and difficulty
-    bloom_guidance = get_bloom_taxonomy_guidance(bloom_level)
-    difficulty_guidance = get_difficulty_guidance(difficulty)
-    
-    prompt = f"""
-As an expert educator, create {quantity} high-quality identification/fill-in-the-blank questions at the {bloom_level} level of Bloom's taxonomy with {difficulty} difficulty based on this summary:
-
-{summary}
-
-BLOOM'S TAXONOMY LEVEL: {bloom_level}
-{bloom_guidance["description"]}
-Appropriate verbs to use: {', '.join(bloom_guidance["verbs"][:5])}
-
-DIFFICULTY LEVEL: {difficulty}
-{difficulty_guidance["description"]}
-
-STRICT REQUIREMENTS FOR IDENTIFICATION QUESTIONS:
-1. Each question MUST truly reflect the {bloom_level} cognitive level
-2. The blank or identification must be central to understanding the concept
-3. For "Remember" level: Focus on key terms, definitions, or specific facts
-4. For "Understand" level: Focus on explaining relationships or meanings
-5. For "Apply" level: Focus on using concepts in specific contexts
-6. For "Analyze" level: Focus on breaking down components or relationships
-7. For "Evaluate" level: Focus on making judgments based on criteria
-8. For "Create" level: Focus on generating new ideas or perspectives
-9. For '{difficulty}' difficulty, make questions progressively more complex as specified
-
-Return JSON in this exact format:
-[
-  {{
-    "question": "Question asking to identify a term, concept, or fill in a blank",
-    "answer": "The correct answer",
-    "explanation": "Brief explanation of why this answer is correct",
-    "bloom_justification": "Brief explanation of how this question meets the {bloom_level} level"
-  }}
-]
-Only return valid JSON with NO additional explanations or text.
-"""
+def build_combined_prompt(summary, packed):
+    """Build one prompt asking for every packed specification, each in its own JSON section"""
+    started = time.perf_counter()
+    sections = []
+    rules = []
+    for number, (_, question, _) in enumerate(packed, 1):
+        q_type, bloom_level, difficulty, quantity = question_spec_fields(question)
+        sections.append(render_combined_section(number, q_type, quantity, difficulty, bloom_level))
+        template = QUESTION_TEMPLATES[q_type]
+        rule = f"For {template['combined_name']} questions: {template['combined_rule']}"
+        if rule not in rules:
+            rules.append(rule)
 
-    response = requests.post(API_URL, headers=HEADERS, json={"model": "llama3.2:3b", "prompt": prompt}, stream=True)
-    response.raise_for_status()
-    
-    full_response = ""
-    for line in response.iter_lines(decode_unicode=True):
-        if line:
-            chunk = json.loads(line)
-            full_response += chunk.get("response", "")
-    
-    try:
-        questions = json.loads(full_response)
-        return questions
-    except json.JSONDecodeError:
-        # If there's an issue with parsing, try to extract just the JSON portion
-        import re
-        json_match = re.search(r'\[\s*{.*}\s*\]', full_response, re.DOTALL)
-        if json_match:
-            try:
-                questions = json.loads(json_match.group(0))
-                return questions
-            except:
-                return [{"question": "Error parsing response", "answer": "Error", "explanation": "API error", "bloom_justification": "N/A"}]
-        return [{"question": "Error generating questions", "answer": "Error", "explanation": "API error", "bloom_justification": "N/A"}]
-
-def generate_open_ended_questions(summary, quantity, difficulty, bloom_level):
-    """Generate open-ended questions with sample answers"""
-    # Get specific guidance for this question type based on Bloom's level and difficulty
-    bloom_guidance = get_bloom_taxonomy_guidance(bloom_level)
-    difficulty_guidance = get_difficulty_guidance(difficulty)
-    
-    prompt = f"""
-As an expert educator, create {quantity} high-quality open-ended questions at the {bloom_level} level of Bloom's taxonomy with {difficulty} difficulty based on this summary:
-
-{summary}
-
-BLOOM'S TAXONOMY LEVEL: {bloom_level}
-{bloom_guidance["description"]}
-Appropriate verbs to use: {', '.join(bloom_guidance["verbs"][:5])}
-Example question stems: 
-- {bloom_guidance["example_stems"][0]}
-- {bloom_guidance["example_stems"][1]}
-
-DIFFICULTY LEVEL: {difficulty}
-{difficulty_guidance["description"]}
-
-STRICT REQUIREMENTS FOR OPEN-ENDED QUESTIONS:
-1. Each question MUST truly reflect the {bloom_level} cognitive level without exception
-2. For "Remember/Understand" levels: Questions should require explanation of concepts in own words
-3. For "Apply" level: Questions should ask students to apply concepts to new situations
-4. For "Analyze" level: Questions should require breaking down concepts or comparing elements
-5. For "Evaluate" level: Questions should require making judgments based on criteria
-6. For "Create" level: Questions should require generating new ideas, plans, or perspectives
-7. Include challenging prompts appropriate for '{difficulty}' difficulty
-8. Use the verbs and stems provided as guidance for the appropriate cognitive level
-9. The sample answer should demonstrate the depth expected at this cognitive level
-10. Key points must be concrete, assessable elements that would be in a quality answer
-
-Return JSON in this exact format:
-[
-  {{
-    "question": "Open-ended question that requires a detailed response",
-    "answer": "Sample or model answer that demonstrates expected depth and quality",
-    "key_points": ["Key point 1 that must be included in a quality answer", "Key point 2", "Key point 3"],
-    "bloom_justification": "Brief explanation of how this question meets the {bloom_level} level",
-    "grading_criteria": "Brief guidance on how to evaluate student responses"
-  }}
-]
+    section_text = "\n".join(sections)
+    requirements = "\n".join(f"{number}. {rule}" for number, rule in enumerate(rules, 3))
+    keys = ",\n".join(f'  "section_{number}": [ ... ]' for number in range(1, len(packed) + 1))
+    prompt = summary_preamble(summary) + f"""
+Create several sets of high-quality questions based on the summary above.
+Write each set in its own section, following that section's requirements:
+
+{section_text}
+STRICT REQUIREMENTS:
+1. Each question MUST truly reflect its section's Bloom's taxonomy level and difficulty
+2. Each section MUST contain exactly the number of questions it asks for
+{requirements}
+
+Return one JSON object with one key per section, in this exact format:
+{{
+{keys}
+}}
 Only return valid JSON with NO additional explanations or text.
 """
+    record_render(started, "combined")
 
-    response = requests.post(API_URL, headers=HEADERS, json={"model": "llama3.2:3b", "prompt": prompt}, stream=True)
-    response.raise_for_status()
-    
-    full_response = ""
-    for line in response.iter_lines(decode_unicode=True):
-        if line:
-            chunk = json.loads(line)
-            full_response += chunk.get("response", "")
-    
+    return prompt
+
+def split_combined_response(text, packed, seen=None):
+    """Validate and de-duplicate each section of a combined response,
+    returning (sets by index, indexes to regenerate per type)"""
+    sections = parse_sections(text)
+    accepted = {}
+    fallback = []
+    for number, (index, question, cache_key) in enumerate(packed, 1):
+        q_type, bloom_level, difficulty, quantity = question_spec_fields(question)
+        items = sections.get(f"section_{number}")
+        valid, _ = validate_questions(q_type, items if isinstance(items, list) else [])
+        if seen is not None:
+            # Only index a section's questions once the whole section is kept
+            batch = QuestionIndex(threshold=seen.threshold)
+            valid = [q for q in valid if not seen.contains(q["question"]) and batch.add_if_new(q["question"])]
+        if len(valid) < quantity or (seen is not None and not seen.add_all_if_new(q["question"] for q in valid[:quantity])):
+            fallback.append(index)
+            continue
+        store_cached_questions(cache_key, valid[:quantity], quantity)
+        accepted[index] = {"type": q_type, "bloom_level": bloom_level, "questions": valid[:quantity]}
+    return accepted, fallback
+
+def combined_generation_stats(summary, packed, prompt, fallback):
+    """Compare a combined call plus its fallbacks with one call per spec"""
+    # Prefill is estimated from prompt length, the same way chunk sizes are; these prompts are never sent,
+    # so they are built without counting as renders
+    prompt_tokens = {}
+    for index, question, _ in packed:
+        q_type, bloom_level, difficulty, quantity = question_spec_fields(question)
+        prompt_tokens[index] = estimate_tokens(build_question_prompt(q_type, summary, quantity, difficulty, bloom_level))
+    return {
+        "specs_combined": len(packed),
+        "fallbacks": len(fallback),
+        "round_trips_saved": len(packed) - 1 - len(fallback),
+        "prefill_tokens_saved": sum(prompt_tokens.values()) - estimate_tokens(prompt)
+            - sum(prompt_tokens[index] for index in fallback)
+    }
+
+def generate_combined_sets(summary, question_list, use_cache=True, stats=None, seen=None):
+    """Generate every packable spec with a single combined prompt, returning the usable sets by index
+
+    Specs whose section is missing or fails validation are left out so the
+    caller regenerates them with the per-type prompts.
+    """
+    cached_sets, packed = select_combined_specs(summary, question_list, use_cache, seen)
+    # A single spec gains nothing from the combined format
+    if len(packed) < 2:
+        return cached_sets
+
+    prompt = build_combined_prompt(summary, packed)
+    timeout = min(float(question.get('timeout', GENERATION_TIMEOUT)) for _, question, _ in packed)
+    running = threading.Event()
+
+    def run_combined():
+        running.set()
+        with generation_deadline(timeout):
+            return observed_complete(generate_payload(prompt, summary), "combined")
+
+    future = generation_executor.submit(in_request_context(run_combined))
     try:
-        questions = json.loads(full_response)
-        return questions
-    except json.JSONDecodeError:
-        # If there's an issue with parsing, try to extract just the JSON portion
-        import re
-        json_match = re.search(r'\[\s*{.*}\s*\]', full_response, re.DOTALL)
-        if json_match:
-            try:
-                questions = json.loads(json_match.group(0))
-                return questions
-            except:
-                return [{"question": "Error parsing response", "answer": "Error", "key_points": ["API error"], "bloom_justification": "N/A", "grading_criteria": "N/A"}]
-        return [{"question": "Error generating questions", "answer": "Error", "key_points": ["API error"], "bloom_justification": "N/A", "grading_criteria": "N/A"}]
-
-def exam_generate_questions(summary, question_list):
-    """Generate exam questions based on provided summary and question specifications"""
+        # The timeout counts from when the call starts, not while it waits for a worker
+        running.wait()
+        text = future.result(timeout=timeout)
+    except Exception:
+        # Timeouts and backend errors fall back to the per-type prompts
+        logger.warning("combined generation failed, falling back per type", exc_info=True)
+        future.cancel()
+        text = ""
+
+    started = time.perf_counter()
+    accepted, fallback = split_combined_response(text, packed, seen)
+    GENERATION_STAGE_SECONDS.observe(
+        time.perf_counter() - started, stage="parse_validate", question_type="combined", bloom_level=""
+    )
+    if fallback:
+        logger.info("combined sections regenerated per type", extra={"specs": len(packed), "fallbacks": len(fallback)})
+    if stats is not None:
+        stats.update(combined_generation_stats(summary, packed, prompt, fallback))
+    return {**cached_sets, **accepted}
+
+def timed_out_question_set(question, timeout):
+    """Build the placeholder set for a spec that ran past its timeout"""
+    q_type = question['type'].lower()
+    return {
+        "type": q_type,
+        "bloom_level": question.get('bloom_level', 'Understand'),
+        "questions": [{"error": f"Timed out generating {q_type} questions after {timeout:g}s"}]
+    }
+
+def iter_exam_events(summary, question_list, use_cache=True, seen=None):
+    """Yield ("question", index, question) as the model completes each question and
+    ("question_set", index, question set) as each specification finishes generating"""
+    events = queue.Queue()
+    # One index across every spec keeps the whole exam free of duplicates
+    seen = seen if seen is not None else new_question_index()
+
+    def run_spec(index, question, timeout):
+        # A spec's timeout starts when a worker picks it up, not while it waits in the shared queue
+        events.put(("started", index, time.monotonic() + timeout))
+        on_question = lambda q: events.put(("question", index, q))
+        with generation_deadline(timeout):
+            return generate_question_set(summary, question, use_cache, on_question, seen)
+
+    # Fan the specs out over the shared pool so the sections run concurrently
+    pending = {}
+    deadlines = {}
+    for index, question in enumerate(question_list):
+        timeout = float(question.get('timeout', GENERATION_TIMEOUT))
+        # Each worker runs in a copy of this context so per-request metrics follow it
+        future = generation_executor.submit(contextvars.copy_context().run, run_spec, index, question, timeout)
+        future.add_done_callback(lambda f, index=index: events.put(("done", index, f)))
+        pending[index] = (question, timeout, future)
+
+    while pending:
+        waiting = [deadlines[index] for index in pending if index in deadlines]
+        try:
+            # Specs still queued have no deadline yet, so with none running this waits for the next event
+            wait = max(0.0, min(waiting) - time.monotonic()) if waiting else None
+            kind, index, value = events.get(timeout=wait)
+        except queue.Empty:
+            kind = None
+
+        # Late events from specs that already timed out are dropped
+        if kind == "started":
+            deadlines[index] = value
+        elif kind == "question" and index in pending:
+            yield "question", index, value
+        elif kind == "done" and index in pending:
+            question, timeout, _ = pending.pop(index)
+            if isinstance(value.exception(), GenerationTimeout):
+                yield "question_set", index, timed_out_question_set(question, timeout)
+            else:
+                yield "question_set", index, value.result()
+
+        # Give up on any spec that has run past its own timeout; its worker stops at its next LLM chunk
+        now = time.monotonic()
+        for index, (question, timeout, future) in list(pending.items()):
+            if index in deadlines and deadlines[index] <= now:
+                del pending[index]
+                logger.warning("question set timed out", extra={
+                    "question_type": question['type'].lower(), "timeout": timeout
+                })
+                yield "question_set", index, timed_out_question_set(question, timeout)
+
+def iter_exam_question_sets(summary, question_list, use_cache=True, seen=None):
+    """Yield (index, question set) pairs as each specification finishes generating"""
+    for kind, index, value in iter_exam_events(summary, question_list, use_cache, seen):
+        if kind == "question_set":
+            yield index, value
+
+def generate_exam_sets(summary, question_list, use_cache=True, combined=False, stats=None, seen=None):
+    """Generate every spec's question set, in the order of question_list"""
+    # Place each set in its slot so results line up with question_list
+    results = [None] * len(question_list)
+    if combined:
+        for index, question_set in generate_combined_sets(summary, question_list, use_cache, stats, seen).items():
+            results[index] = question_set
+
+    remaining = [index for index, question_set in enumerate(results) if question_set is None]
+    subset = [question_list[index] for index in remaining]
+    for position, question_set in iter_exam_question_sets(summary, subset, use_cache, seen):
+        results[remaining[position]] = question_set
+    return results
+
+def exam_generate_questions(summary, question_list, use_cache=True, combined=False, stats=None, existing=None,
+                            source_hash=None):
+    """Generate exam questions based on provided summary and question specifications
+
+    With combined=True the specs are first requested together in one prompt;
+    any that come back missing or invalid are generated per type. Savings
+    are written to stats when it is given. Questions that duplicate each
+    other or anything in existing are replaced with new ones. With a
+    source_hash, specs are filled from the question bank first and only the
+    shortfall is generated, batched into one combined prompt.
+    """
+    seen = new_question_index(existing)
+    stats = stats if stats is not None else {}
+    if source_hash is None:
+        return generate_exam_sets(summary, question_list, use_cache, combined, stats, seen)
+
+    banked, gaps = plan_exam(source_hash, question_list, seen, stats)
+    generated = generate_exam_sets(
+        summary, [gap for _, gap in gaps], use_cache, combined or len(gaps) > 1, stats, seen
+    )
+    for (index, _), question_set in zip(gaps, generated):
+        banked[index] = finish_planned_set(source_hash, question_list[index], banked[index], question_set, stats)
+    return banked
+
+def record_render_cost(stats, render_cost):
+    """Add a request's prompt render count and time to its stats"""
+    stats["prompt_renders"] = render_cost.renders
+    stats["prompt_render_ms"] = round(render_cost.seconds * 1000, 3)
+
+def record_usage(stats, usage):
+    """Add the request's LLM token counts and timings to its stats, when any call reported them"""
+    if usage.calls:
+        stats["usage"] = usage.as_dict()
+
+def generation_stats_headers(stats):
+    """Report combined-mode savings, bank usage, render cost and token usage as response headers,
+    leaving the body's shape unchanged"""
+    headers = {}
+    for name, value in stats.items():
+        # Nested stats become one header per field, e.g. X-Usage-Prompt-Tokens
+        fields = {f"{name}_{field}": item for field, item in value.items()} if isinstance(value, dict) else {name: value}
+        for field, item in fields.items():
+            headers[f"X-{field.replace('_', '-').title()}"] = str(item)
+    return headers
+
+def use_bank(data, use_cache=True):
+    """Return whether a generate request should be served from the question bank first"""
+    # Asking for fresh questions bypasses the bank as it does the cache
+    return use_cache and bool(data.get('bank', BANK_FIRST_GENERATION))
+
+def check_question_specs(question_list):
+    """Raise ValueError unless question_list is a list of specs with a type and a positive integer quantity"""
+    if not isinstance(question_list, list):
+        raise ValueError("'questions' must be a list")
+    for position, question in enumerate(question_list):
+        if not isinstance(question, dict) or not isinstance(question.get('type'), str):
+            raise ValueError(f"questions[{position}] must be an object with a 'type'")
+        for field in ('bloom_level', 'difficulty'):
+            if not isinstance(question.get(field, ''), str):
+                raise ValueError(f"questions[{position}].{field} must be a string")
+        quantity = question.get('quantity', 1)
+        if isinstance(quantity, bool) or not isinstance(quantity, (int, str)) or not str(quantity).isdigit() \
+                or int(quantity) < 1:
+            raise ValueError(f"questions[{position}].quantity must be a positive integer")
+
+def request_source_hash(data):
+    """Return the source document hash a request names, falling back to a hash of its summary"""
+    return data.get('source_hash') or content_key(data.get('summary', ''))
+
+def assemble_from_bank(source_hash, question_list, exclude_ids=(), seen=None):
+    """Fill each spec from stored questions for the source document
+
+    Returns the question sets, in the same order as question_list, and how
+    many questions each one is short of its quantity. Stored questions that
+    duplicate anything in seen are left out.
+    """
+    exclude_ids = set(exclude_ids)
     results = []
+    shortfalls = []
     for question in question_list:
-        q_type = question['type'].lower()
-        bloom_level = question.get('bloom_level', 'Understand')
-        difficulty = question.get('difficulty', 'Medium')
-        quantity = question.get('quantity', 1)
-        
-        # Use the appropriate question generation function based on type
-        if q_type == "multiple_choice":
-            questions = generate_multiple_choice_questions(summary, quantity, difficulty, bloom_level)
-        elif q_type == "true_or_false":
-            questions = generate_true_false_questions(summary, quantity, difficulty, bloom_level)
-        elif q_type == "identification":
-            questions = generate_identification_questions(summary, quantity, difficulty, bloom_level)
-        elif q_type == "open_ended":
-            questions = generate_open_ended_questions(summary, quantity, difficulty, bloom_level)
+        q_type, bloom_level, difficulty, quantity = question_spec_fields(question)
+        questions = question_bank.pick(source_hash, q_type, bloom_level, difficulty, quantity, exclude_ids)
+        # Never hand out the same stored question twice in one exam
+        exclude_ids.update(q["bank_id"] for q in questions)
+        if seen is not None:
+            questions = [q for q in questions if seen.add_if_new(q.get("question", ""))]
+        results.append({"type": q_type, "bloom_level": bloom_level, "questions": questions})
+        shortfalls.append(quantity - len(questions))
+    return results, shortfalls
+
+def plan_exam(source_hash, question_list, seen=None, stats=None):
+    """Satisfy what the bank can of each spec and list what is left to generate
+
+    Returns the banked question sets by position and [(index, spec)] for
+    every spec still short, with its quantity cut to the shortfall.
+    """
+    banked, shortfalls = assemble_from_bank(source_hash, question_list, seen=seen)
+    gaps = [
+        (index, {**question_list[index], "quantity": missing})
+        for index, missing in enumerate(shortfalls) if missing > 0
+    ]
+    if stats is not None:
+        stats["from_bank"] = sum(len(question_set["questions"]) for question_set in banked)
+        stats["generated"] = 0
+    return banked, gaps
+
+def finish_planned_set(source_hash, question, banked_set, generated_set, stats=None):
+    """Bank a spec's freshly generated questions and append them to its stored ones"""
+    q_type, bloom_level, difficulty, _ = question_spec_fields(question)
+    # Error placeholders and anything that fails validation are neither banked nor counted as generated
+    usable = [
+        q for q in generated_set["questions"]
+        if not is_placeholder(q) and not check_question(q_type, q)[1]
+    ]
+    if usable:
+        question_bank.save(source_hash, [{**generated_set, "questions": usable, "difficulty": difficulty}])
+    if stats is not None:
+        stats["generated"] = stats.get("generated", 0) + len(usable)
+    return {
+        "type": q_type,
+        "bloom_level": bloom_level,
+        "questions": banked_set["questions"] + generated_set["questions"]
+    }
+
+def iter_planned_exam_events(summary, question_list, use_cache=True, seen=None, source_hash=None, stats=None):
+    """iter_exam_events, serving what it can from the question bank first when given a source_hash"""
+    if source_hash is None:
+        yield from iter_exam_events(summary, question_list, use_cache, seen)
+        return
+
+    seen = seen if seen is not None else new_question_index()
+    banked, gaps = plan_exam(source_hash, question_list, seen, stats)
+    short = {index for index, _ in gaps}
+    for index, question_set in enumerate(banked):
+        if index not in short:
+            yield "question_set", index, question_set
         else:
-            # Fallback for unknown question types
-            questions = [{"error": f"Unknown question type: {q_type}"}]
-        
-        results.append({
-            "type": q_type,
-            "bloom_level": bloom_level,
-            "questions": questions
-        })
-    
+            # Stored questions of a partly banked spec show up while the rest generates
+            for question in question_set["questions"]:
+                yield "question", index, question
+
+    for kind, position, value in iter_exam_events(summary, [gap for _, gap in gaps], use_cache, seen):
+        index = gaps[position][0]
+        if kind == "question":
+            yield kind, index, value
+        else:
+            yield kind, index, finish_planned_set(source_hash, question_list[index], banked[index], value, stats)
+
+def run_exam_job(job):
+    """Generate the exam for a queued job, reporting each set as it finishes"""
+    summary = job.payload['summary']
+    question_list = job.payload['questions']
+    use_cache = not (job.payload.get('nocache') or job.payload.get('fresh'))
+    seen = new_question_index(request_existing_questions(job.payload))
+    source_hash = request_source_hash(job.payload) if use_bank(job.payload, use_cache) else None
+
+    results = [None] * len(question_list)
+    job.report(results, 0, len(question_list))
+    completed = 0
+    for kind, index, question_set in iter_planned_exam_events(summary, question_list, use_cache, seen, source_hash):
+        if kind == "question_set":
+            completed += 1
+            results[index] = question_set
+            job.report(results, completed, len(question_list))
     return results
 
+# Background jobs for exams too large to wait on; finished jobs expire from the store
+job_store = DiskCache(
+    os.path.join(CACHE_DIR, "jobs.sqlite3"),
+    max_entries=int(os.environ.get("JOB_STORE_MAX_ENTRIES", 1000)),
+    ttl=float(os.environ.get("JOB_RESULT_TTL", 24 * 3600))
+)
+exam_jobs = JobQueue(
+    run_exam_job,
+    job_store,
+    workers=int(os.environ.get("JOB_WORKERS", 2)),
+    max_pending=int(os.environ.get("JOB_MAX_PENDING", 100)),
+    max_priority=int(os.environ.get("JOB_MAX_PRIORITY", 2))
+)
+
+def metric_route():
+    """Return the route pattern a request matched, so metrics stay one series per route rather than per URL"""
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+@app.before_request
+def start_request_metrics():
+    """Count the request as in flight and note when it started"""
+    request.metrics_started = time.perf_counter()
+    HTTP_REQUESTS_IN_FLIGHT.inc(route=metric_route())
+
+@app.after_request
+def record_request_metrics(response):
+    """Record the request's duration once the server has sent its body, which for streams is long after this hook"""
+    started = getattr(request, "metrics_started", None)
+    if started is None:
+        return response
+    route = metric_route()
+    method = request.method
+    status = response.status_code
+
+    def finish():
+        HTTP_REQUESTS_IN_FLIGHT.dec(route=route)
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method=method, status=status)
+
+    response.call_on_close(finish)
+    return response
+
 @app.route('/')
 def home():
     """Serve the main page"""
     return render_template('index.html')
 
-@app.route("/summarize", methods=["POST"])
-def summarize_file():
-    """Route to summarize uploaded file (txt, pdf, or docx)"""
+def read_upload():
+    """Return (uploaded file, its extension, None), or (None, None, error response) when the upload is unusable"""
+    # Touching request.files parses the multipart body
+    started = time.perf_counter()
     if 'file' not in request.files:
-        return jsonify({"error": "No file uploaded."}), 400
+        return None, None, (jsonify({"error": "No file uploaded."}), 400)
 
     file = request.files['file']
-    
+    upload_seconds = time.perf_counter() - started
+
     if file.filename == '':
-        return jsonify({"error": "No file selected."}), 400
+        return None, None, (jsonify({"error": "No file selected."}), 400)
 
     if not allowed_file(file.filename):
-        return jsonify({"error": f"File type not supported. Please upload a txt, pdf, or docx file."}), 400
-    
-    try:
-        # Save the file temporarily
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-        
-        # Extract text based on file type
-        file_extension = filename.rsplit('.', 1)[1].lower()
+        return None, None, (jsonify({"error": f"File type not supported. Please upload a txt, pdf, or docx file."}), 400)
+
+    file_extension = file.filename.rsplit('.', 1)[1].lower()
+    DOCUMENT_STAGE_SECONDS.observe(upload_seconds, stage="upload_parse", file_type=file_extension)
+    return file, file_extension, None
+
+def upload_digest(stream):
+    """Hash an upload's bytes, leaving the stream rewound for the extractor"""
+    digest = hashlib.sha256()
+    for block in iter(lambda: stream.read(1024 * 1024), b""):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+def extract_upload_text(file, file_extension):
+    """Return (text, whether it came from the extraction cache) for an upload,
+    parsing PDF and DOCX files only when the same bytes have not been extracted before"""
+    with DOCUMENT_STAGE_SECONDS.time(stage="extract", file_type=file_extension):
+        # Decoding text is cheaper than a cache lookup
+        if file_extension == 'txt':
+            return io.TextIOWrapper(file.stream, encoding='utf-8').read(), False
+
+        cache_key = None
+        if extraction_cache is not None:
+            cache_key = content_key(upload_digest(file.stream), file_extension, EXTRACTOR_VERSION)
+            text = extraction_cache.get(cache_key)
+            if text is not None:
+                return text, True
+
+        # Extract text based on file type, reading the upload stream directly
         if file_extension == 'pdf':
-            text = extract_text_from_pdf(file_path)
-        elif file_extension == 'docx':
-            text = extract_text_from_docx(file_path)
-        else:  # txt files
-            with open(file_path, 'r', encoding='utf-8') as f:
-                text = f.read()
-        
-        # Clean up the temporary file
-        os.remove(file_path)
-        
+            text = extract_text_from_pdf(file.stream, PDF_EXTRACT_WORKERS, PDF_PARALLEL_MIN_PAGES)
+        else:
+            text = extract_text_from_docx(file.stream)
+
+        # Failed parses are retried on the next upload rather than remembered
+        if cache_key is not None and not is_extraction_error(text):
+            extraction_cache.set(cache_key, text)
+        return text, False
+
+@app.route("/summarize", methods=["POST"])
+def summarize_file():
+    """Route to summarize uploaded file (txt, pdf, or docx)"""
+    started = time.perf_counter()
+    file, file_extension, error = read_upload()
+    if error is not None:
+        return error
+
+    try:
+        text, extraction_cached = extract_upload_text(file, file_extension)
+
+        # An unreadable file must not be summarized (and cached) as if its error message were the document
+        if is_extraction_error(text):
+            return jsonify({"error": text}), 422
         if not text or len(text.strip()) < 10:
             return jsonify({"error": "Could not extract sufficient text from the file."}), 400
             
-        # Generate summary
-        summary = summarize_text_with_model(text)
-        return jsonify({"summary": summary, "fileType": file_extension})
+        # Reuse a previous summary of the same text when there is one
+        cache_key = content_key(text, llm_backend.model_for("summarize"))
+        summary = summary_cache.get(cache_key)
+        cached = summary is not None
+        usage = None
+        if not cached:
+            with DOCUMENT_STAGE_SECONDS.time(stage="summarize", file_type=file_extension), measure_usage() as usage:
+                summary = summarize_text_with_model(text)
+            summary_cache.set(cache_key, summary)
+        logger.info("summarized", extra={
+            "file_type": file_extension, "chars": len(text), "cached": cached,
+            "extraction_cached": extraction_cached, "seconds": round(time.perf_counter() - started, 3)
+        })
+        # The source hash keys the question bank, so saved questions follow the document
+        result = {
+            "summary": summary,
+            "fileType": file_extension,
+            "cached": cached,
+            "extractionCached": extraction_cached,
+            "sourceHash": content_key(text)
+        }
+        # Token counts and backend timings, when the backend reported them
+        if usage is not None and usage.calls:
+            result["usage"] = usage.as_dict()
+        return jsonify(result)
     
     except Exception as e:
+        logger.exception("summarize failed", extra={"file_type": file_extension})
         return jsonify({"error": f"Error processing file: {str(e)}"}), 500
 
+@app.route("/extract", methods=["POST"])
+def extract_file():
+    """Route to return an uploaded file's extracted text without summarizing it"""
+    file, file_extension, error = read_upload()
+    if error is not None:
+        return error
+
+    try:
+        text, cached = extract_upload_text(file, file_extension)
+    except Exception as e:
+        logger.exception("extract failed", extra={"file_type": file_extension})
+        return jsonify({"error": f"Error processing file: {str(e)}"}), 500
+
+    if is_extraction_error(text):
+        return jsonify({"error": text}), 422
+    return jsonify({
+        "text": text,
+        "fileType": file_extension,
+        "cached": cached,
+        "chars": len(text),
+        "sourceHash": content_key(text)
+    })
+
 @app.route("/generate", methods=["POST"])
 def generate_questions():
     """Route to generate questions based on summary"""
@@ -541,13 +1112,221 @@ def generate_questions():
 
     summary = data['summary']
     questions = data['questions']
+    # 'nocache' or 'fresh' forces new questions even when the cache has some
+    use_cache = not (data.get('nocache') or data.get('fresh'))
+    # 'combined' asks for every spec in one prompt, falling back per type
+    combined = bool(data.get('combined', COMBINED_GENERATION))
+    # 'bank' serves what it can from stored questions for the same source document
+    source_hash = request_source_hash(data) if use_bank(data, use_cache) else None
 
     try:
-        results = exam_generate_questions(summary, questions)
-        return jsonify(results)
+        stats = {}
+        with measure_renders() as render_cost, measure_usage() as usage:
+            results = exam_generate_questions(
+                summary, questions, use_cache, combined, stats, request_existing_questions(data), source_hash
+            )
+        record_render_cost(stats, render_cost)
+        record_usage(stats, usage)
+        logger.info("generated", extra={"specs": len(questions), **stats})
+        return jsonify(results), 200, generation_stats_headers(stats)
     except Exception as e:
+        logger.exception("generate failed")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/generate/stream", methods=["POST"])
+def generate_questions_stream():
+    """Route to generate questions, streaming each question and question set as NDJSON as soon as it is ready"""
+    data = request.get_json()
+
+    required_fields = ["summary", "questions"]
+    if not all(field in data for field in required_fields):
+        return jsonify({"error": "Missing required fields: 'summary' and 'questions'"}), 400
+
+    summary = data['summary']
+    questions = data['questions']
+    # 'nocache' or 'fresh' forces new questions even when the cache has some
+    use_cache = not (data.get('nocache') or data.get('fresh'))
+    source_hash = request_source_hash(data) if use_bank(data, use_cache) else None
+
+    def events():
+        # Announce the slots up front so the client can lay them out in order
+        yield json.dumps({"event": "start", "total": len(questions)}) + "\n"
+        try:
+            # 'existing' lists questions the client already has, which are never repeated
+            seen = new_question_index(request_existing_questions(data))
+            stats = {}
+            with measure_renders() as render_cost, measure_usage() as usage:
+                for kind, index, value in iter_planned_exam_events(summary, questions, use_cache, seen, source_hash, stats):
+                    if kind == "question":
+                        # Single questions arrive as soon as the model closes each JSON object
+                        yield json.dumps({"event": "question", "index": index, "question": value}) + "\n"
+                    else:
+                        yield json.dumps({"event": "question_set", "index": index, **value}) + "\n"
+        except Exception as e:
+            logger.exception("generate stream failed")
+            yield json.dumps({"event": "error", "error": str(e)}) + "\n"
+            return
+        # The done event carries the request's render cost and token usage, and bank usage for bank-first requests
+        record_render_cost(stats, render_cost)
+        record_usage(stats, usage)
+        yield json.dumps({"event": "done", **stats}) + "\n"
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="application/x-ndjson",
+        # Stop reverse proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    """Route to queue exam generation in the background and return a job id"""
+    data = request.get_json()
+
+    required_fields = ["summary", "questions"]
+    if not all(field in data for field in required_fields):
+        return jsonify({"error": "Missing required fields: 'summary' and 'questions'"}), 400
+
+    # Fairness is per client: an explicit id when the caller has one, else its address
+    client_id = request.headers.get('X-Client-Id') or request.remote_addr
+    try:
+        priority = int(data.get('priority', 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "'priority' must be an integer"}), 400
+
+    try:
+        job = exam_jobs.submit(data, client_id, priority)
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 429
+
+    return jsonify({"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"}), 202
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Route to report a job's progress and its partial or final results"""
+    job = exam_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found or expired."}), 404
+    return jsonify(job)
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    """Route to report cache hit/miss counters for sizing"""
+    return jsonify({
+        "summary": summary_cache.stats(),
+        "extraction": extraction_cache.stats() if extraction_cache is not None else None,
+        "generation": generation_cache.stats() if generation_cache is not None else None
+    })
+
+@app.route("/backend/stats", methods=["GET"])
+def backend_stats():
+    """Route to report each LLM endpoint's health and load, and the model used per task"""
+    return jsonify({**llm_backend.pool.stats(), "models": llm_backend.models})
+
+@app.route("/bank/questions", methods=["POST"])
+def save_bank_questions():
+    """Route to store generated question sets in the question bank, optionally as a named set"""
+    data = request.get_json()
+
+    if not isinstance(data.get('question_sets'), list):
+        return jsonify({"error": "Missing required field: 'question_sets'"}), 400
+    if not (data.get('source_hash') or data.get('summary')):
+        return jsonify({"error": "Missing required field: 'source_hash' or 'summary'"}), 400
+
+    try:
+        result = question_bank.save(
+            request_source_hash(data), data['question_sets'], data.get('set_id'), data.get('set_name')
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except SetNotFoundError:
+        return jsonify({"error": "Question set not found."}), 404
+    return jsonify(result), 201
+
+@app.route("/bank/questions", methods=["GET"])
+def search_bank_questions():
+    """Route to query stored questions by source, type, Bloom's level and difficulty, with optional full-text 'q'"""
+    args = request.args
+    try:
+        limit = min(int(args.get('limit', 50)), 500)
+        offset = int(args.get('offset', 0))
+    except ValueError:
+        return jsonify({"error": "'limit' and 'offset' must be integers"}), 400
+
+    return jsonify(question_bank.search(
+        source_hash=args.get('source_hash'),
+        q_type=args.get('type', '').lower() or None,
+        bloom_level=args.get('bloom_level'),
+        difficulty=args.get('difficulty'),
+        text=args.get('q'),
+        limit=limit,
+        offset=offset
+    ))
+
+@app.route("/bank/assemble", methods=["POST"])
+def assemble_bank_exam():
+    """Route to assemble an exam from stored questions only, reporting what each spec is missing"""
+    data = request.get_json()
+
+    if "questions" not in data:
+        return jsonify({"error": "Missing required field: 'questions'"}), 400
+    if not (data.get('source_hash') or data.get('summary')):
+        return jsonify({"error": "Missing required field: 'source_hash' or 'summary'"}), 400
+
+    exclude_ids = data.get('exclude_ids', [])
+    if not isinstance(exclude_ids, list) or not all(
+            isinstance(bank_id, int) and not isinstance(bank_id, bool) for bank_id in exclude_ids):
+        return jsonify({"error": "'exclude_ids' must be a list of integers"}), 400
+    try:
+        check_question_specs(data['questions'])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    results, shortfalls = assemble_from_bank(request_source_hash(data), data['questions'], exclude_ids)
+    return jsonify([
+        {**question_set, "missing": missing}
+        for question_set, missing in zip(results, shortfalls)
+    ])
+
+@app.route("/bank/sets", methods=["GET"])
+def list_bank_sets():
+    """Route to list a page of saved question sets; each set's questions come from /bank/sets/<set_id>"""
+    try:
+        limit = min(int(request.args.get('limit', 50)), 500)
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return jsonify({"error": "'limit' and 'offset' must be integers"}), 400
+    return jsonify(question_bank.list_sets(limit, offset))
+
+@app.route("/bank/sets/<set_id>", methods=["GET"])
+def get_bank_set(set_id):
+    """Route to fetch one saved question set"""
+    saved = question_bank.get_set(set_id)
+    if saved is None:
+        return jsonify({"error": "Question set not found."}), 404
+    return jsonify(saved)
+
+@app.route("/bank/sets/<set_id>", methods=["DELETE"])
+def delete_bank_set(set_id):
+    """Route to delete a saved question set; its questions stay in the bank"""
+    if not question_bank.delete_set(set_id):
+        return jsonify({"error": "Question set not found."}), 404
+    return jsonify({"deleted": set_id})
+
+@app.route("/bank/stats", methods=["GET"])
+def bank_stats():
+    """Route to report how many questions and sets the bank holds"""
+    return jsonify(question_bank.stats())
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Route to expose request, stage and LLM latency metrics in the Prometheus text format"""
+    # Endpoint load is read from the pool at scrape time rather than tracked twice
+    for endpoint in llm_backend.pool.stats()["endpoints"]:
+        LLM_ENDPOINT_OUTSTANDING.set(endpoint["outstanding"], endpoint=endpoint["url"])
+        LLM_ENDPOINT_HEALTHY.set(int(endpoint["healthy"]), endpoint=endpoint["url"])
+    return Response(METRICS_REGISTRY.render(), mimetype=None, content_type=METRICS_CONTENT_TYPE)
+
 @app.route('/static/<path:path>')
 def send_static(path):
     """Serve static files"""
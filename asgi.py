@@ -0,0 +1,438 @@
+"""ASGI serving mode
+
+Question generation runs natively on asyncio, so an in-flight /generate
+waits on the LLM without holding a thread. Every other route is served
+by the Flask app through a WSGI adapter.
+
+Run with:  uvicorn asgi:app --host 0.0.0.0 --port 10000
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import (
+    COMBINED_GENERATION,
+    GENERATION_TIMEOUT,
+    REPAIR_MAX_ATTEMPTS,
+    app as flask_app,
+    build_combined_prompt,
+    combined_generation_stats,
+    finish_planned_set,
+    generation_stats_headers,
+    llm_backend,
+    QuestionCollector,
+    lookup_cached_questions,
+    new_question_index,
+    plan_exam,
+    prompt_contexts,
+    record_render_cost,
+    record_usage,
+    request_existing_questions,
+    request_source_hash,
+    select_combined_specs,
+    split_combined_response,
+    split_summary_prompt,
+    store_cached_questions,
+    timed_out_question_set,
+    use_bank
+)
+from cache import content_key
+from json_stream import QuestionStreamParser
+from llm_backend import AsyncLLMBackend, measure_usage
+from metrics import (
+    GENERATION_STAGE_SECONDS,
+    HTTP_REQUEST_SECONDS,
+    HTTP_REQUESTS_IN_FLIGHT,
+    LLM_CALL_SECONDS,
+    LLM_CALLS_IN_FLIGHT,
+    LLM_FIRST_TOKEN_SECONDS
+)
+from prompt_templates import QUESTION_TEMPLATES, bloom_level_label, measure_renders
+
+# Concurrent LLM calls per process; far higher than the threaded pool allows
+ASYNC_MAX_CONCURRENCY = int(os.environ.get("ASYNC_MAX_CONCURRENCY", 256))
+
+# Shares the endpoint pool and circuit breakers with the sync backend
+async_llm_backend = AsyncLLMBackend(llm_backend, pool_size=ASYNC_MAX_CONCURRENCY)
+generation_semaphore = asyncio.Semaphore(ASYNC_MAX_CONCURRENCY)
+prompt_context_locks = {}
+logger = logging.getLogger("exgen")
+
+wsgi_app = WsgiToAsgi(flask_app)
+
+
+async def asummary_context(preamble):
+    """Async counterpart of summary_context, sharing its cache of context tokens"""
+    cache_key = content_key(preamble, async_llm_backend.model_for("questions"))
+    context = prompt_contexts.get(cache_key)
+    if context is not None:
+        return context
+
+    lock = prompt_context_locks.setdefault(cache_key, asyncio.Lock())
+    async with lock:
+        context = prompt_contexts.get(cache_key)
+        if context is None:
+            try:
+                async with generation_semaphore:
+                    context = await async_llm_backend.encode_context(async_llm_backend.model_for("questions"), preamble)
+                prompt_contexts.set(cache_key, context)
+            except Exception:
+                logger.warning("summary context encoding failed", exc_info=True)
+                context = []
+    prompt_context_locks.pop(cache_key, None)
+    return context
+
+
+async def agenerate_payload(prompt, summary=None):
+    """Async counterpart of generate_payload"""
+    preamble, rest = split_summary_prompt(prompt, summary)
+    context = await asummary_context(preamble) if preamble is not None else None
+    model = async_llm_backend.model_for("questions")
+    if context:
+        return {"model": model, "prompt": rest, "context": context}
+    return {"model": model, "prompt": prompt}
+
+
+async def aobserved_stream(payload, task, question_type="", bloom_level=""):
+    """Async counterpart of observed_stream"""
+    labels = {"task": task, "question_type": question_type, "bloom_level": bloom_level_label(bloom_level)}
+    started = time.perf_counter()
+    first = True
+    with LLM_CALLS_IN_FLIGHT.track(task=task):
+        async for chunk in async_llm_backend.stream(payload):
+            if first:
+                LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started, **labels)
+                first = False
+            yield chunk
+    LLM_CALL_SECONDS.observe(time.perf_counter() - started, **labels)
+
+
+async def arequest_questions(prompt, on_question=None, summary=None, q_type="", bloom_level=""):
+    """Stream a question prompt through the incremental parser without blocking the loop"""
+    parser = QuestionStreamParser()
+    questions = []
+    parse_seconds = 0.0
+    payload = await agenerate_payload(prompt, summary)
+    async with generation_semaphore:
+        async for chunk in aobserved_stream(payload, "questions", q_type, bloom_level):
+            started = time.perf_counter()
+            for question in parser.feed(chunk.get("response", "")):
+                questions.append(question)
+                if on_question is not None:
+                    on_question(question)
+            parse_seconds += time.perf_counter() - started
+    GENERATION_STAGE_SECONDS.observe(
+        parse_seconds, stage="parse_validate", question_type=q_type, bloom_level=bloom_level_label(bloom_level)
+    )
+    return questions, parser
+
+
+async def aobserved_complete(payload, task):
+    """Async counterpart of observed_complete"""
+    parts = []
+    async for chunk in aobserved_stream(payload, task):
+        parts.append(chunk.get("response", ""))
+    return "".join(parts)
+
+
+async def agenerate_validated_questions(q_type, summary, quantity, difficulty, bloom_level, on_question=None, seen=None):
+    """Async counterpart of generate_validated_questions"""
+    collector = QuestionCollector(q_type, quantity, seen, on_question)
+    for _ in range(REPAIR_MAX_ATTEMPTS + 1):
+        if collector.wanted <= 0:
+            break
+        prompt = collector.prompt(summary, difficulty, bloom_level)
+        _, parser = await arequest_questions(prompt, collector.accept, summary, q_type, bloom_level)
+        collector.finish_attempt(parser)
+    return collector.result()
+
+
+async def agenerate_question_set(summary, question, use_cache=True, on_question=None, seen=None):
+    """Generate the questions for a single question specification without blocking the loop"""
+    q_type = question['type'].lower()
+    bloom_level = question.get('bloom_level', 'Understand')
+    difficulty = question.get('difficulty', 'Medium')
+    quantity = question.get('quantity', 1)
+
+    # Serve identical specs from the generation cache when it is enabled
+    cache_key, cached = lookup_cached_questions(summary, q_type, bloom_level, difficulty, quantity, use_cache)
+    if cached is not None and (seen is None or seen.add_all_if_new(q.get("question", "") for q in cached)):
+        return {"type": q_type, "bloom_level": bloom_level, "questions": cached}
+
+    if q_type not in QUESTION_TEMPLATES:
+        # Fallback for unknown question types
+        questions = [{"error": f"Unknown question type: {q_type}"}]
+    else:
+        questions = await agenerate_validated_questions(q_type, summary, quantity, difficulty, bloom_level, on_question, seen)
+        store_cached_questions(cache_key, questions, quantity)
+
+    return {"type": q_type, "bloom_level": bloom_level, "questions": questions}
+
+
+async def agenerate_combined_sets(summary, question_list, use_cache=True, stats=None, seen=None):
+    """Async counterpart of generate_combined_sets"""
+    cached_sets, packed = select_combined_specs(summary, question_list, use_cache, seen)
+    if len(packed) < 2:
+        return cached_sets
+
+    prompt = build_combined_prompt(summary, packed)
+    timeout = min(float(question.get('timeout', GENERATION_TIMEOUT)) for _, question, _ in packed)
+    try:
+        payload = await asyncio.wait_for(agenerate_payload(prompt, summary), timeout)
+        async with generation_semaphore:
+            text = await asyncio.wait_for(aobserved_complete(payload, "combined"), timeout)
+    except Exception:
+        # Timeouts and backend errors fall back to the per-type prompts
+        logger.warning("combined generation failed, falling back per type", exc_info=True)
+        text = ""
+
+    started = time.perf_counter()
+    accepted, fallback = split_combined_response(text, packed, seen)
+    GENERATION_STAGE_SECONDS.observe(
+        time.perf_counter() - started, stage="parse_validate", question_type="combined", bloom_level=""
+    )
+    if stats is not None:
+        stats.update(combined_generation_stats(summary, packed, prompt, fallback))
+    return {**cached_sets, **accepted}
+
+
+async def agenerate_indexed_set(index, summary, question, use_cache=True, on_question=None, seen=None):
+    """Generate one spec under its timeout and return it with its position in the request"""
+    timeout = float(question.get('timeout', GENERATION_TIMEOUT))
+    try:
+        question_set = await asyncio.wait_for(
+            agenerate_question_set(summary, question, use_cache, on_question, seen),
+            timeout
+        )
+    except asyncio.TimeoutError:
+        logger.warning("question set timed out", extra={
+            "question_type": question['type'].lower(), "timeout": timeout
+        })
+        question_set = timed_out_question_set(question, timeout)
+    return index, question_set
+
+
+async def agenerate_exam(summary, questions, use_cache=True, combined=False, stats=None, seen=None, source_hash=None):
+    """Async counterpart of exam_generate_questions, taking the duplicate index ready-made"""
+    stats = stats if stats is not None else {}
+    specs = questions
+    if source_hash is not None:
+        # Bank lookups are blocking SQLite calls; only the shortfall is generated, batched
+        banked, gaps = await asyncio.to_thread(plan_exam, source_hash, questions, seen, stats)
+        specs = [gap for _, gap in gaps]
+        combined = combined or len(gaps) > 1
+
+    results = [None] * len(specs)
+    if combined:
+        for index, question_set in (await agenerate_combined_sets(summary, specs, use_cache, stats, seen)).items():
+            results[index] = question_set
+    indexed = await asyncio.gather(*(
+        agenerate_indexed_set(index, summary, specs[index], use_cache, seen=seen)
+        for index, question_set in enumerate(results) if question_set is None
+    ))
+    for index, question_set in indexed:
+        results[index] = question_set
+
+    if source_hash is None:
+        return results
+    for (index, _), question_set in zip(gaps, results):
+        banked[index] = await asyncio.to_thread(
+            finish_planned_set, source_hash, questions[index], banked[index], question_set, stats
+        )
+    return banked
+
+
+async def read_json(receive):
+    """Read the whole request body and decode it as JSON"""
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return json.loads(body or b"null")
+
+
+async def send_json(send, data, status=200, headers=None):
+    """Send a complete JSON response"""
+    body = json.dumps(data).encode("utf-8")
+    extra_headers = [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())] + extra_headers
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def read_generate_payload(receive, send):
+    """Validate a /generate payload, replying with a 400 and returning None when it is invalid"""
+    try:
+        data = await read_json(receive)
+    except ValueError:
+        data = None
+    if not isinstance(data, dict) or not all(field in data for field in ["summary", "questions"]):
+        await send_json(send, {"error": "Missing required fields: 'summary' and 'questions'"}, 400)
+        return None
+    return data
+
+
+async def generate_questions(scope, receive, send):
+    """Async /generate: fan the specs out as tasks and return them in request order"""
+    data = await read_generate_payload(receive, send)
+    if data is None:
+        return
+    use_cache = not (data.get('nocache') or data.get('fresh'))
+    combined = bool(data.get('combined', COMBINED_GENERATION))
+    questions = data['questions']
+    source_hash = request_source_hash(data) if use_bank(data, use_cache) else None
+
+    stats = {}
+    try:
+        # Hashing a large existing set is CPU work, so keep it off the event loop
+        seen = await asyncio.to_thread(lambda: new_question_index(request_existing_questions(data)))
+        with measure_renders() as render_cost, measure_usage() as usage:
+            results = await agenerate_exam(data['summary'], questions, use_cache, combined, stats, seen, source_hash)
+    except Exception as e:
+        logger.exception("generate failed")
+        await send_json(send, {"error": str(e)}, 500)
+        return
+    record_render_cost(stats, render_cost)
+    record_usage(stats, usage)
+    logger.info("generated", extra={"specs": len(questions), **stats})
+    await send_json(send, results, headers=generation_stats_headers(stats))
+
+
+async def generate_questions_stream(scope, receive, send):
+    """Async /generate/stream: emit each question and question set as NDJSON as soon as it is ready"""
+    data = await read_generate_payload(receive, send)
+    if data is None:
+        return
+    use_cache = not (data.get('nocache') or data.get('fresh'))
+    questions = data['questions']
+    source_hash = request_source_hash(data) if use_bank(data, use_cache) else None
+
+    async def emit(event):
+        await send({"type": "http.response.body", "body": (json.dumps(event) + "\n").encode("utf-8"), "more_body": True})
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"application/x-ndjson"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no")
+        ]
+    })
+
+    # Tasks report single questions and finished sets through one queue
+    events = asyncio.Queue()
+    seen = await asyncio.to_thread(lambda: new_question_index(request_existing_questions(data)))
+    stats = {}
+    gaps = [(index, question) for index, question in enumerate(questions)]
+    if source_hash is not None:
+        banked, gaps = await asyncio.to_thread(plan_exam, source_hash, questions, seen, stats)
+        short = {index for index, _ in gaps}
+        for index, question_set in enumerate(banked):
+            if index not in short:
+                events.put_nowait(("question_set", index, question_set))
+            else:
+                # Stored questions of a partly banked spec show up while the rest generates
+                for question in question_set["questions"]:
+                    events.put_nowait(("question", index, question))
+
+    async def run(index, question):
+        on_question = lambda completed: events.put_nowait(("question", index, completed))
+        try:
+            _, question_set = await agenerate_indexed_set(index, data['summary'], question, use_cache, on_question, seen)
+            if source_hash is not None:
+                question_set = await asyncio.to_thread(
+                    finish_planned_set, source_hash, questions[index], banked[index], question_set, stats
+                )
+            events.put_nowait(("question_set", index, question_set))
+        except Exception as e:
+            logger.exception("generate stream failed")
+            events.put_nowait(("error", index, e))
+
+    with measure_renders() as render_cost, measure_usage() as usage:
+        # Tasks copy the current context, so their prompt renders and token usage are charged to this request
+        tasks = [asyncio.ensure_future(run(index, question)) for index, question in gaps]
+    try:
+        await emit({"event": "start", "total": len(questions)})
+        remaining = len(questions)
+        while remaining:
+            kind, index, value = await events.get()
+            if kind == "question":
+                await emit({"event": "question", "index": index, "question": value})
+            elif kind == "question_set":
+                remaining -= 1
+                await emit({"event": "question_set", "index": index, **value})
+            else:
+                await emit({"event": "error", "error": str(value)})
+                break
+        else:
+            # The done event carries the request's render cost and token usage, and bank usage for bank-first requests
+            record_render_cost(stats, render_cost)
+            record_usage(stats, usage)
+            await emit({"event": "done", **stats})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        # Stop any work the client will never see
+        for task in tasks:
+            task.cancel()
+
+
+async def lifespan(scope, receive, send):
+    """Handle server startup and shutdown"""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await async_llm_backend.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def observed_handler(handler, scope, receive, send):
+    """Run an async route with the same request metrics the Flask app records for its routes"""
+    route = scope["path"]
+    status = []
+
+    async def send_with_status(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+        await send(message)
+
+    started = time.perf_counter()
+    with HTTP_REQUESTS_IN_FLIGHT.track(route=route):
+        try:
+            await handler(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                route=route, method=scope["method"], status=status[0] if status else 500
+            )
+
+
+ASYNC_ROUTES = {
+    "/generate": generate_questions,
+    "/generate/stream": generate_questions_stream
+}
+
+
+async def app(scope, receive, send):
+    """ASGI entry point"""
+    if scope["type"] == "lifespan":
+        await lifespan(scope, receive, send)
+        return
+
+    handler = ASYNC_ROUTES.get(scope.get("path"))
+    if scope["type"] == "http" and scope["method"] == "POST" and handler is not None:
+        await observed_handler(handler, scope, receive, send)
+    else:
+        await wsgi_app(scope, receive, send)
@@ -0,0 +1,86 @@
+"""Micro-benchmark: MinHash/LSH duplicate index vs. pairwise shingle comparison
+
+Run with:  python benchmarks/bench_dedup.py --stored 5000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dedup import QuestionIndex, normalize_text
+
+WORDS = (
+    "energy light chlorophyll glucose water carbon oxygen membrane enzyme stomata root xylem phloem "
+    "respiration nitrogen protein starch photon pigment thylakoid stroma cycle gradient transport "
+    "cell leaf stem sugar reaction process absorb release convert store produce require explain"
+).split()
+
+
+def make_question(rng):
+    """Build a random question-like sentence"""
+    return f"Which {' '.join(rng.sample(WORDS, 9))} best explains {rng.choice(WORDS)}?"
+
+
+def paraphrase(text, rng):
+    """Change one word, the kind of near duplicate the index should catch"""
+    words = text.split()
+    words[rng.randrange(1, len(words) - 1)] = rng.choice(WORDS)
+    return " ".join(words)
+
+
+def shingles(text, size=5):
+    """Return the character shingles of normalized text"""
+    normalized = normalize_text(text)
+    return {normalized[i:i + size] for i in range(max(1, len(normalized) - size + 1))}
+
+
+def pairwise_contains(stored_shingles, text, threshold):
+    """The naive approach: exact Jaccard similarity against every stored question"""
+    candidate = shingles(text)
+    return any(len(candidate & other) / len(candidate | other) >= threshold for other in stored_shingles)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stored", type=int, default=5000, help="questions already in the index")
+    parser.add_argument("--lookups", type=int, default=500, help="new questions checked against it")
+    parser.add_argument("--threshold", type=float, default=0.7)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    stored = [make_question(rng) for _ in range(args.stored)]
+    near = [paraphrase(rng.choice(stored), rng) for _ in range(args.lookups // 2)]
+    fresh = [make_question(rng) for _ in range(args.lookups - len(near))]
+
+    started = time.perf_counter()
+    index = QuestionIndex(stored, threshold=args.threshold)
+    build_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    index_near = sum(index.contains(text) for text in near)
+    index_fresh = sum(index.contains(text) for text in fresh)
+    index_seconds = time.perf_counter() - started
+
+    stored_shingles = [shingles(text) for text in stored]
+    started = time.perf_counter()
+    pairwise_near = sum(pairwise_contains(stored_shingles, text, args.threshold) for text in near)
+    pairwise_fresh = sum(pairwise_contains(stored_shingles, text, args.threshold) for text in fresh)
+    pairwise_seconds = time.perf_counter() - started
+
+    print(json.dumps({
+        "stored": args.stored,
+        "lookups": args.lookups,
+        "index_build_ms": round(build_seconds * 1000, 1),
+        "index_lookup_ms_each": round(index_seconds * 1000 / args.lookups, 3),
+        "pairwise_lookup_ms_each": round(pairwise_seconds * 1000 / args.lookups, 3),
+        "near_duplicates_caught": {"index": index_near, "pairwise": pairwise_near, "of": len(near)},
+        "fresh_flagged": {"index": index_fresh, "pairwise": pairwise_fresh, "of": len(fresh)}
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Micro-benchmark: streaming DOCX extraction vs. the python-docx object model
+
+Writes a DOCX whose word/document.xml is --xml-mb megabytes of paragraphs
+with a table every few blocks, then extracts it with each method in a fresh
+process and reports seconds, characters extracted and peak memory growth
+(max RSS over that of an idle worker) as JSON. Before timing anything, it
+checks that both methods extract the same text from a document without
+tables, which python-docx leaves out, and exits non-zero when they differ.
+
+Run with:  python benchmarks/bench_docx_extract.py --xml-mb 10 100
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORDS = (
+    "photosynthesis converts light energy into chemical energy stored in glucose chlorophyll absorbs red and "
+    "blue wavelengths inside the thylakoid membrane while the Calvin cycle fixes carbon dioxide in the stroma"
+).split()
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+)
+DOCUMENT_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+)
+DOCUMENT_END = '<w:sectPr/></w:body></w:document>'
+
+
+def paragraph(index):
+    """Build one paragraph of a few runs, the way editors split formatting
+
+    Some carry a tab stop definition, a tab, a line break or a page break,
+    so the text check covers what is and is not run content.
+    """
+    words = [WORDS[(index + offset) % len(WORDS)] for offset in range(12)]
+    properties = '<w:pPr><w:tabs><w:tab w:val="left" w:pos="2880"/></w:tabs></w:pPr>' if index % 3 == 0 else ""
+    extra = ("<w:r><w:tab/><w:t>tabbed</w:t></w:r>", "<w:r><w:br/><w:t>wrapped</w:t></w:r>",
+             '<w:r><w:br w:type="page"/></w:r>', "")[index % 4]
+    return (
+        f'<w:p>{properties}<w:r><w:t xml:space="preserve">Paragraph {index}: {" ".join(words[:6])} </w:t></w:r>'
+        f'<w:r><w:rPr><w:b/></w:rPr><w:t>{" ".join(words[6:])}.</w:t></w:r>{extra}</w:p>'
+    )
+
+
+def table(index):
+    """Build a three-by-three table"""
+    rows = "".join(
+        "<w:tr>" + "".join(f"<w:tc>{paragraph(index + row * 3 + column)}</w:tc>" for column in range(3)) + "</w:tr>"
+        for row in range(3)
+    )
+    return f"<w:tbl>{rows}</w:tbl>"
+
+
+def write_docx(path, xml_bytes, tables=True):
+    """Write a minimal DOCX with about xml_bytes of document.xml, streamed so the writer stays small"""
+    written = 0
+    index = 0
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", CONTENT_TYPES)
+        archive.writestr("_rels/.rels", RELS)
+        with archive.open("word/document.xml", "w", force_zip64=True) as document:
+            document.write(DOCUMENT_START.encode())
+            while written < xml_bytes:
+                block = (table(index) if tables and index % 20 == 19 else paragraph(index)).encode()
+                document.write(block)
+                written += len(block)
+                index += 1
+            document.write(DOCUMENT_END.encode())
+
+
+def extract_with_python_docx(path):
+    """The previous extractor: body paragraphs only, through the full object model"""
+    import docx
+
+    doc = docx.Document(path)
+    text = ""
+    for para in doc.paragraphs:
+        text += para.text + "\n"
+    return text
+
+
+def check_same_text(directory):
+    """Return whether both methods extract the same text from a document without tables"""
+    from extractors import extract_text_from_docx
+
+    path = os.path.join(directory, "check.docx")
+    write_docx(path, 1024 * 1024, tables=False)
+    streamed = extract_text_from_docx(path)
+    expected = extract_with_python_docx(path)
+    if streamed == expected:
+        return True
+    mismatch = next(
+        (index for index, (ours, theirs) in enumerate(zip(streamed, expected)) if ours != theirs),
+        min(len(streamed), len(expected))
+    )
+    print(f"Extracted text differs from python-docx at character {mismatch}: "
+          f"{streamed[mismatch:mismatch + 60]!r} != {expected[mismatch:mismatch + 60]!r}", file=sys.stderr)
+    return False
+
+
+def run_worker(method, path):
+    """Extract path with one method in this process and print the measurements"""
+    from extractors import extract_text_from_docx
+
+    extract = {"streaming": extract_text_from_docx, "python-docx": extract_with_python_docx}.get(method)
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    chars = 0
+    started = time.perf_counter()
+    if extract is not None:
+        chars = len(extract(path))
+    seconds = time.perf_counter() - started
+    # ru_maxrss is in kilobytes on Linux
+    peak_mb = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base_rss) / 1024
+    print(json.dumps({"seconds": round(seconds, 3), "chars": chars, "peak_rss_growth_mb": round(peak_mb, 1)}))
+
+
+def measure(method, path):
+    """Run one extraction in a fresh process so peak memory is not shared between methods"""
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", method, path],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--xml-mb", type=float, nargs="+", default=[10], help="Uncompressed document.xml sizes")
+    parser.add_argument("--methods", nargs="+", default=["streaming", "python-docx"])
+    parser.add_argument("--worker", nargs=2, metavar=("METHOD", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(*args.worker)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        if not check_same_text(directory):
+            sys.exit(1)
+        for size in args.xml_mb:
+            path = os.path.join(directory, f"bench-{size}.docx")
+            write_docx(path, int(size * 1024 * 1024))
+            for method in args.methods:
+                result = {"xml_mb": size, "docx_mb": round(os.path.getsize(path) / 1024 / 1024, 1), "method": method}
+                result.update(measure(method, path))
+                results.append(result)
+                print(json.dumps(result), file=sys.stderr)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Track server cold start with python -X importtime
+
+Imports each entry point in fresh interpreters and reports the median
+cumulative import time, the slowest imports, and any module meant to load
+on first use that was imported at startup. Exits non-zero when the budget
+is exceeded or a lazy module is loaded, so it can gate CI.
+
+Run with:  python benchmarks/bench_import_time.py --runs 5 --budget-ms 400
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules each entry point must not import at startup
+LAZY_MODULES = {
+    "app": ("pypdf", "docx", "requests", "httpx", "yaml"),
+    # The ASGI mode builds its httpx clients at import
+    "asgi": ("pypdf", "docx", "requests", "yaml")
+}
+
+
+def import_times(module, env):
+    """Import module in a fresh interpreter and return {imported module: (self us, cumulative us)}"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(own), int(cumulative))
+    return times
+
+
+def measure(module, runs, env):
+    """Return the import report for one entry point"""
+    # The first run also writes bytecode caches, so it is reported apart from the median
+    samples = [import_times(module, env) for _ in range(runs + 1)]
+    first, warm = samples[0], samples[1:]
+    totals = [sample[module][1] for sample in warm]
+    slowest = sorted(warm[-1].items(), key=lambda item: item[1][1], reverse=True)
+    top_level = [(name, cumulative) for name, (_, cumulative) in slowest if name != module][:10]
+    return {
+        "first_run_ms": round(first[module][1] / 1000, 1),
+        "median_ms": round(statistics.median(totals) / 1000, 1),
+        "slowest_imports_ms": {name: round(cumulative / 1000, 1) for name, cumulative in top_level},
+        "lazy_modules_loaded": sorted(name for name in LAZY_MODULES.get(module, ()) if name in warm[-1])
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modules", nargs="+", default=["app"], choices=sorted(LAZY_MODULES))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=0, help="fail when a median exceeds this (0 disables)")
+    args = parser.parse_args()
+
+    # Keep the caches and question bank the import opens out of the working tree
+    scratch = tempfile.mkdtemp(prefix="exgen-importtime-")
+    env = dict(os.environ, CACHE_DIR=os.path.join(scratch, "cache"), DATA_DIR=os.path.join(scratch, "data"))
+
+    report = {module: measure(module, args.runs, env) for module in args.modules}
+    print(json.dumps(report, indent=2))
+
+    failed = False
+    for module, result in report.items():
+        if result["lazy_modules_loaded"]:
+            print(f"{module} imports {', '.join(result['lazy_modules_loaded'])} at startup", file=sys.stderr)
+            failed = True
+        if args.budget_ms and result["median_ms"] > args.budget_ms:
+            print(f"{module} takes {result['median_ms']}ms to import, over the {args.budget_ms:g}ms budget",
+                  file=sys.stderr)
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
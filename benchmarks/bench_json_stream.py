@@ -0,0 +1,107 @@
+"""Micro-benchmark: incremental question parser vs. concatenate-then-regex parsing
+
+Run with:  python benchmarks/bench_json_stream.py
+"""
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_stream import QuestionStreamParser
+
+
+def make_questions(count):
+    """Build count realistic multiple-choice question objects"""
+    return [{
+        "question": f"Question {i}: which option best explains the {{role}} of \"energy\" in step {i}?",
+        "options": ["A. First option", "B. Second option", "C. Third option", "D. Fourth option"],
+        "answer": "B",
+        "explanation": "Because the second option describes the process correctly. " * 3,
+        "bloom_justification": "Requires explaining a relationship, not just recalling a fact."
+    } for i in range(count)]
+
+
+def tokenize(text, size=4):
+    """Split text into token-sized pieces, as streamed by the model"""
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def legacy_parse(tokens):
+    """The original approach: build the full string, json.loads it, fall back to a greedy regex"""
+    full_response = ""
+    for token in tokens:
+        full_response += token
+    try:
+        return json.loads(full_response)
+    except json.JSONDecodeError:
+        json_match = re.search(r'\[\s*{.*}\s*\]', full_response, re.DOTALL)
+        if json_match:
+            try:
+                return json.loads(json_match.group(0))
+            except json.JSONDecodeError:
+                return []
+        return []
+
+
+def incremental_parse(tokens):
+    """Feed each token to the incremental parser as it arrives"""
+    parser = QuestionStreamParser()
+    questions = []
+    for token in tokens:
+        questions.extend(parser.feed(token))
+    return questions
+
+
+def first_question_at(tokens):
+    """Return the fraction of the stream consumed before the parser yields its first question"""
+    parser = QuestionStreamParser()
+    for position, token in enumerate(tokens, 1):
+        if parser.feed(token):
+            return position / len(tokens)
+    return None
+
+
+def bench(function, tokens, repeat=5):
+    """Return the best wall time of function(tokens) and its result"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function(tokens)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    large = json.dumps(make_questions(500), indent=2)
+    cases = {
+        "large_valid": large,
+        "large_with_chatter": "Sure! Here are your questions:\n```json\n" + large + "\n```\nLet me know if you need more.",
+        "large_truncated": large[:-200],
+        "large_trailing_comma": large.replace('"B",', '"B",,', 1),
+        "unbalanced_braces": "[" + "{ " * 20000 + "]"
+    }
+
+    report = {}
+    for name, text in cases.items():
+        tokens = tokenize(text)
+        legacy_time, legacy_result = bench(legacy_parse, tokens)
+        incremental_time, incremental_result = bench(incremental_parse, tokens)
+        report[name] = {
+            "bytes": len(text),
+            "legacy_ms": round(legacy_time * 1000, 2),
+            "legacy_questions": len(legacy_result),
+            "incremental_ms": round(incremental_time * 1000, 2),
+            "incremental_questions": len(incremental_result),
+            "speedup": round(legacy_time / incremental_time, 2),
+            # The legacy approach has nothing to show until the whole stream has arrived
+            "incremental_first_question_at": first_question_at(tokens)
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
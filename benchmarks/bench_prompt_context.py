@@ -0,0 +1,92 @@
+"""Measure backend prefill with and without Ollama context reuse for one exam
+
+Runs the threaded server against the local stub twice, once with
+PROMPT_CONTEXT_REUSE off and once with it on, and reads the prompt tokens
+the stub had to evaluate for the same four-type exam.
+
+Run with:  python benchmarks/bench_prompt_context.py --summary-words 1500
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+from load_test import ROOT, free_port, start
+
+QUESTION_TYPES = ["multiple_choice", "true_or_false", "identification", "open_ended"]
+
+
+def make_summary(words):
+    """Build a summary of roughly the given number of words"""
+    sentence = "Photosynthesis converts light energy into chemical energy stored in glucose molecules. "
+    return (sentence * (words // len(sentence.split()) + 1)).strip()
+
+
+def run_exam(stub_port, summary, reuse):
+    """Generate one exam through a fresh server and return the backend's counters for it"""
+    port = free_port()
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        LLM_API_URL=f"http://127.0.0.1:{stub_port}/api/generate",
+        CACHE_DIR=tempfile.mkdtemp(prefix="exgen-context-"),
+        GENERATION_CACHE_ENABLED="",
+        PROMPT_CONTEXT_REUSE="1" if reuse else ""
+    )
+    server = start([sys.executable, "app.py"], port, env)
+    try:
+        before = httpx.get(f"http://127.0.0.1:{stub_port}/stats").json()
+        started = time.perf_counter()
+        response = httpx.post(f"http://127.0.0.1:{port}/generate", timeout=600, json={
+            "summary": summary,
+            "questions": [{"type": q_type, "quantity": 1} for q_type in QUESTION_TYPES]
+        })
+        elapsed = time.perf_counter() - started
+        after = httpx.get(f"http://127.0.0.1:{stub_port}/stats").json()
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {
+        "status": response.status_code,
+        "llm_calls": after["requests"] - before["requests"],
+        "prefill_tokens": after["prompt_tokens"] - before["prompt_tokens"],
+        "wall_seconds": round(elapsed, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--summary-words", type=int, default=1500)
+    parser.add_argument("--ttft", type=float, default=0.2, help="stub time to first token in seconds")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=2000,
+                        help="stub prompt evaluation rate")
+    args = parser.parse_args()
+
+    stub_port = free_port()
+    stub = start([
+        sys.executable, os.path.join(ROOT, "benchmarks", "stub_ollama.py"), "--port", str(stub_port),
+        "--ttft", str(args.ttft), "--tokens-per-second", "0",
+        "--prefill-tokens-per-second", str(args.prefill_tokens_per_second)
+    ], stub_port)
+
+    summary = make_summary(args.summary_words)
+    try:
+        report = {
+            "stateless": run_exam(stub_port, summary, reuse=False),
+            "context_reuse": run_exam(stub_port, summary, reuse=True)
+        }
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    report["prefill_tokens_saved"] = report["stateless"]["prefill_tokens"] - report["context_reuse"]["prefill_tokens"]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
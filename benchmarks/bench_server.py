@@ -0,0 +1,307 @@
+"""End-to-end latency and throughput of /summarize and /generate against the stub backend
+
+Starts the stub LLM and one server, then drives each scenario at each
+concurrency level with a closed loop of clients: /summarize with generated
+PDF, DOCX and TXT documents, and /generate with a mixed four-type exam.
+Every upload is made unique so the summary cache never answers, and every
+exam asks for fresh questions. Reports p50/p95/p99 latency and requests per
+second as JSON. With --baseline, exits non-zero when p95 latency or
+throughput regress by more than --tolerance against an earlier report.
+
+Run with:  python benchmarks/bench_server.py --concurrency 1 8 32 --requests 64 --out report.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+import httpx
+
+from load_test import ROOT, free_port, start
+
+QUESTION_TYPES = ["multiple_choice", "true_or_false", "identification", "open_ended"]
+BLOOM_LEVELS = ["Remember", "Understand", "Apply", "Analyze", "Evaluate", "Create"]
+WORDS = (
+    "photosynthesis converts light energy into chemical energy stored in glucose chlorophyll absorbs red and "
+    "blue wavelengths inside the thylakoid membrane while the Calvin cycle fixes carbon dioxide in the stroma "
+    "water is split to release oxygen and the resulting proton gradient drives ATP synthase"
+).split()
+MIME_TYPES = {
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "txt": "text/plain"
+}
+
+
+def make_paragraphs(rng, paragraphs, marker):
+    """Build paragraphs of plausible prose, opening with a marker line that makes the document unique"""
+    text = [f"Document {marker}"]
+    for _ in range(paragraphs):
+        sentences = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize() + "."
+                     for _ in range(rng.randint(3, 6))]
+        text.append(" ".join(sentences))
+    return text
+
+
+def pdf_escape(text):
+    """Escape text for a PDF string literal"""
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(paragraphs, lines_per_page=45, width=90):
+    """Write a minimal text PDF, wrapping paragraphs into lines and lines into pages"""
+    lines = []
+    for paragraph in paragraphs:
+        words = paragraph.split()
+        while words:
+            line = []
+            while words and len(" ".join(line + words[:1])) <= width:
+                line.append(words.pop(0))
+            lines.append(" ".join(line or [words.pop(0)]))
+        lines.append("")
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)]
+
+    # Objects: 1 catalog, 2 page tree, 3 font, then a page and its content stream per page
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>", 3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    kids = []
+    for number, page_lines in enumerate(pages):
+        page_id, content_id = 4 + 2 * number, 5 + 2 * number
+        stream = "BT /F1 10 Tf 12 TL 50 760 Td " + " ".join(f"({pdf_escape(line)}) '" for line in page_lines) + " ET"
+        stream = stream.encode("latin-1", "replace")
+        objects[page_id] = (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        objects[content_id] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+        kids.append(b"%d 0 R" % page_id)
+    objects[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(kids))
+
+    output = io.BytesIO()
+    output.write(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = output.tell()
+        output.write(b"%d 0 obj\n%s\nendobj\n" % (object_id, objects[object_id]))
+    xref = output.tell()
+    output.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for object_id in sorted(objects):
+        output.write(b"%010d 00000 n \n" % offsets[object_id])
+    output.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return output.getvalue()
+
+
+def make_docx(paragraphs):
+    """Write a DOCX with one paragraph per entry, plus a small table as real documents often have"""
+    import docx
+
+    document = docx.Document()
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    table = document.add_table(rows=3, cols=2)
+    for row, (term, meaning) in enumerate([("Stroma", "Calvin cycle"), ("Thylakoid", "Light reactions"),
+                                           ("Stomata", "Gas exchange")]):
+        table.cell(row, 0).text = term
+        table.cell(row, 1).text = meaning
+    output = io.BytesIO()
+    document.save(output)
+    return output.getvalue()
+
+
+def make_document(file_type, rng, paragraphs, marker):
+    """Return the bytes of a unique document of the given type"""
+    text = make_paragraphs(rng, paragraphs, marker)
+    if file_type == "pdf":
+        return make_pdf(text)
+    if file_type == "docx":
+        return make_docx(text)
+    return "\n\n".join(text).encode("utf-8")
+
+
+def exam_payload(rng, specs):
+    """Build a /generate payload asking for specs question sets of mixed types and levels"""
+    return {
+        "summary": " ".join(make_paragraphs(rng, 2, rng.random())),
+        "questions": [
+            {
+                "type": QUESTION_TYPES[number % len(QUESTION_TYPES)],
+                "bloom_level": rng.choice(BLOOM_LEVELS),
+                "difficulty": rng.choice(["Easy", "Medium", "Hard"]),
+                "quantity": rng.randint(1, 3)
+            }
+            for number in range(specs)
+        ],
+        "fresh": True
+    }
+
+
+def percentile(values, fraction):
+    """Return the nearest-rank percentile (fraction 0-1) of values"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def is_error_result(questions):
+    """Check whether a question set is the server's error placeholder rather than real questions"""
+    return any("error" in question or question.get("question", "").startswith("Error ") for question in questions)
+
+
+def summarize(results, elapsed):
+    """Reduce (status, seconds, degraded) results to the report's latency and throughput figures"""
+    latencies = [seconds for status, seconds, _ in results if status == 200]
+    report = {
+        "requests": len(results),
+        "ok": len(latencies),
+        "errors": len(results) - len(latencies),
+        # Answered, but with a placeholder in place of at least one question set
+        "degraded": sum(degraded for _, _, degraded in results),
+        "wall_seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 2) if elapsed else None
+    }
+    for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+        report[f"{name}_ms"] = round(percentile(latencies, fraction) * 1000, 1) if latencies else None
+    return report
+
+
+async def run_scenario(base_url, requests, concurrency):
+    """Send each prepared request with at most concurrency in flight and return the timing report"""
+    queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+    results = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=600, limits=limits) as client:
+        async def worker():
+            while not queue.empty():
+                path, kwargs = queue.get_nowait()
+                started = time.perf_counter()
+                degraded = False
+                try:
+                    response = await client.post(path, **kwargs)
+                    status = response.status_code
+                    if status == 200 and path == "/generate":
+                        degraded = any(is_error_result(question_set["questions"]) for question_set in response.json())
+                except httpx.HTTPError:
+                    status = None
+                results.append((status, time.perf_counter() - started, degraded))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return summarize(results, elapsed)
+
+
+def prepare(scenario, count, rng, args):
+    """Build count (path, request kwargs) pairs for a scenario"""
+    if scenario == "generate":
+        return [("/generate", {"json": exam_payload(rng, args.specs)}) for _ in range(count)]
+    file_type = scenario.split(":", 1)[1]
+    return [
+        ("/summarize", {"files": {"file": (f"fixture.{file_type}",
+                                           make_document(file_type, rng, args.paragraphs, rng.random()),
+                                           MIME_TYPES[file_type])}})
+        for _ in range(count)
+    ]
+
+
+def compare(report, baseline, tolerance):
+    """Return a description of every scenario that regressed against the baseline"""
+    regressions = []
+    for scenario, levels in report["scenarios"].items():
+        for level, result in levels.items():
+            before = baseline.get("scenarios", {}).get(scenario, {}).get(level)
+            if not before:
+                continue
+            if before.get("p95_ms") and result["p95_ms"] and result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{scenario} at concurrency {level}: p95 {before['p95_ms']}ms -> {result['p95_ms']}ms")
+            if before.get("requests_per_second") and (result["requests_per_second"] or 0) < \
+                    before["requests_per_second"] * (1 - tolerance):
+                regressions.append(f"{scenario} at concurrency {level}: "
+                                   f"{before['requests_per_second']} -> {result['requests_per_second']} requests/s")
+            if result["errors"] > before.get("errors", 0):
+                regressions.append(f"{scenario} at concurrency {level}: {before.get('errors', 0)} -> "
+                                   f"{result['errors']} errors")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["threaded", "asgi"], default="threaded")
+    parser.add_argument("--scenarios", nargs="+", default=["summarize:pdf", "summarize:docx", "summarize:txt", "generate"],
+                        choices=["summarize:pdf", "summarize:docx", "summarize:txt", "generate"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=64, help="requests per scenario and concurrency level")
+    parser.add_argument("--paragraphs", type=int, default=40, help="paragraphs per uploaded document")
+    parser.add_argument("--specs", type=int, default=4, help="question specs per exam")
+    parser.add_argument("--ttft", type=float, default=0.2, help="stub time to first token in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=200, help="stub token rate, 0 for instant")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="stub fraction of cut-off JSON responses")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="stub fraction of HTTP 500 answers")
+    parser.add_argument("--seed", type=int, default=1, help="seed for fixtures and stub faults")
+    parser.add_argument("--out", help="also write the report to this file")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression as a fraction")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    stub_port = free_port()
+    stub = start([
+        sys.executable, os.path.join(ROOT, "benchmarks", "stub_ollama.py"), "--port", str(stub_port),
+        "--ttft", str(args.ttft), "--tokens-per-second", str(args.tokens_per_second),
+        "--malformed-rate", str(args.malformed_rate), "--error-rate", str(args.error_rate), "--seed", str(args.seed)
+    ], stub_port)
+
+    port = free_port()
+    scratch = tempfile.mkdtemp(prefix="exgen-bench-")
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        LLM_API_URL=f"http://127.0.0.1:{stub_port}/api/generate",
+        CACHE_DIR=os.path.join(scratch, "cache"),
+        DATA_DIR=os.path.join(scratch, "data"),
+        GENERATION_CACHE_ENABLED="",
+        LOG_LEVEL="WARNING"
+    )
+    command = [sys.executable, "app.py"]
+    if args.mode == "asgi":
+        command = [sys.executable, "-m", "uvicorn", "asgi:app", "--port", str(port), "--log-level", "warning"]
+    server = start(command, port, env)
+
+    report = {"config": {key: value for key, value in vars(args).items() if key not in ("out", "baseline")},
+              "scenarios": {}}
+    try:
+        for scenario in args.scenarios:
+            report["scenarios"][scenario] = {}
+            for concurrency in args.concurrency:
+                # Fixtures are built before the clock starts
+                requests = prepare(scenario, args.requests, rng, args)
+                result = asyncio.run(run_scenario(f"http://127.0.0.1:{port}", requests, concurrency))
+                report["scenarios"][scenario][str(concurrency)] = result
+        report["stub"] = httpx.get(f"http://127.0.0.1:{stub_port}/stats").json()
+    finally:
+        server.terminate()
+        server.wait()
+        stub.terminate()
+        stub.wait()
+
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as out:
+            json.dump(report, out, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Compare /generate concurrency of the threaded Flask server and the ASGI mode
+
+Both servers talk to the local stub backend, so the run measures how many
+requests each serving mode can keep in flight rather than LLM speed.
+
+Run with:  python benchmarks/load_test.py --requests 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    """Return a TCP port that is currently free on localhost"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    """Block until something accepts connections on port"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout}s")
+
+
+def start(command, port, env=None):
+    """Start a server process and wait until it accepts connections"""
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+    except RuntimeError:
+        process.kill()
+        raise
+    return process
+
+
+def percentile(values, fraction):
+    """Return the value at fraction (0-1) of the sorted values"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def fire(url, total):
+    """Send total /generate requests at once and time them"""
+    payload = {
+        "summary": "Photosynthesis converts light energy into chemical energy stored in glucose.",
+        "questions": [{"type": "multiple_choice", "bloom_level": "Understand", "difficulty": "Medium", "quantity": 1}]
+    }
+    limits = httpx.Limits(max_connections=total, max_keepalive_connections=total)
+    async with httpx.AsyncClient(timeout=600, limits=limits) as client:
+        async def one():
+            started = time.perf_counter()
+            response = await client.post(url, json=payload)
+            return response.status_code, time.perf_counter() - started
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+
+    latencies = [latency for status, latency in results if status == 200]
+    return {
+        "requests": total,
+        "ok": len(latencies),
+        "wall_seconds": round(elapsed, 3),
+        "requests_per_second": round(total / elapsed, 2),
+        "p50_seconds": round(percentile(latencies, 0.5), 3) if latencies else None,
+        "max_seconds": round(max(latencies), 3) if latencies else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="concurrent /generate requests per mode")
+    parser.add_argument("--ttft", type=float, default=1.0, help="stub time to first token in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=0, help="stub token rate, 0 for instant")
+    args = parser.parse_args()
+
+    stub_port = free_port()
+    stub = start([
+        sys.executable, "benchmarks/stub_ollama.py", "--port", str(stub_port),
+        "--ttft", str(args.ttft), "--tokens-per-second", str(args.tokens_per_second)
+    ], stub_port)
+
+    env = dict(
+        os.environ,
+        LLM_API_URL=f"http://127.0.0.1:{stub_port}/api/generate",
+        CACHE_DIR=tempfile.mkdtemp(prefix="exgen-load-"),
+        GENERATION_CACHE_ENABLED=""
+    )
+    modes = {
+        "threaded": lambda port: [sys.executable, "app.py"],
+        "asgi": lambda port: [sys.executable, "-m", "uvicorn", "asgi:app", "--port", str(port), "--log-level", "warning"]
+    }
+
+    report = {}
+    try:
+        for mode, command in modes.items():
+            port = free_port()
+            server = start(command(port), port, dict(env, PORT=str(port)))
+            try:
+                report[mode] = asyncio.run(fire(f"http://127.0.0.1:{port}/generate", args.requests))
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    report["speedup"] = round(report["threaded"]["wall_seconds"] / report["asgi"]["wall_seconds"], 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""Local stand-in for Ollama's streaming /api/generate endpoint
+
+Besides the timing knobs it can cut question responses off mid-JSON and
+answer a fraction of calls with HTTP 500, to exercise the repair and retry
+paths. Give --seed for the same sequence of questions and faults each run.
+
+Run with:  python benchmarks/stub_ollama.py --port 11434 --ttft 0.5 --tokens-per-second 50
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+
+# Canned question that satisfies every question type's schema once its text and answer are filled in
+QUESTION = {
+    "options": ["A. The first option", "B. The second option", "C. The third option", "D. The fourth option"],
+    "explanation": "The first option restates the central claim.",
+    "key_points": ["States the central claim", "Supports it with an example"],
+    "bloom_justification": "Requires explaining the main idea in context.",
+    "grading_criteria": "Award full marks for both key points."
+}
+SUMMARY_RESPONSE = "This document introduces its topic, explains the key concepts, and closes with worked examples."
+TOPIC_WORDS = (
+    "energy light chlorophyll glucose water carbon oxygen membrane enzyme stomata root xylem phloem "
+    "respiration nitrogen protein starch photon pigment thylakoid stroma cycle gradient transport"
+).split()
+REPEATED_QUESTION = "Which statement best describes the main idea of the summary?"
+
+
+# Section headers in a combined prompt, e.g. "section_2: 3 true/false questions"
+SECTION_HEADER = re.compile(r"^(section_\d+): (\d+) (.+?) questions$", re.MULTILINE)
+# How many questions a single-type prompt asks for
+QUANTITY = re.compile(r"Create (?:exactly )?(\d+)")
+
+
+def make_questions(count, answer, duplicate_rate=0.0):
+    """Build count questions with distinct texts, repeating one fixed text at duplicate_rate"""
+    questions = []
+    for _ in range(count):
+        if random.random() < duplicate_rate:
+            text = REPEATED_QUESTION
+        else:
+            first, second, third = random.sample(TOPIC_WORDS, 3)
+            text = f"How does {first} relate to {second} during the {third} stage?"
+        questions.append(dict(QUESTION, question=text, answer=answer))
+    return questions
+
+
+def questions_response(prompt, duplicate_rate=0.0):
+    """Return a JSON question list with answers that suit the prompt's question type
+
+    Combined prompts get one object with a list per section instead.
+    """
+    sections = SECTION_HEADER.findall(prompt)
+    if sections:
+        return json.dumps({
+            key: make_questions(int(quantity), "True" if type_name == "true/false" else "A", duplicate_rate)
+            for key, quantity, type_name in sections
+        })
+    counts = QUANTITY.findall(prompt)
+    answer = "True" if "true/false" in prompt else "A"
+    return json.dumps(make_questions(int(counts[-1]) if counts else 1, answer, duplicate_rate))
+
+
+def malformed_response(text):
+    """Cut a JSON response off partway through, the way a model that stops early leaves it"""
+    return text[:random.randint(len(text) // 3, 2 * len(text) // 3)]
+
+
+def split_tokens(text, size=4):
+    """Split text into fixed-size pieces standing in for model tokens"""
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class StubOllama:
+    """Serve NDJSON generate streams with a configurable time-to-first-token and token rate"""
+
+    def __init__(self, ttft=0.5, tokens_per_second=50.0, prefill_tokens_per_second=0.0, duplicate_rate=0.0,
+                 malformed_rate=0.0, error_rate=0.0):
+        self.ttft = ttft
+        self.duplicate_rate = duplicate_rate
+        self.tokens_per_second = tokens_per_second
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self.malformed_rate = malformed_rate
+        self.error_rate = error_rate
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.malformed = 0
+        self.errors = 0
+
+    async def handle(self, reader, writer):
+        """Serve keep-alive HTTP/1.1 requests on one connection"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                if request_line.startswith(b"GET /stats"):
+                    self.send_stats(writer)
+                    await writer.drain()
+                    continue
+                self.requests += 1
+                await self.respond(json.loads(body or b"{}"), writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, payload, writer):
+        """Stream a generate response for payload using chunked transfer encoding"""
+        if random.random() < self.error_rate:
+            self.errors += 1
+            await asyncio.sleep(self.ttft)
+            body = b'{"error": "injected failure"}'
+            writer.write(b"HTTP/1.1 500 Internal Server Error\r\nContent-Type: application/json\r\n"
+                         b"Content-Length: %d\r\n\r\n%s" % (len(body), body))
+            await writer.drain()
+            return
+
+        prompt = payload.get("prompt", "")
+        text = questions_response(prompt, self.duplicate_rate) if "JSON" in prompt else SUMMARY_RESPONSE
+        if "JSON" in prompt and random.random() < self.malformed_rate:
+            self.malformed += 1
+            text = malformed_response(text)
+        tokens = split_tokens(text)
+        num_predict = payload.get("options", {}).get("num_predict")
+        if num_predict is not None and num_predict >= 0:
+            tokens = tokens[:num_predict]
+
+        # Like Ollama, tokens passed back in "context" are already evaluated; only the new prompt is prefilled
+        context = payload.get("context") or []
+        prompt_eval_count = len(split_tokens(prompt))
+        self.prompt_tokens += prompt_eval_count
+        prefill = prompt_eval_count / self.prefill_tokens_per_second if self.prefill_tokens_per_second else 0
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n")
+        started = time.perf_counter()
+        await asyncio.sleep(self.ttft + prefill)
+        decode_started = time.perf_counter()
+        for token in tokens:
+            self.write_chunk(writer, {"model": payload.get("model"), "response": token, "done": False})
+            await writer.drain()
+            if self.tokens_per_second:
+                await asyncio.sleep(1 / self.tokens_per_second)
+        self.write_chunk(writer, {
+            "model": payload.get("model"),
+            "response": "",
+            "done": True,
+            "prompt_eval_count": prompt_eval_count,
+            "eval_count": len(tokens),
+            # Durations in nanoseconds, as Ollama reports them; the stub never loads a model
+            "load_duration": 0,
+            "prompt_eval_duration": int((decode_started - started) * 1e9),
+            "eval_duration": int((time.perf_counter() - decode_started) * 1e9),
+            "total_duration": int((time.perf_counter() - started) * 1e9),
+            "context": list(range(len(context) + prompt_eval_count + len(tokens)))
+        })
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    def send_stats(self, writer):
+        """Reply to GET /stats with the request, prefill and injected fault counters"""
+        body = json.dumps({
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "malformed": self.malformed,
+            "errors": self.errors
+        }).encode("utf-8")
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+
+    @staticmethod
+    def write_chunk(writer, data):
+        """Write one NDJSON line as an HTTP chunk"""
+        line = json.dumps(data).encode("utf-8") + b"\n"
+        writer.write(b"%x\r\n%s\r\n" % (len(line), line))
+
+    async def serve(self, host="127.0.0.1", port=11434):
+        """Serve until cancelled"""
+        server = await asyncio.start_server(self.handle, host, port, backlog=1024)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--ttft", type=float, default=0.5, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="0 streams as fast as possible")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=0.0,
+                        help="prompt evaluation rate added to the first-token delay, 0 for none")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0,
+                        help="fraction of generated questions that repeat one fixed question")
+    parser.add_argument("--malformed-rate", type=float, default=0.0,
+                        help="fraction of question responses cut off partway through the JSON")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of generate calls answered with HTTP 500")
+    parser.add_argument("--seed", type=int, default=None, help="seed for repeatable questions and faults")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    stub = StubOllama(ttft=args.ttft, tokens_per_second=args.tokens_per_second,
+                      prefill_tokens_per_second=args.prefill_tokens_per_second,
+                      duplicate_rate=args.duplicate_rate, malformed_rate=args.malformed_rate,
+                      error_rate=args.error_rate)
+    try:
+        asyncio.run(stub.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
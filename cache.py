@@ -0,0 +1,240 @@
+"""Persistent result caches used by the exam generator"""
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def content_key(*parts):
+    """Build a stable hex digest from the given key parts"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        # Separator so ("ab", "c") and ("a", "bc") hash differently
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """JSON value cache stored in a SQLite file with size and TTL based eviction"""
+
+    def __init__(self, path, max_entries=1000, ttl=7 * 24 * 3600):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        # One connection shared by the request threads, serialised by the lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+
+    def get(self, key):
+        """Return the cached value for key, or None if it is missing or expired"""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        """Store value under key and evict expired or least recently used entries"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now)
+            )
+            self._evict(now)
+
+    def _evict(self, now):
+        """Drop expired entries, then the least recently used beyond max_entries"""
+        if self.ttl:
+            self._conn.execute("DELETE FROM cache WHERE created_at < ?", (now - self.ttl,))
+        if self.max_entries:
+            self._conn.execute("""
+                DELETE FROM cache WHERE key IN (
+                    SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+
+    def stats(self):
+        """Return hit/miss counters and the current number of entries"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+def compressor(codec):
+    """Return (compress, decompress) functions for "gzip" or "zstd"; zstd needs the zstandard package"""
+    if codec == "gzip":
+        # Level 6 is most of level 9's ratio at a fraction of its cost
+        return (lambda data: gzip.compress(data, compresslevel=6)), gzip.decompress
+    if codec == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstd compression requires the zstandard package (pip install zstandard)")
+        return zstandard.ZstdCompressor(level=3).compress, lambda data: zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"Unknown compression codec: {codec}")
+
+
+class CompressedDiskCache:
+    """Text cache stored compressed in a SQLite file, evicting least recently used entries by total size"""
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, codec="gzip"):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.codec = codec
+        self._compress, _ = compressor(codec)
+        self.hits = 0
+        self.misses = 0
+
+        # One connection shared by the request threads, serialised by the lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    codec TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+
+    def get(self, key):
+        """Return the cached text for key, or None if it is missing"""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT value, codec FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+        # Entries keep the codec they were written with, so changing codecs never strands old ones
+        _, decompress = compressor(row[1])
+        return decompress(row[0]).decode("utf-8")
+
+    def set(self, key, text):
+        """Store text under key, then evict the least recently used entries beyond max_bytes"""
+        # Compress outside the lock so other requests are not held up
+        value = self._compress(text.encode("utf-8"))
+        if self.max_bytes and len(value) > self.max_bytes:
+            return
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, codec, size, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, self.codec, len(value), time.time())
+            )
+            if self.max_bytes:
+                # Keep the most recently used entries whose sizes add up to max_bytes
+                self._conn.execute("""
+                    DELETE FROM cache WHERE key IN (
+                        SELECT key FROM (
+                            SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC, key) AS running FROM cache
+                        ) WHERE running > ?
+                    )
+                """, (self.max_bytes,))
+
+    def stats(self):
+        """Return hit/miss counters, the number of entries and their compressed size"""
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size, "codec": self.codec}
+
+
+class MemoryCache:
+    """Thread-safe in-memory LRU cache"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """Return the cached value for key, or None if it is missing"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+    def set(self, key, value):
+        """Store value under key, evicting the least recently used entry when full"""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """Return hit/miss counters and the current number of entries"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+class TieredCache:
+    """In-memory LRU in front of an optional DiskCache"""
+
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key):
+        """Look in memory first, then on disk, promoting disk hits into memory"""
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        """Store value in every tier"""
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def stats(self):
+        """Return counters for each tier"""
+        stats = {"memory": self.memory.stats()}
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
@@ -0,0 +1,183 @@
+"""Exact and near-duplicate detection for question texts
+
+Exact duplicates are caught by hashing the normalized text. Near duplicates
+use a one-permutation MinHash over character shingles: each shingle is
+hashed once and the smallest hash per bin forms the signature, so building
+a signature costs one hash per shingle regardless of signature length.
+Signatures are banded into an LSH table, so a lookup only compares against
+the few stored questions that share a band.
+"""
+import hashlib
+import re
+import threading
+from collections import defaultdict
+
+_NON_WORD = re.compile(r"[\W_]+")
+_MASK = (1 << 64) - 1
+
+
+def normalize_text(text):
+    """Lowercase text and collapse punctuation and whitespace into single spaces"""
+    return _NON_WORD.sub(" ", str(text).lower()).strip()
+
+
+def question_text(question):
+    """Return the text of a question dict, or the string itself"""
+    if isinstance(question, dict):
+        return question.get("question", "")
+    return question if isinstance(question, str) else ""
+
+
+def iter_question_texts(items):
+    """Yield question texts from strings, question dicts or question sets ({"questions": [...]})"""
+    for item in items or []:
+        if isinstance(item, dict) and isinstance(item.get("questions"), list):
+            yield from iter_question_texts(item["questions"])
+        else:
+            text = question_text(item)
+            if text:
+                yield text
+
+
+def shingle_hashes(normalized, size=5):
+    """Return the 64-bit hashes of the character shingles of normalized text
+
+    Python's string hash is salted per process, so signatures are only
+    comparable within one process; indexes are never persisted.
+    """
+    if len(normalized) <= size:
+        return {hash(normalized) & _MASK}
+    return {hash(normalized[i:i + size]) & _MASK for i in range(len(normalized) - size + 1)}
+
+
+def minhash_signature(normalized, bins=64):
+    """Return a one-permutation MinHash signature of the text's shingles"""
+    # Hashes are split into a bin and a remainder below _MASK, so _MASK marks an empty bin
+    signature = [_MASK] * bins
+    for value in shingle_hashes(normalized):
+        slot = value % bins
+        rest = value // bins
+        if rest < signature[slot]:
+            signature[slot] = rest
+    # Fill empty bins from the next filled one so short texts still compare fairly
+    for slot in range(bins):
+        if signature[slot] == _MASK:
+            for step in range(1, bins):
+                borrowed = signature[(slot + step) % bins]
+                if borrowed != _MASK:
+                    signature[slot] = (borrowed + step * 0x9E3779B97F4A7C15) & _MASK
+                    break
+    return tuple(signature)
+
+
+def signature_similarity(first, second):
+    """Estimate the Jaccard similarity of two texts from their signatures"""
+    return sum(a == b for a, b in zip(first, second)) / len(first)
+
+
+class QuestionIndex:
+    """Thread-safe index of question texts that flags exact and near duplicates
+
+    Two questions count as duplicates when their normalized texts match or
+    their estimated shingle similarity reaches the threshold. A threshold of
+    0 or more than 1 turns near-duplicate matching off.
+    """
+
+    def __init__(self, texts=(), threshold=0.7, bins=64, bands=16):
+        self.threshold = threshold
+        self.bins = bins
+        self.bands = bands
+        self.rows = bins // bands
+        self.near_duplicates = 0 < threshold <= 1
+        self._lock = threading.Lock()
+        self._exact = set()
+        self._signatures = []
+        self._buckets = defaultdict(list)
+        for text in texts:
+            self.add(text)
+
+    def __len__(self):
+        return len(self._exact)
+
+    def _fingerprint(self, text):
+        """Return (exact hash, signature or None) for text"""
+        normalized = normalize_text(text)
+        exact = hashlib.sha1(normalized.encode("utf-8")).digest()
+        signature = minhash_signature(normalized, self.bins) if self.near_duplicates else None
+        return exact, signature
+
+    def _band_keys(self, signature):
+        """Return the LSH bucket keys for a signature"""
+        return [(band, signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+
+    def _matches(self, exact, signature):
+        """Return whether a fingerprint duplicates something already indexed (lock held)"""
+        if exact in self._exact:
+            return True
+        if signature is None:
+            return False
+        candidates = {
+            position
+            for key in self._band_keys(signature)
+            for position in self._buckets.get(key, ())
+        }
+        return any(
+            signature_similarity(signature, self._signatures[position]) >= self.threshold
+            for position in candidates
+        )
+
+    def _insert(self, exact, signature):
+        """Index a fingerprint (lock held)"""
+        self._exact.add(exact)
+        if signature is not None:
+            position = len(self._signatures)
+            self._signatures.append(signature)
+            for key in self._band_keys(signature):
+                self._buckets[key].append(position)
+
+    def add(self, text):
+        """Index text whether or not it is a duplicate"""
+        fingerprint = self._fingerprint(text)
+        with self._lock:
+            self._insert(*fingerprint)
+
+    def contains(self, text):
+        """Return whether text duplicates an indexed question"""
+        fingerprint = self._fingerprint(text)
+        with self._lock:
+            return self._matches(*fingerprint)
+
+    def add_if_new(self, text):
+        """Index text and return True, or return False without indexing it when it is a duplicate"""
+        fingerprint = self._fingerprint(text)
+        with self._lock:
+            if self._matches(*fingerprint):
+                return False
+            self._insert(*fingerprint)
+            return True
+
+    def add_all_if_new(self, texts):
+        """Index every text and return True only if none duplicates the index or each other"""
+        fingerprints = [self._fingerprint(text) for text in texts]
+        with self._lock:
+            added = []
+            for fingerprint in fingerprints:
+                if self._matches(*fingerprint):
+                    break
+                self._insert(*fingerprint)
+                added.append(fingerprint)
+            else:
+                return True
+            # Roll back so a rejected set leaves the index as it was
+            self._remove(added)
+            return False
+
+    def _remove(self, fingerprints):
+        """Drop fingerprints inserted last, in reverse order (lock held)"""
+        for exact, signature in reversed(fingerprints):
+            self._exact.discard(exact)
+            if signature is not None:
+                position = len(self._signatures) - 1
+                self._signatures.pop()
+                for key in self._band_keys(signature):
+                    self._buckets[key].remove(position)
@@ -0,0 +1,227 @@
+"""Text extraction for uploaded documents
+
+Kept free of Flask and app state. Process-pool workers are spawned, so each
+one also re-imports the server's __main__ module: under `python app.py` that
+is the whole app, while under a launcher such as gunicorn or uvicorn it is
+only the launcher. The PDF parser is imported on first use, since it dominates the server's cold
+start. DOCX files are read straight from their XML with the standard library.
+"""
+import io
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from xml.etree import ElementTree
+
+logger = logging.getLogger(__name__)
+
+# Part of every extraction cache key; bump it whenever the extracted text for the same file would change
+EXTRACTOR_VERSION = 4
+
+# Separates PDF pages in extracted text, so the summarizer can chunk on page boundaries
+PAGE_SEPARATOR = "\f"
+
+# Extractors return an error message in place of the text when a file cannot be parsed
+EXTRACTION_ERROR_PREFIX = "Error extracting text from "
+
+# Process pools for page-parallel PDF extraction, created on first use per size
+_pdf_pools = {}
+_pdf_pools_lock = threading.Lock()
+
+
+def get_pdf_pool(workers):
+    """Return the shared process pool with the given number of workers"""
+    with _pdf_pools_lock:
+        if workers not in _pdf_pools:
+            # Spawn rather than fork: the web server process is multi-threaded
+            _pdf_pools[workers] = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pdf_pools[workers]
+
+
+def discard_pdf_pool(workers, pool):
+    """Drop a pool whose worker died, so the next parallel extraction starts a fresh one"""
+    with _pdf_pools_lock:
+        # Another request may already have replaced it
+        if _pdf_pools.get(workers) is pool:
+            del _pdf_pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def extract_pdf_pages(pdf_reader, start=0, stop=None):
+    """Return the text of each page in [start, stop) of an open PDF"""
+    return [page.extract_text() or "" for page in pdf_reader.pages[start:stop]]
+
+
+def extract_pdf_page_range(file_path, start, stop):
+    """Extract a range of pages; runs inside a process-pool worker"""
+    import pypdf
+
+    return extract_pdf_pages(pypdf.PdfReader(file_path), start, stop)
+
+
+def extract_pdf_pages_in_parallel(source, page_count, workers):
+    """Extract all pages of a PDF as page ranges on the shared process pool"""
+    # Worker processes need a path; spill in-memory uploads to a private temp file
+    spilled = None
+    if not isinstance(source, str):
+        source.seek(0)
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as spilled:
+            shutil.copyfileobj(source, spilled)
+        source = spilled.name
+
+    pool = get_pdf_pool(workers)
+    try:
+        # A few ranges per worker keeps the pool busy when page costs are uneven
+        range_size = -(-page_count // (workers * 4))
+        futures = [
+            pool.submit(extract_pdf_page_range, source, start, start + range_size)
+            for start in range(0, page_count, range_size)
+        ]
+        return [page for future in futures for page in future.result()]
+    except BrokenProcessPool:
+        # A crashed worker (e.g. killed for memory) breaks the whole pool for every later request
+        discard_pdf_pool(workers, pool)
+        raise
+    finally:
+        if spilled is not None:
+            os.remove(spilled.name)
+
+
+def extract_text_from_pdf(source, workers=0, parallel_min_pages=50):
+    """Extract text from a PDF path or file-like object, splitting large files into page ranges across processes
+
+    Pages are separated by PAGE_SEPARATOR.
+    """
+    try:
+        import pypdf
+
+        pdf_reader = pypdf.PdfReader(source)
+        page_count = len(pdf_reader.pages)
+
+        pages = None
+        if workers > 1 and page_count >= parallel_min_pages:
+            try:
+                pages = extract_pdf_pages_in_parallel(source, page_count, workers)
+            except BrokenProcessPool:
+                logger.warning("pdf worker pool broke, extracting serially", exc_info=True)
+        if pages is None:
+            pages = extract_pdf_pages(pdf_reader)
+
+        text = PAGE_SEPARATOR.join(pages) + "\n"
+        logger.debug("extracted pdf", extra={"pages": page_count, "chars": len(text)})
+    except Exception as e:
+        logger.warning("pdf extraction failed", exc_info=True)
+        text = f"{EXTRACTION_ERROR_PREFIX}PDF: {str(e)}"
+    return text
+
+
+# WordprocessingML and markup-compatibility element tags
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+W_BODY, W_P, W_TC, W_R, W_T, W_TAB, W_PTAB, W_BR, W_CR, W_NO_BREAK_HYPHEN = (
+    _W + name for name in ("body", "p", "tc", "r", "t", "tab", "ptab", "br", "cr", "noBreakHyphen")
+)
+W_TYPE = _W + "type"
+MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+
+# Text of the run content elements that stand for a fixed character
+RUN_CHARACTERS = {W_TAB: "\t", W_PTAB: "\t", W_CR: "\n", W_NO_BREAK_HYPHEN: "-"}
+
+
+def iter_docx_paragraphs(source):
+    """Yield each body paragraph and table cell of a DOCX path or file-like object in reading order
+
+    word/document.xml is parsed incrementally and each finished block is
+    discarded, so memory stays flat however long the document is. Only run
+    content is read, as python-docx does. A cell's paragraphs are joined with
+    newlines; nested tables are read into the cell that holds them, and text
+    box paragraphs follow the paragraph they are anchored in.
+    """
+    # Open paragraphs and table cells, innermost last. A paragraph holds its text runs, how many runs
+    # are open in it and the blocks nested inside it; a cell only holds its blocks.
+    open_blocks = []
+    body = None
+    body_depth = depth = 0
+    # Depth inside an mc:Fallback, which repeats its mc:Choice (Word writes every text box twice)
+    fallback_depth = 0
+    with zipfile.ZipFile(source) as archive, archive.open("word/document.xml") as document:
+        for event, element in ElementTree.iterparse(document, events=("start", "end")):
+            tag = element.tag
+            if event == "start":
+                depth += 1
+                if fallback_depth or tag == MC_FALLBACK:
+                    fallback_depth += 1
+                elif tag == W_P:
+                    open_blocks.append({"parts": [], "runs": 0, "blocks": []})
+                elif tag == W_TC:
+                    open_blocks.append({"blocks": []})
+                elif tag == W_R and open_blocks and "parts" in open_blocks[-1]:
+                    open_blocks[-1]["runs"] += 1
+                elif tag == W_BODY:
+                    body, body_depth = element, depth
+                continue
+
+            finished = None
+            if fallback_depth:
+                fallback_depth -= 1
+                element.clear()
+            elif tag == W_P:
+                paragraph = open_blocks.pop()
+                finished = ["".join(paragraph["parts"])] + paragraph["blocks"]
+                element.clear()
+            elif tag == W_TC:
+                finished = ["\n".join(open_blocks.pop()["blocks"])]
+                element.clear()
+            elif open_blocks and open_blocks[-1].get("runs"):
+                # Text is only complete once its element has ended, and only run content counts
+                paragraph = open_blocks[-1]
+                if tag == W_R:
+                    paragraph["runs"] -= 1
+                elif tag == W_T:
+                    paragraph["parts"].append(element.text or "")
+                elif tag == W_BR:
+                    # Page and column breaks have no text
+                    paragraph["parts"].append("\n" if element.get(W_TYPE, "textWrapping") == "textWrapping" else "")
+                elif tag in RUN_CHARACTERS:
+                    paragraph["parts"].append(RUN_CHARACTERS[tag])
+
+            if finished is not None:
+                if open_blocks:
+                    open_blocks[-1]["blocks"].extend(finished)
+                else:
+                    yield from finished
+
+            # Drop each finished top-level block so the tree never grows past one of them
+            if body is not None and depth == body_depth + 1:
+                body.clear()
+            depth -= 1
+
+
+def extract_text_from_docx(source):
+    """Extract the text of a DOCX path or file-like object, tables included"""
+    try:
+        # Written as it streams so only the finished text is held, not a list of every paragraph
+        buffer = io.StringIO()
+        paragraphs = 0
+        for paragraph in iter_docx_paragraphs(source):
+            buffer.write(paragraph)
+            buffer.write("\n")
+            paragraphs += 1
+        text = buffer.getvalue()
+        logger.debug("extracted docx", extra={"paragraphs": paragraphs, "chars": len(text)})
+    except Exception as e:
+        logger.warning("docx extraction failed", exc_info=True)
+        text = f"{EXTRACTION_ERROR_PREFIX}DOCX: {str(e)}"
+    return text
+
+
+def is_extraction_error(text):
+    """Check whether an extractor returned its error message rather than the document's text"""
+    return text.startswith(EXTRACTION_ERROR_PREFIX)
@@ -0,0 +1,157 @@
+"""Background job queue for long-running exam generation"""
+import heapq
+import itertools
+import threading
+import time
+import uuid
+
+
+class QueueFullError(Exception):
+    """Raised when the queue already holds its maximum number of pending jobs"""
+
+
+class Job:
+    """A queued unit of work and its progress"""
+
+    def __init__(self, payload, client_id, priority=0):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.client_id = client_id
+        self.priority = priority
+        self.status = "queued"
+        self.completed = 0
+        self.total = 0
+        self.results = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def report(self, results, completed, total):
+        """Record partial results from the running handler"""
+        self.results = list(results)
+        self.completed = completed
+        self.total = total
+
+    def snapshot(self):
+        """Return the job's state as a JSON-serialisable dict"""
+        return {
+            "id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "progress": {"completed": self.completed, "total": self.total},
+            "results": self.results,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+
+class JobQueue:
+    """Bounded worker pool that runs jobs by priority, round-robin across clients
+
+    Each client has its own queue, ordered by priority and then submission
+    order. Workers take the highest-priority job at the head of any client's
+    queue; ties go to the client served least recently, so one client's burst
+    cannot starve the others. Priorities are clamped to
+    [-max_priority, max_priority], so no client can outrank everyone by
+    picking a bigger number. Finished jobs are moved to store (anything with
+    get/set, e.g. a DiskCache with a TTL).
+    """
+
+    def __init__(self, handler, store, workers=2, max_pending=100, max_priority=2):
+        self.handler = handler
+        self.store = store
+        self.max_pending = max_pending
+        self.max_priority = max_priority
+        self._lock = threading.Condition()
+        # Per-client heaps of (-priority, submission order, job)
+        self._queues = {}
+        self._order = itertools.count()
+        self._last_served = {}
+        self._active = {}
+        self._pending = 0
+        self._workers = [
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, payload, client_id, priority=0):
+        """Queue a job and return it; raises QueueFullError when the queue is full"""
+        job = Job(payload, client_id, max(-self.max_priority, min(self.max_priority, priority)))
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError(f"Job queue is full ({self.max_pending} pending jobs)")
+            # Forget idle clients once the fairness table grows large
+            if len(self._last_served) > 10 * self.max_pending:
+                self._last_served = {
+                    client: served for client, served in self._last_served.items() if client in self._queues
+                }
+            heapq.heappush(self._queues.setdefault(client_id, []), (-job.priority, next(self._order), job))
+            self._active[job.id] = job
+            self._pending += 1
+            self._lock.notify()
+        return job
+
+    def get(self, job_id):
+        """Return a snapshot of the job, or None if it is unknown or expired"""
+        with self._lock:
+            job = self._active.get(job_id)
+            if job is not None:
+                return job.snapshot()
+        return self.store.get(job_id)
+
+    def stats(self):
+        """Return queue depth and running job counts"""
+        with self._lock:
+            return {
+                "pending": self._pending,
+                "running": len(self._active) - self._pending,
+                "clients": sum(1 for queue in self._queues.values() if queue)
+            }
+
+    def _next_job(self):
+        """Pop the next job to run; the caller holds the lock"""
+        best_client = None
+        for client_id, queue in self._queues.items():
+            if not queue:
+                continue
+            if best_client is None:
+                best_client = client_id
+                continue
+            head, best = queue[0][0], self._queues[best_client][0][0]
+            if (head, self._last_served.get(client_id, 0)) < (best, self._last_served.get(best_client, 0)):
+                best_client = client_id
+
+        _, _, job = heapq.heappop(self._queues[best_client])
+        if not self._queues[best_client]:
+            del self._queues[best_client]
+        self._last_served[best_client] = time.monotonic()
+        self._pending -= 1
+        return job
+
+    def _work(self):
+        """Worker loop: run jobs until the process exits"""
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._lock.wait()
+                job = self._next_job()
+                job.status = "running"
+                job.started_at = time.time()
+
+            try:
+                job.results = self.handler(job)
+                job.status = "completed"
+            except Exception as e:
+                job.error = str(e)
+                job.status = "failed"
+            job.finished_at = time.time()
+
+            # Hand the finished job over to the store, which owns expiry
+            self.store.set(job.id, job.snapshot())
+            with self._lock:
+                del self._active[job.id]
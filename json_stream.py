@@ -0,0 +1,113 @@
+"""Incremental parser for the JSON question lists streamed back by the LLM"""
+import json
+import re
+
+# Characters that matter outside and inside JSON strings
+_OBJECT_TOKENS = re.compile(r'[{}"]')
+_STRING_TOKENS = re.compile(r'["\\]')
+
+
+class QuestionStreamParser:
+    """Pull complete top-level JSON objects out of streamed text as soon as each one closes
+
+    Tracks brace depth and string/escape state across chunks, so each
+    character is scanned once no matter how the stream is split. Text
+    outside objects (chatter, code fences, the enclosing list) is ignored.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.malformed = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._parts = []
+
+    def feed(self, text):
+        """Consume the next piece of the stream and return the objects it completed"""
+        objects = []
+        pos = 0
+        end = len(text)
+        start = 0 if self._depth else None
+
+        # An escape backslash ended the previous chunk; skip the escaped character
+        if self._escape and text:
+            self._escape = False
+            pos = 1
+
+        # Fast path for the common case: a chunk in the middle of an object that changes no state
+        if self._depth and pos == 0:
+            if self._in_string:
+                quiet = '"' not in text and "\\" not in text
+            else:
+                quiet = "{" not in text and "}" not in text and '"' not in text
+            if quiet:
+                self._parts.append(text)
+                return objects
+
+        while pos < end:
+            if self._depth == 0:
+                start = text.find("{", pos)
+                if start == -1:
+                    break
+                self.started = True
+                self._depth = 1
+                pos = start + 1
+            elif self._in_string:
+                match = _STRING_TOKENS.search(text, pos)
+                if match is None:
+                    break
+                if match.group() == "\\":
+                    pos = match.end() + 1
+                    self._escape = pos > end
+                else:
+                    self._in_string = False
+                    pos = match.end()
+            else:
+                match = _OBJECT_TOKENS.search(text, pos)
+                if match is None:
+                    break
+                pos = match.end()
+                token = match.group()
+                if token == '"':
+                    self._in_string = True
+                elif token == "{":
+                    self._depth += 1
+                else:
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self._parts.append(text[start:pos])
+                        objects.extend(self._decode("".join(self._parts)))
+                        self._parts = []
+                        start = None
+
+        # Keep the unfinished object's text for the next chunk
+        if self._depth and start is not None:
+            self._parts.append(text[start:])
+        return objects
+
+    def _decode(self, raw):
+        """Decode one complete object, unwrapping {"questions": [...]} style wrappers"""
+        try:
+            obj = json.loads(raw)
+        except json.JSONDecodeError:
+            self.malformed += 1
+            return []
+        if "question" not in obj:
+            for value in obj.values():
+                if isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+                    return value
+        return [obj]
+
+
+def parse_sections(text):
+    """Return the top-level JSON object in text, or {} when there is none"""
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1 or end < start:
+        return {}
+    try:
+        obj = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return {}
+    return obj if isinstance(obj, dict) else {}
@@ -0,0 +1,500 @@
+"""LLM backend spread over one or more Ollama endpoints
+
+Endpoints, balancing, health checks and the model used for each task come
+from a YAML/JSON file named by LLM_CONFIG, or from environment variables:
+
+    endpoints:
+      - url: http://ollama-1:11434/api/generate
+        max_concurrency: 4
+      - url: http://ollama-2:11434/api/generate
+        models: [llama3.2:1b]          # only route these models here
+    balancing: least_outstanding      # or round_robin
+    health_check_interval: 30         # seconds, 0 disables active checks
+    models:
+      default: llama3.2:3b
+      summarize: llama3.2:1b
+"""
+import asyncio
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit, urlunsplit
+
+from llm_client import (
+    AsyncLLMClient,
+    CircuitBreaker,
+    CircuitOpenError,
+    LLMClient,
+    backoff_delay,
+    chunk_usage,
+    context_payload,
+    prompt_context
+)
+from metrics import LLM_BACKEND_SECONDS, LLM_CALLS, LLM_TOKENS
+
+DEFAULT_API_URL = "https://ollama-y2elcua3ga-uc.a.run.app/api/generate"
+DEFAULT_MODEL = "llama3.2:3b"
+BALANCING_POLICIES = ("least_outstanding", "round_robin")
+
+
+def read_config_file(path):
+    """Load a backend config file; YAML needs PyYAML, JSON does not"""
+    with open(path, encoding="utf-8") as config_file:
+        if path.endswith(".json"):
+            return json.load(config_file)
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError("YAML backend configs require PyYAML (pip install pyyaml)")
+        return yaml.safe_load(config_file) or {}
+
+
+def load_backend_config(path=None, environ=None):
+    """Return the normalized backend config from the file at path (or LLM_CONFIG), else from the environment"""
+    environ = os.environ if environ is None else environ
+    path = path or environ.get("LLM_CONFIG")
+    if path:
+        config = read_config_file(path)
+    else:
+        max_concurrency = int(environ.get("LLM_ENDPOINT_MAX_CONCURRENCY", 0))
+        config = {
+            # LLM_API_URL may list several replicas separated by commas
+            "endpoints": [
+                {"url": url.strip(), "max_concurrency": max_concurrency}
+                for url in environ.get("LLM_API_URL", DEFAULT_API_URL).split(",") if url.strip()
+            ],
+            "balancing": environ.get("LLM_BALANCING", "least_outstanding"),
+            "health_check_interval": float(environ.get("LLM_HEALTH_CHECK_INTERVAL", 0)),
+            "models": {
+                "default": environ.get("LLM_MODEL", DEFAULT_MODEL),
+                "summarize": environ.get("LLM_SUMMARY_MODEL"),
+                "questions": environ.get("LLM_QUESTION_MODEL")
+            }
+        }
+
+    endpoints = config.get("endpoints") or []
+    if not endpoints:
+        raise ValueError("The LLM backend config needs at least one endpoint")
+    balancing = config.get("balancing", "least_outstanding")
+    if balancing not in BALANCING_POLICIES:
+        raise ValueError(f"Unknown LLM balancing policy: {balancing}")
+
+    models = {task: model for task, model in (config.get("models") or {}).items() if model}
+    models.setdefault("default", DEFAULT_MODEL)
+    return {
+        "endpoints": [
+            {
+                "url": endpoint["url"],
+                "max_concurrency": int(endpoint.get("max_concurrency", 0)),
+                "health_url": endpoint.get("health_url"),
+                "headers": endpoint.get("headers") or {},
+                "models": list(endpoint.get("models") or [])
+            }
+            for endpoint in (item if isinstance(item, dict) else {"url": item} for item in endpoints)
+        ],
+        "balancing": balancing,
+        "health_check_interval": float(config.get("health_check_interval", 0)),
+        "models": models
+    }
+
+
+def default_health_url(url):
+    """Derive Ollama's /api/tags URL from a generate URL"""
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme, parts.netloc, "/api/tags", "", ""))
+
+
+class TokenUsage:
+    """Token counts and backend timings summed over LLM calls"""
+
+    FIELDS = ("prompt_tokens", "completion_tokens", "load_seconds", "prompt_eval_seconds", "eval_seconds",
+              "total_seconds")
+
+    def __init__(self):
+        self.calls = 0
+        self.totals = dict.fromkeys(self.FIELDS, 0)
+        self._lock = threading.Lock()
+
+    def add(self, usage):
+        """Add one call's usage, as returned by chunk_usage"""
+        with self._lock:
+            self.calls += 1
+            for field in self.FIELDS:
+                self.totals[field] += usage[field]
+
+    def as_dict(self):
+        """Return the totals with prefill and decode throughput in tokens per second"""
+        with self._lock:
+            totals = dict(self.totals)
+            calls = self.calls
+        # Backends that report counts without durations leave the rates out
+        rates = {
+            "prefill_tokens_per_second": (totals["prompt_tokens"], totals["prompt_eval_seconds"]),
+            "decode_tokens_per_second": (totals["completion_tokens"], totals["eval_seconds"])
+        }
+        return {
+            "calls": calls,
+            **{field: round(value, 3) if isinstance(value, float) else value for field, value in totals.items()},
+            **{name: round(tokens / seconds, 1) for name, (tokens, seconds) in rates.items() if seconds}
+        }
+
+
+_request_usage = contextvars.ContextVar("request_usage", default=None)
+
+
+@contextmanager
+def measure_usage():
+    """Sum the usage of every LLM call made in this context, including threads started with a copy of it"""
+    usage = TokenUsage()
+    token = _request_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _request_usage.reset(token)
+
+
+def record_call_usage(endpoint, model, usage):
+    """Charge one call's usage to its endpoint and model, the metrics, and the active request, if any"""
+    endpoint.record_usage(model, usage)
+    LLM_CALLS.inc(endpoint=endpoint.url, model=model)
+    LLM_TOKENS.inc(usage["prompt_tokens"], endpoint=endpoint.url, model=model, kind="prompt")
+    LLM_TOKENS.inc(usage["completion_tokens"], endpoint=endpoint.url, model=model, kind="completion")
+    for phase in ("load", "prompt_eval", "eval"):
+        LLM_BACKEND_SECONDS.inc(usage[f"{phase}_seconds"], endpoint=endpoint.url, model=model, phase=phase)
+    request_usage = _request_usage.get()
+    if request_usage is not None:
+        request_usage.add(usage)
+
+
+class Endpoint:
+    """One backend replica with its own concurrency limit, circuit breaker and health state"""
+
+    def __init__(self, url, max_concurrency=0, health_url=None, headers=None, models=None, breaker=None):
+        self.url = url
+        self.max_concurrency = max_concurrency
+        self.health_url = health_url or default_health_url(url)
+        self.headers = headers or {}
+        self.models = set(models or [])
+        self.breaker = breaker or CircuitBreaker()
+        self.healthy = True
+        self.outstanding = 0
+        self.served = 0
+        self.usage = {}
+        self._usage_lock = threading.Lock()
+
+    def serves(self, model):
+        """Return whether requests for model may be routed here"""
+        return not self.models or model in self.models
+
+    @property
+    def has_capacity(self):
+        """Return whether another call fits under the concurrency limit (0 means unlimited)"""
+        return not self.max_concurrency or self.outstanding < self.max_concurrency
+
+    def record_usage(self, model, usage):
+        """Add one call's token usage to this endpoint's totals for model"""
+        with self._usage_lock:
+            totals = self.usage.setdefault(model, TokenUsage())
+        totals.add(usage)
+
+    def snapshot(self):
+        """Return the endpoint's state for the stats route"""
+        with self._usage_lock:
+            usage = dict(self.usage)
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "circuit": self.breaker.state,
+            "outstanding": self.outstanding,
+            "max_concurrency": self.max_concurrency,
+            "served": self.served,
+            "usage": {model: totals.as_dict() for model, totals in usage.items()}
+        }
+
+
+class EndpointPool:
+    """Choose an endpoint per call and track calls in flight, shared by the sync and async backends"""
+
+    def __init__(self, endpoints, balancing="least_outstanding", health_check_interval=0, health_timeout=5):
+        self.endpoints = endpoints
+        self.balancing = balancing
+        self.health_timeout = health_timeout
+        self._condition = threading.Condition()
+        self._rotation = itertools.count()
+        self._stop = threading.Event()
+        if health_check_interval > 0:
+            threading.Thread(
+                target=self._run_health_checks,
+                args=(health_check_interval,),
+                name="llm-health",
+                daemon=True
+            ).start()
+
+    def _usable(self, model):
+        """Return the endpoints that serve model and whose circuit lets calls through"""
+        return [endpoint for endpoint in self.endpoints if endpoint.serves(model) and endpoint.breaker.available]
+
+    def _candidates(self, model, exclude=()):
+        """Return the endpoints a call for model may use, preferring untried then healthy ones"""
+        usable = self._usable(model)
+        if not usable:
+            raise CircuitOpenError(f"No LLM endpoint is available for {model}")
+        # A retry goes back to an endpoint that already failed it only when no other one is left
+        usable = [endpoint for endpoint in usable if endpoint not in exclude] or usable
+        # When every check is failing, keep trying rather than refusing all calls
+        return [endpoint for endpoint in usable if endpoint.healthy] or usable
+
+    def has_untried(self, model, exclude):
+        """Return whether an endpoint outside exclude could take a call for model"""
+        return any(endpoint not in exclude for endpoint in self._usable(model))
+
+    def try_acquire(self, model, exclude=()):
+        """Reserve a slot on an endpoint for model, returning None when all of them are at their limit
+
+        Endpoints in exclude are only chosen when no other one is usable.
+        """
+        with self._condition:
+            free = [endpoint for endpoint in self._candidates(model, exclude) if endpoint.has_capacity]
+            if not free:
+                return None
+            if self.balancing == "round_robin":
+                endpoint = free[next(self._rotation) % len(free)]
+            else:
+                # Rotate the start so ties do not always land on the first endpoint
+                offset = next(self._rotation) % len(free)
+                endpoint = min(free[offset:] + free[:offset], key=lambda candidate: candidate.outstanding)
+            endpoint.outstanding += 1
+            endpoint.served += 1
+            return endpoint
+
+    def acquire(self, model, exclude=()):
+        """Reserve a slot on an endpoint for model, waiting while every endpoint is at its limit"""
+        with self._condition:
+            while True:
+                endpoint = self.try_acquire(model, exclude)
+                if endpoint is not None:
+                    return endpoint
+                # Re-check periodically too, since breakers re-open without a release
+                self._condition.wait(1.0)
+
+    def release(self, endpoint):
+        """Return a slot taken by acquire or try_acquire"""
+        with self._condition:
+            endpoint.outstanding -= 1
+            self._condition.notify_all()
+
+    def check_health(self):
+        """Probe every endpoint once"""
+        import requests
+
+        for endpoint in self.endpoints:
+            try:
+                response = requests.get(endpoint.health_url, headers=endpoint.headers, timeout=self.health_timeout)
+                endpoint.healthy = response.status_code < 500
+            except requests.RequestException:
+                endpoint.healthy = False
+
+    def _run_health_checks(self, interval):
+        """Probe the endpoints every interval seconds until stopped"""
+        while not self._stop.wait(interval):
+            self.check_health()
+
+    def stop(self):
+        """Stop the background health checks"""
+        self._stop.set()
+
+    def stats(self):
+        """Return the balancing policy and each endpoint's state"""
+        with self._condition:
+            return {"balancing": self.balancing, "endpoints": [endpoint.snapshot() for endpoint in self.endpoints]}
+
+
+def build_endpoint_pool(config, failure_threshold=5, reset_timeout=30):
+    """Create the endpoint pool described by a config from load_backend_config"""
+    endpoints = [
+        Endpoint(
+            endpoint["url"],
+            max_concurrency=endpoint["max_concurrency"],
+            health_url=endpoint["health_url"],
+            headers=endpoint["headers"],
+            models=endpoint["models"],
+            breaker=CircuitBreaker(failure_threshold, reset_timeout)
+        )
+        for endpoint in config["endpoints"]
+    ]
+    return EndpointPool(endpoints, config["balancing"], config["health_check_interval"])
+
+
+class LLMBackend:
+    """LLMClient-compatible calls spread over an endpoint pool, with a model chosen per task
+
+    Retries happen here rather than in the per-endpoint clients, so a call
+    that fails on one replica moves to another instead of retrying the same
+    one until its circuit opens.
+    """
+
+    def __init__(self, pool, models, headers=None, pool_size=10, connect_timeout=5, read_timeout=120,
+                 max_retries=3, keep_alive=None, backoff_base=0.5, backoff_max=8):
+        self.pool = pool
+        self.models = models
+        self.headers = headers or {}
+        self.keep_alive = keep_alive
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.clients = {}
+        for endpoint in pool.endpoints:
+            self.clients[endpoint.url] = LLMClient(
+                endpoint.url,
+                {**self.headers, **endpoint.headers},
+                pool_size=pool_size,
+                connect_timeout=connect_timeout,
+                read_timeout=read_timeout,
+                max_retries=0,
+                breaker=endpoint.breaker,
+                keep_alive=keep_alive
+            )
+
+    def model_for(self, task):
+        """Return the model configured for task, falling back to the default model"""
+        return self.models.get(task) or self.models["default"]
+
+    def stream(self, payload):
+        """Yield each decoded chunk of a streamed generate call, recording its token usage
+
+        A call that fails before its first chunk with a connection error, a
+        5xx or an open circuit is retried on an endpoint it has not tried yet,
+        backing off only once every usable endpoint has failed it.
+        """
+        model = payload["model"]
+        tried = []
+        for attempt in range(self.max_retries + 1):
+            endpoint = self.pool.acquire(model, tried)
+            client = self.clients[endpoint.url]
+            streamed = False
+            try:
+                for chunk in client.stream(payload):
+                    streamed = True
+                    usage = chunk_usage(chunk)
+                    if usage is not None:
+                        record_call_usage(endpoint, model, usage)
+                    yield chunk
+                return
+            except Exception as e:
+                # Chunks already passed on cannot be taken back, so only a call that never started is retried
+                if streamed or attempt == self.max_retries or not client.is_retryable(e):
+                    raise
+                tried.append(endpoint)
+            finally:
+                self.pool.release(endpoint)
+            if not self.pool.has_untried(model, tried):
+                time.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max))
+
+    def complete(self, payload):
+        """Run a generate payload and return the full generated text"""
+        return "".join(chunk.get("response", "") for chunk in self.stream(payload))
+
+    def generate(self, model, prompt):
+        """Run a prompt against model and return the full generated text"""
+        return self.complete({"model": model, "prompt": prompt})
+
+    def encode_context(self, model, prompt):
+        """Evaluate prompt once and return the context tokens later calls can continue from"""
+        # Streamed here rather than through the client so the prefill is counted like any other call
+        context = []
+        for chunk in self.stream(context_payload(model, prompt)):
+            if chunk.get("done"):
+                context = prompt_context(chunk)
+        return context
+
+
+class AsyncLLMBackend:
+    """Asyncio counterpart of LLMBackend, sharing its endpoint pool and circuit breakers"""
+
+    def __init__(self, backend, pool_size=100):
+        self.pool = backend.pool
+        self.models = backend.models
+        self.model_for = backend.model_for
+        self.max_retries = backend.max_retries
+        self.backoff_base = backend.backoff_base
+        self.backoff_max = backend.backoff_max
+        self.clients = {
+            endpoint.url: AsyncLLMClient(
+                endpoint.url,
+                {**backend.headers, **endpoint.headers},
+                pool_size=pool_size,
+                connect_timeout=backend.connect_timeout,
+                read_timeout=backend.read_timeout,
+                max_retries=0,
+                breaker=endpoint.breaker,
+                keep_alive=backend.keep_alive
+            )
+            for endpoint in self.pool.endpoints
+        }
+
+    async def acquire(self, model, exclude=()):
+        """Reserve an endpoint slot without blocking the event loop"""
+        # Slots are released from threads too, so poll with a short backoff instead of waiting on the condition
+        delay = 0.005
+        while True:
+            endpoint = self.pool.try_acquire(model, exclude)
+            if endpoint is not None:
+                return endpoint
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    async def stream(self, payload):
+        """Async counterpart of LLMBackend.stream, failing over between endpoints the same way"""
+        model = payload["model"]
+        tried = []
+        for attempt in range(self.max_retries + 1):
+            endpoint = await self.acquire(model, tried)
+            client = self.clients[endpoint.url]
+            streamed = False
+            try:
+                async for chunk in client.stream(payload):
+                    streamed = True
+                    usage = chunk_usage(chunk)
+                    if usage is not None:
+                        record_call_usage(endpoint, model, usage)
+                    yield chunk
+                return
+            except Exception as e:
+                # Chunks already passed on cannot be taken back, so only a call that never started is retried
+                if streamed or attempt == self.max_retries or not client.is_retryable(e):
+                    raise
+                tried.append(endpoint)
+            finally:
+                self.pool.release(endpoint)
+            if not self.pool.has_untried(model, tried):
+                await asyncio.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max))
+
+    async def complete(self, payload):
+        """Run a generate payload and return the full generated text"""
+        parts = []
+        async for chunk in self.stream(payload):
+            parts.append(chunk.get("response", ""))
+        return "".join(parts)
+
+    async def generate(self, model, prompt):
+        """Run a prompt against model and return the full generated text"""
+        return await self.complete({"model": model, "prompt": prompt})
+
+    async def encode_context(self, model, prompt):
+        """Async counterpart of LLMBackend.encode_context"""
+        context = []
+        async for chunk in self.stream(context_payload(model, prompt)):
+            if chunk.get("done"):
+                context = prompt_context(chunk)
+        return context
+
+    async def aclose(self):
+        """Close every endpoint's connection pool"""
+        for client in self.clients.values():
+            await client.aclose()
@@ -0,0 +1,315 @@
+"""Shared HTTP client for the LLM backend
+
+requests and httpx are imported on first use, so they stay off the
+cold-start path; httpx is only needed for the async (ASGI) serving mode.
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+
+
+def with_keep_alive(payload, keep_alive):
+    """Ask the backend to keep the model (and its prompt cache) loaded between calls"""
+    if keep_alive is None or "keep_alive" in payload:
+        return payload
+    return dict(payload, keep_alive=keep_alive)
+
+
+def chunk_usage(chunk):
+    """Return the token counts and backend timings (in seconds) from a generate call's final chunk,
+    or None for any other chunk"""
+    if not chunk.get("done"):
+        return None
+    # Ollama reports durations in nanoseconds
+    return {
+        "prompt_tokens": int(chunk.get("prompt_eval_count") or 0),
+        "completion_tokens": int(chunk.get("eval_count") or 0),
+        "load_seconds": (chunk.get("load_duration") or 0) / 1e9,
+        "prompt_eval_seconds": (chunk.get("prompt_eval_duration") or 0) / 1e9,
+        "eval_seconds": (chunk.get("eval_duration") or 0) / 1e9,
+        "total_seconds": (chunk.get("total_duration") or 0) / 1e9
+    }
+
+
+def backoff_delay(attempt, backoff_base, backoff_max):
+    """Return a jittered exponential backoff for the given retry attempt"""
+    return random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+
+
+def context_payload(model, prompt):
+    """Build a payload that evaluates prompt while generating as little as possible"""
+    # Some Ollama versions read num_predict 0 as "no limit", so one token is generated and trimmed by prompt_context
+    return {"model": model, "prompt": prompt, "options": {"num_predict": 1}}
+
+
+def prompt_context(chunk):
+    """Return the context tokens of a context_payload call's final chunk, without the tokens it generated
+
+    Calls continuing from the context then follow the prompt itself rather than a stray response token.
+    """
+    context = chunk.get("context") or []
+    generated = int(chunk.get("eval_count") or 0)
+    return context[:len(context) - generated] if 0 < generated <= len(context) else context
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker is refusing calls to a failing backend"""
+
+
+class CircuitBreaker:
+    """Stop calling a backend after repeated failures, then let a trial call through"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+
+    def allow(self):
+        """Return whether a call may be made right now"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                # Half-open: let one trial call through and re-arm the timer
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        """Close the circuit after a successful call"""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        """Count a failed call, opening the circuit once the threshold is reached"""
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+    @property
+    def available(self):
+        """Return whether allow() would currently let a call through, without changing the state"""
+        with self._lock:
+            return self._opened_at is None or time.monotonic() - self._opened_at >= self.reset_timeout
+
+    @property
+    def state(self):
+        """Return 'closed' or 'open'"""
+        with self._lock:
+            return "closed" if self._opened_at is None else "open"
+
+
+class LLMClient:
+    """Pooled, keep-alive client for Ollama's streaming /api/generate endpoint"""
+
+    def __init__(self, api_url, headers=None, pool_size=10, connect_timeout=5, read_timeout=120,
+                 max_retries=3, backoff_base=0.5, backoff_max=8, breaker=None, keep_alive=None):
+        self.api_url = api_url
+        self.keep_alive = keep_alive
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.headers = headers or {}
+        self.pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        """Return the pooled session, creating it on the first call"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    # One session so connections (and their TLS handshakes) are reused across calls
+                    session = requests.Session()
+                    session.headers.update(self.headers)
+                    adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+    def _backoff(self, attempt):
+        """Sleep for a jittered exponential backoff before the next attempt"""
+        time.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max))
+
+    @staticmethod
+    def is_retryable(error):
+        """Return whether a failed call may succeed if made again, here or on another replica"""
+        import requests
+
+        if isinstance(error, requests.HTTPError):
+            return error.response is not None and error.response.status_code >= 500
+        return isinstance(error, (CircuitOpenError, requests.ConnectionError, requests.Timeout))
+
+    def _post(self, payload):
+        """POST the payload, retrying connection errors and 5xx responses"""
+        import requests
+
+        payload = with_keep_alive(payload, self.keep_alive)
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"LLM backend circuit is open after repeated failures: {self.api_url}")
+            try:
+                response = self.session.post(
+                    self.api_url,
+                    json=payload,
+                    stream=True,
+                    timeout=(self.connect_timeout, self.read_timeout)
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise
+                self._backoff(attempt)
+                continue
+
+            if response.status_code >= 500:
+                self.breaker.record_failure()
+                response.close()
+                if attempt == self.max_retries:
+                    response.raise_for_status()
+                self._backoff(attempt)
+                continue
+
+            # Client errors are not retried and say nothing about backend health
+            response.raise_for_status()
+            self.breaker.record_success()
+            return response
+
+    def stream(self, payload):
+        """Yield each decoded chunk of a streamed generate call"""
+        response = self._post(payload)
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if line:
+                    yield json.loads(line)
+
+    def complete(self, payload):
+        """Run a generate payload and return the full generated text"""
+        return "".join(chunk.get("response", "") for chunk in self.stream(payload))
+
+    def generate(self, model, prompt):
+        """Run a prompt against model and return the full generated text"""
+        return self.complete({"model": model, "prompt": prompt})
+
+    def encode_context(self, model, prompt):
+        """Have the backend evaluate prompt once and return its context tokens for later calls to continue from
+
+        Returns an empty list when the backend does not report a context.
+        """
+        context = []
+        for chunk in self.stream(context_payload(model, prompt)):
+            if chunk.get("done"):
+                context = prompt_context(chunk)
+        return context
+
+
+class AsyncLLMClient:
+    """Asyncio counterpart of LLMClient for the ASGI serving mode"""
+
+    def __init__(self, api_url, headers=None, pool_size=100, connect_timeout=5, read_timeout=120,
+                 max_retries=3, backoff_base=0.5, backoff_max=8, breaker=None, keep_alive=None):
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError("The async serving mode requires httpx (pip install httpx)")
+        self.api_url = api_url
+        self.keep_alive = keep_alive
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+
+        # Connections are multiplexed over the event loop, so the pool can be much larger
+        self.client = httpx.AsyncClient(
+            headers=headers or {},
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+
+    async def _backoff(self, attempt):
+        """Wait for a jittered exponential backoff before the next attempt"""
+        await asyncio.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max))
+
+    @staticmethod
+    def is_retryable(error):
+        """Return whether a failed call may succeed if made again, here or on another replica"""
+        import httpx
+
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code >= 500
+        return isinstance(error, (CircuitOpenError, httpx.ConnectError, httpx.TimeoutException,
+                                  httpx.RemoteProtocolError))
+
+    async def stream(self, payload):
+        """Yield each decoded chunk of a streamed generate call"""
+        import httpx
+
+        payload = with_keep_alive(payload, self.keep_alive)
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"LLM backend circuit is open after repeated failures: {self.api_url}")
+            try:
+                request = self.client.build_request("POST", self.api_url, json=payload)
+                response = await self.client.send(request, stream=True)
+            except (httpx.ConnectError, httpx.TimeoutException, httpx.RemoteProtocolError):
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise
+                await self._backoff(attempt)
+                continue
+
+            if response.status_code >= 500:
+                self.breaker.record_failure()
+                await response.aclose()
+                if attempt == self.max_retries:
+                    response.raise_for_status()
+                await self._backoff(attempt)
+                continue
+
+            try:
+                # Client errors are not retried and say nothing about backend health
+                response.raise_for_status()
+                self.breaker.record_success()
+                async for line in response.aiter_lines():
+                    if line:
+                        yield json.loads(line)
+            finally:
+                await response.aclose()
+            return
+
+    async def complete(self, payload):
+        """Run a generate payload and return the full generated text"""
+        parts = []
+        async for chunk in self.stream(payload):
+            parts.append(chunk.get("response", ""))
+        return "".join(parts)
+
+    async def generate(self, model, prompt):
+        """Run a prompt against model and return the full generated text"""
+        return await self.complete({"model": model, "prompt": prompt})
+
+    async def encode_context(self, model, prompt):
+        """Async counterpart of LLMClient.encode_context"""
+        context = []
+        async for chunk in self.stream(context_payload(model, prompt)):
+            if chunk.get("done"):
+                context = prompt_context(chunk)
+        return context
+
+    async def aclose(self):
+        """Close the underlying connection pool"""
+        await self.client.aclose()
@@ -0,0 +1,233 @@
+"""In-process metrics rendered in the Prometheus text exposition format
+
+A deliberately small registry: counters, gauges and histograms with fixed
+label names, safe to update from request threads and the event loop. The
+metrics the server records are defined at the bottom of this module.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; LLM calls run far longer than the rest, so the top buckets stretch to minutes
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def escape_label_value(value):
+    """Escape a label value as the exposition format requires"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=()):
+    """Render {name="value",...} for a sample, or nothing when it has no labels"""
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label_value(value)}"' for name, value in pairs) + "}"
+
+
+def format_value(value):
+    """Render a sample value, keeping integers free of a trailing .0"""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    """Base for a named metric with one child per combination of label values"""
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels):
+        """Return the label values for labels, in labelnames order"""
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """Yield (suffix, label values, extra labels, value) for every sample"""
+        raise NotImplementedError
+
+    def render(self):
+        """Return the metric's HELP, TYPE and sample lines"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            samples = list(self.samples())
+        for suffix, values, extra, value in samples:
+            lines.append(f"{self.name}{suffix}{format_labels(self.labelnames, values, extra)} {format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """A value that only goes up; by convention its name ends in _total"""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        """Add amount to the counter for labels"""
+        key = self._key(labels)
+        with self._lock:
+            self._children[key] = self._children.get(key, 0) + amount
+
+    def samples(self):
+        for values, value in sorted(self._children.items()):
+            yield "", values, (), value
+
+
+class Gauge(Metric):
+    """A value that goes up and down, such as work in flight"""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        """Set the gauge for labels"""
+        key = self._key(labels)
+        with self._lock:
+            self._children[key] = value
+
+    def inc(self, amount=1, **labels):
+        """Add amount to the gauge for labels"""
+        key = self._key(labels)
+        with self._lock:
+            self._children[key] = self._children.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        """Subtract amount from the gauge for labels"""
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels):
+        """Count the enclosed block as in flight while it runs"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self):
+        for values, value in sorted(self._children.items()):
+            yield "", values, (), value
+
+
+class Histogram(Metric):
+    """Observations counted into cumulative buckets, with their sum and count"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        """Record one observation for labels"""
+        key = self._key(labels)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                # Per-bucket counts, then sum and count
+                child = self._children[key] = [[0] * len(self.buckets), 0.0, 0]
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    child[0][position] += 1
+                    break
+            child[1] += value
+            child[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the enclosed block takes"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        for values, (counts, total, count) in sorted(self._children.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield "_bucket", values, (("le", format_value(bound)),), cumulative
+            yield "_bucket", values, (("le", "+Inf"),), count
+            yield "_sum", values, (), total
+            yield "_count", values, (), count
+
+
+class Registry:
+    """The set of metrics rendered together on one endpoint"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Add a metric to the registry"""
+        with self._lock:
+            if any(existing.name == metric.name for existing in self._metrics):
+                raise ValueError(f"Duplicate metric: {metric.name}")
+            self._metrics.append(metric)
+
+    def render(self):
+        """Return every metric in the Prometheus text format"""
+        with self._lock:
+            metrics = list(self._metrics)
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+# Content type Prometheus expects for the text format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "exgen_http_request_seconds", "Time to serve a request, including a streamed body",
+    ("route", "method", "status")
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "exgen_http_requests_in_flight", "Requests being served", ("route",)
+)
+DOCUMENT_STAGE_SECONDS = Histogram(
+    "exgen_document_stage_seconds", "Time spent in each /summarize stage: upload_parse, extract, summarize",
+    ("stage", "file_type")
+)
+GENERATION_STAGE_SECONDS = Histogram(
+    "exgen_generation_stage_seconds", "Time spent in each generation stage: prompt_build, parse_validate",
+    ("stage", "question_type", "bloom_level")
+)
+LLM_FIRST_TOKEN_SECONDS = Histogram(
+    "exgen_llm_time_to_first_token_seconds", "Time from sending an LLM call to its first streamed chunk",
+    ("task", "question_type", "bloom_level")
+)
+LLM_CALL_SECONDS = Histogram(
+    "exgen_llm_call_seconds", "Total time of an LLM call, to its last streamed chunk",
+    ("task", "question_type", "bloom_level")
+)
+LLM_CALLS_IN_FLIGHT = Gauge(
+    "exgen_llm_calls_in_flight", "LLM calls currently streaming", ("task",)
+)
+LLM_ENDPOINT_OUTSTANDING = Gauge(
+    "exgen_llm_endpoint_outstanding", "Calls holding a slot on each LLM endpoint", ("endpoint",)
+)
+LLM_ENDPOINT_HEALTHY = Gauge(
+    "exgen_llm_endpoint_healthy", "Whether each LLM endpoint passed its last health check (1) or not (0)",
+    ("endpoint",)
+)
+LLM_CALLS = Counter(
+    "exgen_llm_calls_total", "LLM calls that reported token usage, per endpoint and model", ("endpoint", "model")
+)
+LLM_TOKENS = Counter(
+    "exgen_llm_tokens_total", "Tokens evaluated (prompt) and generated (completion) per endpoint and model",
+    ("endpoint", "model", "kind")
+)
+LLM_BACKEND_SECONDS = Counter(
+    "exgen_llm_backend_seconds_total",
+    "Backend-reported time loading the model, evaluating prompts and generating tokens, per endpoint and model",
+    ("endpoint", "model", "phase")
+)
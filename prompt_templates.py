@@ -0,0 +1,411 @@
+"""Prompt templates for question generation
+
+The Bloom's taxonomy and difficulty guidance tables are immutable module
+data. Each (question type, Bloom's level, difficulty) combination is
+compiled once into the static text either side of the quantity, so
+rendering a prompt only joins the summary, the compiled text and the
+quantity. Render counts and time are recorded per request when a
+measure_renders() block is active.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from types import MappingProxyType
+
+from metrics import GENERATION_STAGE_SECONDS
+
+
+def freeze(value):
+    """Return a read-only copy of nested dicts and lists"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+BLOOM_GUIDANCE = freeze({
+    "Remember": {
+        "description": "Focus on recalling facts, terms, basic concepts, or answers without necessarily understanding them.",
+        "verbs": ["define", "list", "memorize", "recall", "repeat", "identify", "name", "state", "label", "recognize"],
+        "example_stems": [
+            "What is the definition of...?",
+            "Who discovered...?",
+            "When did ___ happen?",
+            "List the main components of...",
+            "Identify the key features of..."
+        ]
+    },
+    "Understand": {
+        "description": "Focus on demonstrating understanding of facts and ideas by organizing, comparing, translating, interpreting, giving descriptions, and stating main ideas.",
+        "verbs": ["explain", "describe", "interpret", "summarize", "translate", "classify", "compare", "contrast", "paraphrase"],
+        "example_stems": [
+            "Explain the concept of...",
+            "Summarize the main points of...",
+            "How would you compare...?",
+            "What is the main idea of...?",
+            "Describe in your own words what..."
+        ]
+    },
+    "Apply": {
+        "description": "Focus on using acquired knowledge to solve problems in new situations by applying acquired knowledge, facts, techniques and rules.",
+        "verbs": ["apply", "use", "implement", "solve", "demonstrate", "compute", "calculate", "illustrate", "show"],
+        "example_stems": [
+            "How would you use ___ to solve...?",
+            "Calculate the result when...",
+            "Apply the concept of ___ to...",
+            "What would happen if...?",
+            "What examples can you find to...?"
+        ]
+    },
+    "Analyze": {
+        "description": "Focus on examining and breaking information into parts by identifying motives or causes; making inferences and finding evidence to support generalizations.",
+        "verbs": ["analyze", "differentiate", "distinguish", "examine", "categorize", "compare", "contrast", "investigate", "break down"],
+        "example_stems": [
+            "What are the parts or features of...?",
+            "How would you categorize...?",
+            "What evidence supports...?",
+            "What is the relationship between...?",
+            "Analyze why... occurred."
+        ]
+    },
+    "Evaluate": {
+        "description": "Focus on presenting and defending opinions by making judgments about information, validity of ideas, or quality of work based on a set of criteria.",
+        "verbs": ["evaluate", "judge", "critique", "justify", "defend", "recommend", "prioritize", "rate", "assess", "validate"],
+        "example_stems": [
+            "What is your opinion of...?",
+            "How would you evaluate the effectiveness of...?",
+            "Judge the value of... according to...",
+            "What criteria would you use to assess...?",
+            "How would you prioritize... based on...?"
+        ]
+    },
+    "Create": {
+        "description": "Focus on compiling information together in a different way by combining elements in a new pattern or proposing alternative solutions.",
+        "verbs": ["create", "design", "develop", "formulate", "construct", "imagine", "propose", "devise", "invent", "compose"],
+        "example_stems": [
+            "How would you design a new...?",
+            "What alternative would you propose for...?",
+            "Develop a plan to...",
+            "Create a new model that...",
+            "How would you compose a ___ that...?"
+        ]
+    }
+})
+
+DIFFICULTY_GUIDANCE = freeze({
+    "Easy": {
+        "description": "Focus on basic recall and simple comprehension. Use straightforward language and obvious connections.",
+        "characteristics": [
+            "Direct questions with clear answers",
+            "Focus on main concepts only",
+            "Minimal complexity",
+            "Obvious connections between concepts",
+            "Uses familiar examples"
+        ]
+    },
+    "Medium": {
+        "description": "Focus on deeper understanding and application. Requires some analysis but with clear parameters.",
+        "characteristics": [
+            "Requires understanding beyond simple recall",
+            "May involve multiple concepts",
+            "Moderate complexity",
+            "Some inference required",
+            "May need application to new situations"
+        ]
+    },
+    "Hard": {
+        "description": "Focus on complex analysis, synthesis, or evaluation. Requires deeper thinking and connections.",
+        "characteristics": [
+            "Requires synthesis of multiple concepts",
+            "High complexity",
+            "Significant critical thinking required",
+            "May involve ambiguity or nuance",
+            "Requires connections between disparate ideas"
+        ]
+    }
+})
+
+# Per question type: the name used in prompts, the requirements heading, whether
+# example stems are shown, the numbered requirements, the JSON format to return,
+# and the one-line item format and rule used in combined prompts.
+# Requirements and formats may refer to {bloom_level} and {difficulty}.
+QUESTION_TEMPLATES = freeze({
+    "multiple_choice": {
+        "name": "multiple-choice",
+        "heading": "MULTIPLE CHOICE",
+        "stems": False,
+        "requirements": [
+            "Each question MUST truly reflect the {bloom_level} cognitive level",
+            "For higher cognitive levels, focus on application, comparison, evaluation rather than simple recall",
+            "Create exactly 4 options per question labeled A, B, C, D",
+            "ONLY ONE option should be correct",
+            "All distractors (wrong options) must be plausible",
+            "Avoid obvious wrong answers or silly distractors",
+            "For '{difficulty}' difficulty, make options appropriately challenging",
+            "The options should be distinct from one another (not overlapping)",
+            "Provide a clear explanation for why the correct answer is right and others are wrong",
+            "Include a clear justification explaining how the question meets the {bloom_level} level of Bloom's taxonomy"
+        ],
+        "format": """[
+  {{
+    "question": "The question text",
+    "options": ["A. First option", "B. Second option", "C. Third option", "D. Fourth option"],
+    "answer": "The letter of the correct option (A, B, C, or D)",
+    "explanation": "Explanation of why this answer is correct and others are wrong",
+    "bloom_justification": "Explanation of how this question aligns with the {bloom_level} level of Bloom's taxonomy"
+  }}
+]""",
+        "combined_name": "multiple-choice",
+        "item_format": '{"question": "...", "options": ["A. ...", "B. ...", "C. ...", "D. ..."], "answer": "A, B, C, or D", "explanation": "...", "bloom_justification": "..."}',
+        "combined_rule": "Exactly 4 options labeled A, B, C, D with ONLY ONE correct option and plausible distractors"
+    },
+    "true_or_false": {
+        "name": "true/false",
+        "heading": "TRUE/FALSE",
+        "stems": False,
+        "requirements": [
+            "Each question MUST truly reflect the {bloom_level} cognitive level",
+            "Statements must be fully true or fully false, with no ambiguity",
+            "Avoid absolutes like \"always\" or \"never\" unless truly appropriate",
+            "For false statements, ensure they're plausibly false (not obviously wrong)",
+            "For higher cognitive levels, focus on relationships, implications, or applications rather than simple facts",
+            "Include nuanced statements that require proper understanding, not just memorization",
+            "For '{difficulty}' difficulty, follow the difficulty guidance provided"
+        ],
+        "format": """[
+  {{
+    "question": "Statement that is either true or false",
+    "answer": "True or False",
+    "explanation": "Brief explanation of why this is true or false",
+    "bloom_justification": "Brief explanation of how this question meets the {bloom_level} level"
+  }}
+]""",
+        "combined_name": "true/false",
+        "item_format": '{"question": "Statement that is either true or false", "answer": "True or False", "explanation": "...", "bloom_justification": "..."}',
+        "combined_rule": "Statements must be fully true or fully false, with no ambiguity"
+    },
+    "identification": {
+        "name": "identification/fill-in-the-blank",
+        "heading": "IDENTIFICATION",
+        "stems": False,
+        "requirements": [
+            "Each question MUST truly reflect the {bloom_level} cognitive level",
+            "The blank or identification must be central to understanding the concept",
+            "For \"Remember\" level: Focus on key terms, definitions, or specific facts",
+            "For \"Understand\" level: Focus on explaining relationships or meanings",
+            "For \"Apply\" level: Focus on using concepts in specific contexts",
+            "For \"Analyze\" level: Focus on breaking down components or relationships",
+            "For \"Evaluate\" level: Focus on making judgments based on criteria",
+            "For \"Create\" level: Focus on generating new ideas or perspectives",
+            "For '{difficulty}' difficulty, make questions progressively more complex as specified"
+        ],
+        "format": """[
+  {{
+    "question": "Question asking to identify a term, concept, or fill in a blank",
+    "answer": "The correct answer",
+    "explanation": "Brief explanation of why this answer is correct",
+    "bloom_justification": "Brief explanation of how this question meets the {bloom_level} level"
+  }}
+]""",
+        "combined_name": "identification/fill-in-the-blank",
+        "item_format": '{"question": "...", "answer": "The correct answer", "explanation": "...", "bloom_justification": "..."}',
+        "combined_rule": "The blank or identification must be central to understanding the concept"
+    },
+    "open_ended": {
+        "name": "open-ended",
+        "heading": "OPEN-ENDED",
+        "stems": True,
+        "requirements": [
+            "Each question MUST truly reflect the {bloom_level} cognitive level without exception",
+            "For \"Remember/Understand\" levels: Questions should require explanation of concepts in own words",
+            "For \"Apply\" level: Questions should ask students to apply concepts to new situations",
+            "For \"Analyze\" level: Questions should require breaking down concepts or comparing elements",
+            "For \"Evaluate\" level: Questions should require making judgments based on criteria",
+            "For \"Create\" level: Questions should require generating new ideas, plans, or perspectives",
+            "Include challenging prompts appropriate for '{difficulty}' difficulty",
+            "Use the verbs and stems provided as guidance for the appropriate cognitive level",
+            "The sample answer should demonstrate the depth expected at this cognitive level",
+            "Key points must be concrete, assessable elements that would be in a quality answer"
+        ],
+        "format": """[
+  {{
+    "question": "Open-ended question that requires a detailed response",
+    "answer": "Sample or model answer that demonstrates expected depth and quality",
+    "key_points": ["Key point 1 that must be included in a quality answer", "Key point 2", "Key point 3"],
+    "bloom_justification": "Brief explanation of how this question meets the {bloom_level} level",
+    "grading_criteria": "Brief guidance on how to evaluate student responses"
+  }}
+]""",
+        "combined_name": "open-ended",
+        "item_format": '{"question": "...", "answer": "Sample answer", "key_points": ["Key point 1", "Key point 2"], "bloom_justification": "...", "grading_criteria": "..."}',
+        "combined_rule": "Key points must be concrete, assessable elements of a quality answer"
+    }
+})
+
+QUESTION_PROMPT = """
+BLOOM'S TAXONOMY LEVEL: {bloom_level}
+{bloom_description}
+Appropriate verbs to use: {verbs}
+{stems}
+DIFFICULTY LEVEL: {difficulty}
+{difficulty_description}
+
+Create {quantity} high-quality {name} questions at the {bloom_level} level of Bloom's taxonomy with {difficulty} difficulty based on the summary above.
+
+STRICT REQUIREMENTS FOR {heading} QUESTIONS:
+{requirements}
+
+Return JSON in this exact format:
+{format}
+Only return valid JSON with NO additional explanations or text.
+"""
+
+COMBINED_SECTION = """section_{number}: {quantity} {name} questions
+BLOOM'S TAXONOMY LEVEL: {bloom_level} - {bloom_description}
+Appropriate verbs to use: {verbs}
+DIFFICULTY LEVEL: {difficulty} - {difficulty_description}
+Each item: {item_format}
+"""
+
+# Stands in for the per-render values while compiling, then marks where they go
+_SLOT = "\0"
+
+# Compiled templates kept; Bloom's level and difficulty come from requests, so the cache is bounded
+COMPILED_TEMPLATE_CACHE_SIZE = 512
+
+
+def get_bloom_taxonomy_guidance(bloom_level):
+    """Return specific guidance for creating questions at different Bloom's taxonomy levels"""
+    return BLOOM_GUIDANCE.get(bloom_level, BLOOM_GUIDANCE["Understand"])
+
+
+def bloom_level_label(bloom_level):
+    """Return the metric label for a requested Bloom's level, folding unknown levels into "other"
+
+    Levels come straight from requests, so labelling by the raw value would add series without limit.
+    """
+    return bloom_level if not bloom_level or bloom_level in BLOOM_GUIDANCE else "other"
+
+
+def get_difficulty_guidance(difficulty):
+    """Return specific guidance for creating questions at different difficulty levels"""
+    return DIFFICULTY_GUIDANCE.get(difficulty, DIFFICULTY_GUIDANCE["Medium"])
+
+
+def summary_preamble(summary):
+    """Return the opening every question prompt shares, so the backend can reuse it across prompts"""
+    return f"""
+As an expert educator, you will write exam questions based on this summary:
+
+{summary}
+"""
+
+
+def guidance_fields(q_type, bloom_level, difficulty):
+    """Return the template fields that depend only on a spec's type, Bloom's level and difficulty"""
+    template = QUESTION_TEMPLATES[q_type]
+    bloom_guidance = get_bloom_taxonomy_guidance(bloom_level)
+    difficulty_guidance = get_difficulty_guidance(difficulty)
+    stems = ""
+    if template["stems"]:
+        stems = "Example question stems: \n" + "".join(f"- {stem}\n" for stem in bloom_guidance["example_stems"][:2])
+    return {
+        "bloom_level": bloom_level,
+        "bloom_description": bloom_guidance["description"],
+        "verbs": ", ".join(bloom_guidance["verbs"][:5]),
+        "stems": stems,
+        "difficulty": difficulty,
+        "difficulty_description": difficulty_guidance["description"],
+        "name": template["name"],
+        "heading": template["heading"],
+        "requirements": "\n".join(
+            f"{number}. {requirement.format(bloom_level=bloom_level, difficulty=difficulty)}"
+            for number, requirement in enumerate(template["requirements"], 1)
+        ),
+        "format": template["format"].format(bloom_level=bloom_level, difficulty=difficulty),
+        "item_format": template["item_format"]
+    }
+
+
+@lru_cache(maxsize=COMPILED_TEMPLATE_CACHE_SIZE)
+def compile_question_prompt(q_type, bloom_level, difficulty):
+    """Return the static text before and after the quantity in a question prompt"""
+    head, tail = QUESTION_PROMPT.format(
+        quantity=_SLOT, **guidance_fields(q_type, bloom_level, difficulty)
+    ).split(_SLOT)
+    return head, tail
+
+
+@lru_cache(maxsize=COMPILED_TEMPLATE_CACHE_SIZE)
+def compile_combined_section(q_type, bloom_level, difficulty):
+    """Return a combined-prompt section's static text split around its number and quantity"""
+    return tuple(COMBINED_SECTION.format(
+        number=_SLOT, quantity=_SLOT, **{
+            **guidance_fields(q_type, bloom_level, difficulty),
+            "name": QUESTION_TEMPLATES[q_type]["combined_name"]
+        }
+    ).split(_SLOT))
+
+
+class RenderCost:
+    """Prompts rendered, and the time spent rendering them, during one request"""
+
+    def __init__(self):
+        self.renders = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        """Record one render"""
+        with self._lock:
+            self.renders += 1
+            self.seconds += seconds
+
+
+_render_cost = contextvars.ContextVar("render_cost", default=None)
+
+
+@contextmanager
+def measure_renders():
+    """Record every prompt rendered in this context, including threads started with a copy of it"""
+    cost = RenderCost()
+    token = _render_cost.set(cost)
+    try:
+        yield cost
+    finally:
+        _render_cost.reset(token)
+
+
+def record_render(started, question_type="", bloom_level=""):
+    """Charge a render that began at started (a perf_counter reading) to the active request, if any,
+    and to the prompt_build stage metric"""
+    seconds = time.perf_counter() - started
+    GENERATION_STAGE_SECONDS.observe(
+        seconds, stage="prompt_build", question_type=question_type, bloom_level=bloom_level_label(bloom_level)
+    )
+    cost = _render_cost.get()
+    if cost is not None:
+        cost.add(seconds)
+
+
+def build_question_prompt(q_type, summary, quantity, difficulty, bloom_level):
+    """Build a question prompt without recording a render, for estimates of prompts that are never sent"""
+    head, tail = compile_question_prompt(q_type, bloom_level, difficulty)
+    return summary_preamble(summary) + head + str(quantity) + tail
+
+
+def render_question_prompt(q_type, summary, quantity, difficulty, bloom_level):
+    """Render the prompt asking for quantity questions of one type, level and difficulty"""
+    started = time.perf_counter()
+    prompt = build_question_prompt(q_type, summary, quantity, difficulty, bloom_level)
+    record_render(started, q_type, bloom_level)
+    return prompt
+
+
+def render_combined_section(number, q_type, quantity, difficulty, bloom_level):
+    """Render one numbered section of a combined prompt"""
+    before_number, before_quantity, rest = compile_combined_section(q_type, bloom_level, difficulty)
+    return before_number + str(number) + before_quantity + str(quantity) + rest
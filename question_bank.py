@@ -0,0 +1,308 @@
+"""Persistent question bank stored in SQLite
+
+Questions are keyed by the hash of their source document and indexed by
+type, Bloom's level and difficulty, so assembling an exam from stored
+questions is a handful of indexed lookups. Question and answer text is
+also indexed with FTS5 for search when the SQLite build provides it.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from dedup import normalize_text
+from question_schema import is_placeholder
+
+
+class SetNotFoundError(Exception):
+    """Raised when questions are saved into a set id that does not exist"""
+
+
+def check_question_sets(question_sets):
+    """Raise ValueError unless question_sets is a list of {type, questions} dicts the bank can store"""
+    if not isinstance(question_sets, list):
+        raise ValueError("'question_sets' must be a list")
+    for position, question_set in enumerate(question_sets):
+        if not isinstance(question_set, dict):
+            raise ValueError(f"question_sets[{position}] must be an object")
+        if not isinstance(question_set.get("type"), str) or not question_set["type"].strip():
+            raise ValueError(f"question_sets[{position}] is missing its 'type'")
+        if not isinstance(question_set.get("questions", []), list):
+            raise ValueError(f"question_sets[{position}].questions must be a list")
+        for number, question in enumerate(question_set.get("questions", [])):
+            if not isinstance(question, dict) or not isinstance(question.get("question", ""), str):
+                raise ValueError(f"question_sets[{position}].questions[{number}] must be an object with a text 'question'")
+        for field in ("bloom_level", "difficulty"):
+            if not isinstance(question_set.get(field, ""), str):
+                raise ValueError(f"question_sets[{position}].{field} must be a string")
+
+
+def fts_query(text):
+    """Quote each word so user input is matched literally rather than as FTS syntax"""
+    return " ".join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+
+class QuestionBank:
+    """Stored questions, grouped into named sets, with indexed retrieval and full-text search"""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        # One connection shared by the request threads, serialised by the lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS questions (
+                    id INTEGER PRIMARY KEY,
+                    source_hash TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    bloom_level TEXT NOT NULL,
+                    difficulty TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    answer TEXT NOT NULL DEFAULT '',
+                    data TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    used_count INTEGER NOT NULL DEFAULT 0,
+                    UNIQUE (source_hash, type, text_hash)
+                );
+                CREATE INDEX IF NOT EXISTS questions_lookup
+                    ON questions (source_hash, type, bloom_level, difficulty, used_count);
+                CREATE TABLE IF NOT EXISTS question_sets (
+                    id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    source_hash TEXT,
+                    created_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS set_questions (
+                    set_id TEXT NOT NULL REFERENCES question_sets (id) ON DELETE CASCADE,
+                    question_id INTEGER NOT NULL REFERENCES questions (id) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    PRIMARY KEY (set_id, question_id)
+                );
+                CREATE INDEX IF NOT EXISTS set_questions_question ON set_questions (question_id);
+            """)
+
+            # Full-text search is optional; some SQLite builds lack FTS5
+            try:
+                self._conn.executescript("""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts
+                        USING fts5(question, answer, content='questions', content_rowid='id');
+                    CREATE TRIGGER IF NOT EXISTS questions_fts_insert AFTER INSERT ON questions BEGIN
+                        INSERT INTO questions_fts (rowid, question, answer) VALUES (new.id, new.question, new.answer);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS questions_fts_delete AFTER DELETE ON questions BEGIN
+                        INSERT INTO questions_fts (questions_fts, rowid, question, answer)
+                            VALUES ('delete', old.id, old.question, old.answer);
+                    END;
+                """)
+                self.full_text = True
+            except sqlite3.OperationalError:
+                self.full_text = False
+
+    @staticmethod
+    def _question(row):
+        """Turn a questions row back into the question dict it was saved from, tagged with its bank id"""
+        question = json.loads(row["data"])
+        question["bank_id"] = row["id"]
+        return question
+
+    def _insert_question(self, source_hash, q_type, bloom_level, difficulty, question):
+        """Store one question unless the same text is already banked for this source and type (lock held)
+
+        Returns (question id, whether it was new).
+        """
+        data = {key: value for key, value in question.items() if key != "bank_id"}
+        text_hash = hashlib.sha1(normalize_text(data.get("question", "")).encode("utf-8")).hexdigest()
+        cursor = self._conn.execute("""
+            INSERT OR IGNORE INTO questions
+                (source_hash, type, bloom_level, difficulty, question, answer, data, text_hash, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            source_hash, q_type, bloom_level, difficulty,
+            data.get("question", ""), str(data.get("answer", "")), json.dumps(data), text_hash, time.time()
+        ))
+        if cursor.rowcount:
+            return cursor.lastrowid, True
+        row = self._conn.execute(
+            "SELECT id FROM questions WHERE source_hash = ? AND type = ? AND text_hash = ?",
+            (source_hash, q_type, text_hash)
+        ).fetchone()
+        return row["id"], False
+
+    def save(self, source_hash, question_sets, set_id=None, set_name=None):
+        """Bank every question in question_sets ([{type, bloom_level, difficulty, questions}]),
+        adding them to an existing set, a new named set, or no set
+
+        Raises ValueError for malformed question sets and SetNotFoundError for an unknown set_id.
+        """
+        check_question_sets(question_sets)
+        saved = duplicates = 0
+        with self._lock, self._conn:
+            if set_id is None and set_name:
+                set_id = uuid.uuid4().hex
+                self._conn.execute(
+                    "INSERT INTO question_sets (id, name, source_hash, created_at) VALUES (?, ?, ?, ?)",
+                    (set_id, set_name, source_hash, time.time())
+                )
+            elif set_id is not None and self._conn.execute(
+                    "SELECT 1 FROM question_sets WHERE id = ?", (set_id,)).fetchone() is None:
+                raise SetNotFoundError(set_id)
+
+            position = 0
+            if set_id is not None:
+                position = self._conn.execute(
+                    "SELECT COALESCE(MAX(position), -1) + 1 FROM set_questions WHERE set_id = ?", (set_id,)
+                ).fetchone()[0]
+
+            for question_set in question_sets:
+                q_type = question_set["type"].lower()
+                bloom_level = question_set.get("bloom_level", "Understand")
+                difficulty = question_set.get("difficulty", "Medium")
+                for question in question_set.get("questions", []):
+                    # Placeholders and errors are never worth banking
+                    if is_placeholder(question) or not question.get("question"):
+                        continue
+                    question_id, new = self._insert_question(source_hash, q_type, bloom_level, difficulty, question)
+                    saved += new
+                    duplicates += not new
+                    if set_id is not None:
+                        inserted = self._conn.execute(
+                            "INSERT OR IGNORE INTO set_questions (set_id, question_id, position) VALUES (?, ?, ?)",
+                            (set_id, question_id, position)
+                        ).rowcount
+                        position += inserted
+        return {"set_id": set_id, "saved": saved, "duplicates": duplicates}
+
+    def search(self, source_hash=None, q_type=None, bloom_level=None, difficulty=None, text=None,
+               limit=50, offset=0):
+        """Return stored questions matching every given filter, best full-text matches first"""
+        clauses = []
+        params = []
+        for column, value in (("q.source_hash", source_hash), ("q.type", q_type),
+                              ("q.bloom_level", bloom_level), ("q.difficulty", difficulty)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+
+        join = ""
+        order = "q.id DESC"
+        if text:
+            if self.full_text:
+                join = "JOIN questions_fts ON questions_fts.rowid = q.id"
+                clauses.append("questions_fts MATCH ?")
+                params.append(fts_query(text))
+                order = "bm25(questions_fts)"
+            else:
+                clauses.append("(q.question LIKE ? OR q.answer LIKE ?)")
+                params.extend([f"%{text}%"] * 2)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        query = f"""
+            SELECT q.id, q.source_hash, q.type, q.bloom_level, q.difficulty, q.data
+            FROM questions q {join} {where}
+            ORDER BY {order} LIMIT ? OFFSET ?
+        """
+        with self._lock:
+            rows = self._conn.execute(query, params + [limit, offset]).fetchall()
+        return [
+            {
+                "source_hash": row["source_hash"],
+                "type": row["type"],
+                "bloom_level": row["bloom_level"],
+                "difficulty": row["difficulty"],
+                "question": self._question(row)
+            }
+            for row in rows
+        ]
+
+    def pick(self, source_hash, q_type, bloom_level, difficulty, quantity, exclude_ids=()):
+        """Return up to quantity stored questions for a spec, least used first, and count them as used"""
+        exclude_ids = list(exclude_ids)
+        placeholders = ",".join("?" * len(exclude_ids))
+        exclude = f"AND id NOT IN ({placeholders})" if exclude_ids else ""
+        with self._lock, self._conn:
+            rows = self._conn.execute(f"""
+                SELECT id, data FROM questions
+                WHERE source_hash = ? AND type = ? AND bloom_level = ? AND difficulty = ? {exclude}
+                ORDER BY used_count, RANDOM() LIMIT ?
+            """, [source_hash, q_type, bloom_level, difficulty] + exclude_ids + [int(quantity)]).fetchall()
+            self._conn.executemany(
+                "UPDATE questions SET used_count = used_count + 1 WHERE id = ?",
+                [(row["id"],) for row in rows]
+            )
+        return [self._question(row) for row in rows]
+
+    def saved_question_texts(self, source_hash):
+        """Return the text of every question from the source document that is in at least one saved set"""
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT q.question FROM questions q
+                WHERE q.source_hash = ? AND EXISTS (SELECT 1 FROM set_questions sq WHERE sq.question_id = q.id)
+            """, (source_hash,)).fetchall()
+        return [row["question"] for row in rows]
+
+    def list_sets(self, limit=50, offset=0):
+        """Return a page of saved sets, newest first, with their question counts and types but not their questions"""
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT s.id, s.name, s.source_hash, s.created_at, COUNT(sq.question_id) AS question_count,
+                       GROUP_CONCAT(DISTINCT q.type) AS types
+                FROM question_sets s
+                LEFT JOIN set_questions sq ON sq.set_id = s.id
+                LEFT JOIN questions q ON q.id = sq.question_id
+                GROUP BY s.id ORDER BY s.created_at DESC LIMIT ? OFFSET ?
+            """, (limit, offset)).fetchall()
+        return [{**dict(row), "types": row["types"].split(",") if row["types"] else []} for row in rows]
+
+    def get_set(self, set_id):
+        """Return a saved set with its questions grouped by type, Bloom's level and difficulty, or None"""
+        with self._lock:
+            header = self._conn.execute(
+                "SELECT id, name, source_hash, created_at FROM question_sets WHERE id = ?", (set_id,)
+            ).fetchone()
+            if header is None:
+                return None
+            rows = self._conn.execute("""
+                SELECT q.id, q.type, q.bloom_level, q.difficulty, q.data
+                FROM set_questions sq JOIN questions q ON q.id = sq.question_id
+                WHERE sq.set_id = ? ORDER BY sq.position
+            """, (set_id,)).fetchall()
+
+        # Consecutive questions of the same kind form one question set, as they were saved
+        question_sets = []
+        for row in rows:
+            kind = (row["type"], row["bloom_level"], row["difficulty"])
+            if not question_sets or question_sets[-1]["kind"] != kind:
+                question_sets.append({"kind": kind, "questions": []})
+            question_sets[-1]["questions"].append(self._question(row))
+        return {
+            **dict(header),
+            "questions": [
+                {"type": q_type, "bloom_level": bloom_level, "difficulty": difficulty, "questions": group["questions"]}
+                for group in question_sets
+                for q_type, bloom_level, difficulty in [group["kind"]]
+            ]
+        }
+
+    def delete_set(self, set_id):
+        """Delete a saved set, keeping its questions in the bank; returns whether it existed"""
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM question_sets WHERE id = ?", (set_id,)).rowcount > 0
+
+    def stats(self):
+        """Return the number of stored questions and sets"""
+        with self._lock:
+            questions = self._conn.execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+            sets = self._conn.execute("SELECT COUNT(*) FROM question_sets").fetchone()[0]
+        return {"questions": questions, "sets": sets, "full_text": self.full_text}
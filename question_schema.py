@@ -0,0 +1,69 @@
+"""Per-type schemas for generated questions"""
+
+ANSWER_LETTERS = ("A", "B", "C", "D")
+
+# Question text of the placeholders returned for a spec that produced no usable questions
+ERROR_MESSAGES = ("Error parsing response", "Error generating questions")
+
+
+def _is_text(value):
+    """Check for a non-empty string"""
+    return isinstance(value, str) and bool(value.strip())
+
+
+def is_placeholder(question):
+    """Check whether an item is an error placeholder or error entry rather than a generated question"""
+    return not isinstance(question, dict) or "error" in question or question.get("question") in ERROR_MESSAGES
+
+
+def check_question(q_type, question):
+    """Validate one generated question, returning (normalized copy, list of problems)"""
+    if not isinstance(question, dict):
+        return None, ["item is not a JSON object"]
+
+    normalized = dict(question)
+    problems = []
+    if not _is_text(question.get("question")):
+        problems.append("missing question text")
+
+    answer = question.get("answer")
+    if q_type == "multiple_choice":
+        options = question.get("options")
+        if not (isinstance(options, list) and len(options) == 4 and all(_is_text(option) for option in options)):
+            problems.append("options must be exactly 4 non-empty strings")
+        # Accept "B", "b", "B." or "B. option text" and store the bare letter
+        answer_text = answer.strip() if isinstance(answer, str) else ""
+        letter = answer_text[:1].upper()
+        if letter not in ANSWER_LETTERS or (len(answer_text) > 1 and answer_text[1] not in ".): "):
+            problems.append("answer must be one of A, B, C or D")
+        else:
+            normalized["answer"] = letter
+    elif q_type == "true_or_false":
+        if isinstance(answer, bool):
+            normalized["answer"] = "True" if answer else "False"
+        elif isinstance(answer, str) and answer.strip().lower() in ("true", "false"):
+            normalized["answer"] = answer.strip().capitalize()
+        else:
+            problems.append("answer must be True or False")
+    elif q_type == "identification":
+        if not _is_text(answer):
+            problems.append("missing answer")
+    elif q_type == "open_ended":
+        key_points = question.get("key_points")
+        if not (isinstance(key_points, list) and key_points and all(_is_text(point) for point in key_points)):
+            problems.append("key_points must be a non-empty list of strings")
+
+    return normalized, problems
+
+
+def validate_questions(q_type, questions):
+    """Split questions into (valid normalized questions, problems found in the invalid ones)"""
+    valid = []
+    problems = []
+    for question in questions:
+        normalized, question_problems = check_question(q_type, question)
+        if question_problems:
+            problems.extend(question_problems)
+        else:
+            valid.append(normalized)
+    return valid, problems
@@ -0,0 +1,56 @@
+"""Leveled, structured log output
+
+Log calls pass their fields through ``extra``, for example
+``logger.info("summarized", extra={"file_type": "pdf", "seconds": 1.2})``,
+and the formatter writes them as key=value pairs or, with LOG_FORMAT=json,
+one JSON object per line.
+"""
+import json
+import logging
+import time
+
+# Attributes every LogRecord has; anything else on a record came from extra
+_RECORD_FIELDS = frozenset(logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+
+
+def record_fields(record):
+    """Return the fields a log call passed through extra"""
+    return {key: value for key, value in record.__dict__.items() if key not in _RECORD_FIELDS}
+
+
+class KeyValueFormatter(logging.Formatter):
+    """Format records as: time level logger message key=value ..."""
+
+    def format(self, record):
+        timestamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created))
+        line = f"{timestamp} {record.levelname} {record.name} {record.getMessage()}"
+        for key, value in record_fields(record).items():
+            # Nested values are written as compact JSON; values with spaces are quoted so each pair stays one token
+            text = json.dumps(value, separators=(",", ":"), default=str) if isinstance(value, (dict, list)) else str(value)
+            line += f" {key}={json.dumps(text) if not text or ' ' in text or '=' in text else text}"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **record_fields(record)
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level="INFO", fmt="text"):
+    """Send log records to stderr in the chosen format, unless the server already configured logging"""
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if fmt == "json" else KeyValueFormatter())
+    logging.basicConfig(level=level.upper(), handlers=[handler])
@@ -0,0 +1,25 @@
+"""Cold-start import time, gated through benchmarks/bench_import_time.py"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, "benchmarks", "bench_import_time.py")
+
+# Median import budgets, about twice what each entry point takes on a developer laptop
+BUDGETS_MS = {"app": 400, "asgi": 1000}
+
+
+@pytest.mark.parametrize("module", sorted(BUDGETS_MS))
+def test_import_time_within_budget(module):
+    if module == "asgi":
+        # asgi.py needs the optional ASGI extras
+        pytest.importorskip("httpx")
+        pytest.importorskip("asgiref")
+    result = subprocess.run(
+        [sys.executable, SCRIPT, "--modules", module, "--runs", "3", "--budget-ms", str(BUDGETS_MS[module])],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr + result.stdout